@@ -0,0 +1,60 @@
+import os
+import time
+import tempfile
+import numpy
+import pandas
+
+from paysage import batch
+
+
+def write_table(filename, num_rows, num_cols, chunksize=100000):
+    """
+    Write a random binary table to an HDFStore.
+
+    Args:
+        filename (str): the name of the file to write.
+        num_rows (int): the number of rows.
+        num_cols (int): the number of columns.
+        chunksize (optional; int): the number of rows written at a time.
+
+    Returns:
+        None
+
+    """
+    with pandas.HDFStore(filename, mode='w') as store:
+        for start in range(0, num_rows, chunksize):
+            n = min(chunksize, num_rows - start)
+            x = numpy.random.randint(2, size=(n, num_cols)).astype(numpy.float32)
+            df = pandas.DataFrame(x, index=range(start, start + n))
+            store.append('train', df)
+
+
+def run(row_counts=(10000, 30000, 100000, 300000), num_cols=784,
+        allowed_mem=0.05, num_workers=None):
+    """
+    Time the external shuffle as a function of the number of rows.
+    The wall time should grow roughly linearly with the number of rows.
+
+    """
+    tmpdir = tempfile.mkdtemp()
+    filename = os.path.join(tmpdir, 'data.h5')
+    shuffled_filename = os.path.join(tmpdir, 'shuffled.h5')
+
+    print("{:>10} {:>12} {:>16}".format("rows", "seconds", "us per row"))
+    for num_rows in row_counts:
+        write_table(filename, num_rows, num_cols)
+        start = time.time()
+        batch.DataShuffler(filename, shuffled_filename,
+                           allowed_mem=allowed_mem,
+                           num_workers=num_workers).shuffle()
+        elapsed = time.time() - start
+        print("{:>10} {:>12.2f} {:>16.2f}".format(num_rows, elapsed,
+                                                   1e6 * elapsed / num_rows))
+
+    os.remove(filename)
+    os.remove(shuffled_filename)
+    os.rmdir(tmpdir)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,5 +1,6 @@
 import numpy
 import numexpr as ne
+import scipy.sparse
 from . import typedef as T
 
 def float_scalar(scalar: T.Scalar) -> float:
@@ -56,17 +57,73 @@ def to_numpy_array(tensor: T.Tensor) -> T.Tensor:
     """
     return tensor
 
-def copy_tensor(tensor: T.Tensor) -> T.Tensor:
+def is_sparse(tensor: T.Tensor) -> bool:
+    """
+    Check if a tensor is sparse.
+
+    Args:
+        tensor: A tensor.
+
+    Returns:
+        bool: True if the tensor is a scipy sparse matrix.
+
+    """
+    return scipy.sparse.issparse(tensor)
+
+def sparse_tensor(tensor: T.Tensor) -> T.Tensor:
+    """
+    Convert a tensor to a sparse float tensor in CSR format.
+
+    Notes:
+        Sparse tensors can be used as visible units. The matrix products
+        with the weights (dot, batch_outer), means, sums, and elementwise
+        multiplication support sparse tensors. Other operations need a
+        dense tensor (see dense).
+
+    Args:
+        tensor: A dense or sparse tensor.
+
+    Returns:
+        scipy.sparse.csr_matrix: The tensor in CSR format.
+
+    """
+    return scipy.sparse.csr_matrix(tensor, dtype=numpy.float32)
+
+def dense(tensor: T.Tensor) -> T.Tensor:
+    """
+    Convert a sparse tensor to a dense tensor.
+    Dense tensors are returned unchanged.
+
+    Args:
+        tensor: A dense or sparse tensor.
+
+    Returns:
+        tensor: A dense tensor.
+
+    """
+    if is_sparse(tensor):
+        return tensor.toarray()
+    return tensor
+
+def copy_tensor(tensor: T.Tensor, out: T.Tensor = None) -> T.Tensor:
     """
     Copy a tensor.
 
     Args:
         tensor
+        out (optional; dense tensor): a tensor to copy into
 
     Returns:
         copy of tensor
 
     """
+    if out is not None:
+        if is_sparse(tensor):
+            return tensor.toarray(out=out)
+        numpy.copyto(out, tensor)
+        return out
+    if is_sparse(tensor):
+        return tensor.copy()
     return tensor.astype(tensor.dtype)
 
 def shape(tensor: T.Tensor) -> T.Tuple[int]:
@@ -248,7 +305,8 @@ def scatter_(mat: T.Tensor, inds: T.Tensor, val: T.Scalar) -> T.Tensor:
     """
     mat[range(len(mat)), inds] = val
 
-def index_select(mat: T.Tensor, index: T.Tensor, dim: int = 0) -> T.Tensor:
+def index_select(mat: T.Tensor, index: T.Tensor, dim: int = 0,
+                 out: T.Tensor = None) -> T.Tensor:
     """
     Select the specified indices of a tensor along dimension dim.
     For example, dim = 1 is equivalent to mat[:, index] in numpy.
@@ -257,6 +315,7 @@ def index_select(mat: T.Tensor, index: T.Tensor, dim: int = 0) -> T.Tensor:
         mat (tensor (num_samples, num_units))
         index (tensor; 1 -dimensional)
         dim (int)
+        out (optional; tensor): a tensor to store the result in
 
     Returns:
         if dim == 0:
@@ -265,11 +324,37 @@ def index_select(mat: T.Tensor, index: T.Tensor, dim: int = 0) -> T.Tensor:
             mat[:, index]
 
     """
+    if out is not None:
+        return numpy.take(mat, index, axis=dim, out=out)
     if dim == 0:
         return mat[index, :]
     elif dim == 1:
         return mat[:, index]
 
+def index_copy_(mat: T.Tensor, index: T.Tensor, values: T.Tensor,
+                dim: int = 0) -> None:
+    """
+    Copy values into the specified indices of a tensor along dimension dim.
+    For example, dim = 1 is equivalent to mat[:, index] = values in numpy.
+
+    Notes:
+        Modifies mat in place.
+
+    Args:
+        mat (tensor (num_samples, num_units))
+        index (tensor; 1 -dimensional)
+        values (tensor): with the shape of index_select(mat, index, dim)
+        dim (int)
+
+    Returns:
+        None
+
+    """
+    if dim == 0:
+        mat[index, :] = values
+    elif dim == 1:
+        mat[:, index] = values
+
 def sign(tensor: T.Tensor) -> T.Tensor:
     """
     Return the elementwise sign of a tensor.
@@ -487,6 +572,128 @@ def square_mix_inplace(w: T.Tensor, x: T.Tensor, y: T.Tensor) -> None:
     """
     ne.evaluate('w*x + (1-w)*y*y', out=x)
 
+# the number of elements of each tensor updated together by the fused steps,
+# so that the operands of a block stay in the cache between the expressions
+# while the overhead of each call to numexpr stays small
+BLOCK_SIZE = 2**18
+
+def _blocks(tensor: T.Tensor):
+    """
+    Iterate over slices along the first axis of a tensor that
+    each hold about BLOCK_SIZE elements.
+
+    Args:
+        tensor: A tensor.
+
+    Returns:
+        generator of slices
+
+    """
+    if tensor.ndim == 0:
+        yield Ellipsis
+        return
+    num_rows = len(tensor)
+    step = max(1, BLOCK_SIZE // max(1, tensor.size // max(1, num_rows)))
+    for start in range(0, num_rows, step):
+        yield slice(start, start + step)
+
+def momentum_step_(lr: T.Scalar, mean_weight: T.Scalar, param: T.Tensor,
+                   grad: T.Tensor, mean: T.Tensor) -> None:
+    """
+    Fused step of gradient descent with momentum:
+
+    mean <- mean_weight * mean + (1 - mean_weight) * grad
+    param <- param - lr * mean
+
+    Notes:
+        Modifies param and mean in place.
+        Makes one pass over the tensors, block by block.
+
+    Args:
+        lr: The stepsize.
+        mean_weight: The mixing coefficient of the mean gradient.
+        param: A tensor of parameters.
+        grad: The gradient of the parameters.
+        mean: The running average of the gradient.
+
+    Returns:
+        None
+
+    """
+    cast = param.dtype.type
+    lr, w = cast(lr), cast(mean_weight)
+    for b in _blocks(param):
+        p, g, m = param[b], grad[b], mean[b]
+        ne.evaluate('w*m + (1-w)*g', out=m)
+        ne.evaluate('p - lr*m', out=p)
+
+def rmsprop_step_(lr: T.Scalar, mean_square_weight: T.Scalar, param: T.Tensor,
+                  grad: T.Tensor, mean_square: T.Tensor) -> None:
+    """
+    Fused step of RMSProp:
+
+    mean_square <- mean_square_weight * mean_square + (1 - mean_square_weight) * grad**2
+    param <- param - lr * grad / sqrt(EPSILON + mean_square / (1 - mean_square_weight))
+
+    Notes:
+        Modifies param and mean_square in place.
+        Makes one pass over the tensors, block by block.
+
+    Args:
+        lr: The stepsize.
+        mean_square_weight: The mixing coefficient of the mean square gradient.
+        param: A tensor of parameters.
+        grad: The gradient of the parameters.
+        mean_square: The running average of the squared gradient.
+
+    Returns:
+        None
+
+    """
+    cast = param.dtype.type
+    lr, w, eps = cast(lr), cast(mean_square_weight), cast(EPSILON)
+    for b in _blocks(param):
+        p, g, v = param[b], grad[b], mean_square[b]
+        ne.evaluate('w*v + (1-w)*g*g', out=v)
+        ne.evaluate('p - lr*g/sqrt(eps + v/(1-w))', out=p)
+
+def adam_step_(lr: T.Scalar, mean_weight: T.Scalar, mean_square_weight: T.Scalar,
+               param: T.Tensor, grad: T.Tensor, mean: T.Tensor,
+               mean_square: T.Tensor) -> None:
+    """
+    Fused step of ADAM:
+
+    mean <- mean_weight * mean + (1 - mean_weight) * grad
+    mean_square <- mean_square_weight * mean_square + (1 - mean_square_weight) * grad**2
+    param <- param - lr * (mean / (1 - mean_weight))
+        / sqrt(EPSILON + mean_square / (1 - mean_square_weight))
+
+    Notes:
+        Modifies param, mean, and mean_square in place.
+        Makes one pass over the tensors, block by block.
+
+    Args:
+        lr: The stepsize.
+        mean_weight: The mixing coefficient of the mean gradient.
+        mean_square_weight: The mixing coefficient of the mean square gradient.
+        param: A tensor of parameters.
+        grad: The gradient of the parameters.
+        mean: The running average of the gradient.
+        mean_square: The running average of the squared gradient.
+
+    Returns:
+        None
+
+    """
+    cast = param.dtype.type
+    lr, eps = cast(lr), cast(EPSILON)
+    w1, w2 = cast(mean_weight), cast(mean_square_weight)
+    for b in _blocks(param):
+        p, g, m, v = param[b], grad[b], mean[b], mean_square[b]
+        ne.evaluate('w1*m + (1-w1)*g', out=m)
+        ne.evaluate('w2*v + (1-w2)*g*g', out=v)
+        ne.evaluate('p - lr*(m/(1-w1))/sqrt(eps + v/(1-w2))', out=p)
+
 def sqrt_div(x: T.Tensor, y: T.Tensor) -> T.Tensor:
     """
     Elementwise division of x by sqrt(y).
@@ -595,6 +802,8 @@ def mean(x: T.Tensor, axis: int = None, keepdims: bool = False) -> T.FloatingPoi
             tensor: The mean of the tensor along the specified axis.
 
     """
+    if is_sparse(x):
+        return _sparse_reduce(x.mean(axis=axis), axis, keepdims)
     return numpy.mean(x, axis=axis, keepdims=keepdims)
 
 def center(x: T.Tensor, axis: int=0) -> T.Tensor:
@@ -684,8 +893,21 @@ def tsum(x: T.Tensor, axis: int=None, keepdims: bool=False) -> T.FloatingPoint:
             tensor: The sum of the tensor along the specified axis.
 
     """
+    if is_sparse(x):
+        return _sparse_reduce(x.sum(axis=axis), axis, keepdims)
     return numpy.sum(x, axis=axis, keepdims=keepdims)
 
+def _sparse_reduce(result, axis: int, keepdims: bool) -> T.FloatingPoint:
+    """
+    Convert the result of a reduction of a sparse matrix
+    to the output of the corresponding numpy reduction.
+
+    """
+    if axis is None:
+        return result
+    result = numpy.asarray(result)
+    return result if keepdims else result.ravel()
+
 def tprod(x: T.Tensor, axis: int=None, keepdims: bool=False) -> T.FloatingPoint:
     """
     Return the product of the elements of a tensor along the specified axis.
@@ -797,19 +1019,21 @@ def not_equal(x: T.Tensor, y: T.Tensor) -> T.Boolean:
     """
     return numpy.not_equal(x, y)
 
-def greater(x: T.Tensor, y: T.Tensor) -> T.Boolean:
+def greater(x: T.Tensor, y: T.Tensor, out: T.Tensor = None) -> T.Boolean:
     """
     Elementwise test if x > y.
 
     Args:
         x: A tensor.
         y: A tensor.
+        out (optional; tensor): a tensor to store the result in,
+            as 0/1 if it is a float tensor
 
     Returns:
         tensor (of bools): Elementwise test of x > y.
 
     """
-    return numpy.greater(x, y)
+    return numpy.greater(x, y, out=out)
 
 def greater_equal(x: T.Tensor, y: T.Tensor) -> T.Boolean:
     """
@@ -825,19 +1049,21 @@ def greater_equal(x: T.Tensor, y: T.Tensor) -> T.Boolean:
     """
     return numpy.greater_equal(x, y)
 
-def lesser(x: T.Tensor, y: T.Tensor) -> T.Boolean:
+def lesser(x: T.Tensor, y: T.Tensor, out: T.Tensor = None) -> T.Boolean:
     """
     Elementwise test if x < y.
 
     Args:
         x: A tensor.
         y: A tensor.
+        out (optional; tensor): a tensor to store the result in,
+            as 0/1 if it is a float tensor
 
     Returns:
         tensor (of bools): Elementwise test of x < y.
 
     """
-    return numpy.less(x, y)
+    return numpy.less(x, y, out=out)
 
 def lesser_equal(x: T.Tensor, y: T.Tensor) -> T.Boolean:
     """
@@ -939,7 +1165,7 @@ def argmin(x: T.Tensor, axis: int) -> T.Tensor:
     """
     return numpy.argmin(x, axis=axis)
 
-def dot(a: T.Tensor, b: T.Tensor) -> T.FloatingPoint:
+def dot(a: T.Tensor, b: T.Tensor, out: T.Tensor = None) -> T.FloatingPoint:
     """
     Compute the matrix/dot product of tensors a and b.
 
@@ -955,6 +1181,7 @@ def dot(a: T.Tensor, b: T.Tensor) -> T.FloatingPoint:
     Args:
         a: A tensor.
         b: A tensor:
+        out (optional; tensor): a tensor to store the matrix product in
 
     Returns:
         if a and b are 1-dimensions:
@@ -963,7 +1190,18 @@ def dot(a: T.Tensor, b: T.Tensor) -> T.FloatingPoint:
             tensor: the matrix product of tensors a and b
 
     """
-    return numpy.dot(a, b)
+    if is_sparse(a):
+        result = a.dot(b)
+    elif is_sparse(b):
+        result = b.T.dot(a.T).T
+    elif out is not None:
+        return numpy.matmul(a, b, out=out)
+    else:
+        return numpy.dot(a, b)
+    if out is not None:
+        out[...] = result
+        return out
+    return result
 
 def outer(x: T.Tensor, y: T.Tensor) -> T.Tensor:
     """
@@ -1089,6 +1327,10 @@ def multiply(a: T.Tensor, b: T.Tensor) -> T.Tensor:
         tensor: a * b
 
     """
+    if is_sparse(a):
+        return a.multiply(b).tocsr()
+    if is_sparse(b):
+        return b.multiply(a).tocsr()
     return a * b
 
 def multiply_(a: T.Tensor, b: T.Tensor) -> None:
@@ -1255,7 +1497,7 @@ def batch_dot(vis: T.Tensor, W: T.Tensor, hid: T.Tensor, axis: int=1) -> T.Tenso
         tensor: A vector.
 
     """
-    return (numpy.dot(vis, W) * hid).sum(axis).astype(numpy.float32)
+    return (dot(vis, W) * hid).sum(axis).astype(numpy.float32)
 
 def batch_outer(vis: T.Tensor, hid: T.Tensor) -> T.Tensor:
     """
@@ -1274,6 +1516,8 @@ def batch_outer(vis: T.Tensor, hid: T.Tensor) -> T.Tensor:
         tensor: A matrix.
 
     """
+    if is_sparse(vis):
+        return vis.T.dot(hid)
     return numpy.dot(vis.T, hid)
 
 def repeat(tensor: T.Tensor, n: int) -> T.Tensor:
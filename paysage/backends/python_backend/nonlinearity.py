@@ -92,18 +92,20 @@ def tanh(x: T.Tensor) -> T.Tensor:
     """
     return ne.evaluate('tanh(x)')
 
-def expit(x: T.Tensor) -> T.Tensor:
+def expit(x: T.Tensor, out: T.Tensor = None) -> T.Tensor:
     """
     Elementwise expit (a.k.a. logistic) function of a tensor.
 
     Args:
         x: A tensor.
+        out (optional; tensor): a tensor to store the result in,
+            which may be x itself
 
     Returns:
         tensor: Elementwise expit (a.k.a. logistic).
 
     """
-    return ne.evaluate('(1 + tanh(x/2))/2')
+    return ne.evaluate('(1 + tanh(x/2))/2', out=out)
 
 def softmax(x: T.Tensor) -> T.Tensor:
     """
@@ -122,6 +124,26 @@ def softmax(x: T.Tensor) -> T.Tensor:
     y = ne.evaluate('exp(xreg)')
     return y / numpy.sum(y, axis=1, keepdims=True)
 
+def logsumexp(x: T.Tensor, axis: int = None, keepdims: bool = False) -> T.FloatingPoint:
+    """
+    Compute log(sum(exp(x))) along an axis without overflow.
+
+    Args:
+        x: A tensor.
+        axis (optional): The axis for the sum.
+        keepdims (optional): If this is set to true, the dimension of the tensor
+                             is unchanged. Otherwise, the reduced axis is removed
+                             and the dimension of the array is 1 less.
+
+    Returns:
+        if axis is None:
+            float: log(sum(exp(x)))
+        else:
+            tensor: log(sum(exp(x))) along the specified axis.
+
+    """
+    return special.logsumexp(x, axis=axis, keepdims=keepdims)
+
 def reciprocal(x: T.Tensor) -> T.Tensor:
     """
     Elementwise inverse of a tensor.
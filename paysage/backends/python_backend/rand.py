@@ -5,6 +5,9 @@ from . import typedef as T
 
 DEFAULT_SEED = 137
 
+# fills preallocated tensors, because numpy.random.rand cannot
+_generator = numpy.random.default_rng(DEFAULT_SEED)
+
 def set_seed(n: int = DEFAULT_SEED) -> None:
     """
     Set the seed of the random number generator.
@@ -19,20 +22,25 @@ def set_seed(n: int = DEFAULT_SEED) -> None:
         None
 
     """
+    global _generator
     numpy.random.seed(int(n))
+    _generator = numpy.random.default_rng(int(n))
 
-def rand(shape: T.Tuple[int]) -> T.Tensor:
+def rand(shape: T.Tuple[int], out: T.Tensor = None) -> T.Tensor:
     """
     Generate a tensor of the specified shape filled with uniform random numbers
     between 0 and 1.
 
     Args:
         shape: Desired shape of the random tensor.
+        out (optional; tensor): a tensor of the same shape to fill
 
     Returns:
         tensor: Random numbers between 0 and 1.
 
     """
+    if out is not None:
+        return _generator.random(dtype=out.dtype, out=out)
     return matrix.float_tensor(numpy.random.rand(*shape))
 
 def rand_like(tensor: T.Tensor) -> T.Tensor:
@@ -48,18 +56,21 @@ def rand_like(tensor: T.Tensor) -> T.Tensor:
     """
     return matrix.float_tensor(numpy.random.rand(*matrix.shape(tensor)))
 
-def randn(shape: T.Tuple[int]) -> T.Tensor:
+def randn(shape: T.Tuple[int], out: T.Tensor = None) -> T.Tensor:
     """
     Generate a tensor of the specified shape filled with random numbers
     drawn from a standard normal distribution (mean = 0, variance = 1).
 
     Args:
         shape: Desired shape of the random tensor.
+        out (optional; tensor): a tensor of the same shape to fill
 
     Returns:
         tensor: Random numbers between from a standard normal distribution.
 
     """
+    if out is not None:
+        return _generator.standard_normal(dtype=out.dtype, out=out)
     return matrix.float_tensor(numpy.random.randn(*shape))
 
 def randn_like(tensor: T.Tensor) -> T.Tensor:
@@ -74,17 +74,69 @@ def to_numpy_array(tensor: T.Tensor) -> T.NumpyTensor:
     except Exception:
         return numpy.array(tensor)
 
-def copy_tensor(tensor: T.Tensor) -> T.Tensor:
+def is_sparse(tensor: T.Tensor) -> bool:
+    """
+    Check if a tensor is sparse.
+
+    Notes:
+        The pytorch backend does not use sparse tensors.
+
+    Args:
+        tensor: A tensor.
+
+    Returns:
+        bool: False
+
+    """
+    return False
+
+def sparse_tensor(tensor: T.Tensor) -> T.FloatTensor:
+    """
+    Convert a tensor to a sparse float tensor.
+
+    Notes:
+        The pytorch backend does not use sparse tensors,
+        so this returns a dense float tensor.
+
+    Args:
+        tensor: A dense tensor, or a scipy sparse matrix.
+
+    Returns:
+        tensor: A dense float tensor.
+
+    """
+    if hasattr(tensor, 'toarray'):
+        tensor = tensor.toarray()
+    return float_tensor(tensor)
+
+def dense(tensor: T.Tensor) -> T.Tensor:
+    """
+    Convert a sparse tensor to a dense tensor.
+    Dense tensors are returned unchanged.
+
+    Args:
+        tensor: A tensor.
+
+    Returns:
+        tensor: A dense tensor.
+
+    """
+    return tensor
+
+def copy_tensor(tensor: T.Tensor, out: T.Tensor = None) -> T.Tensor:
     """
     Copy a tensor.
 
     Args:
         tensor
+        out (optional; tensor): a tensor to copy into
 
     Returns:
         copy of tensor
 
     """
+    if out is not None:
+        return out.copy_(tensor)
     return tensor.clone()
 
 def shape(tensor: T.TorchTensor) -> T.Tuple[int]:
@@ -267,7 +319,8 @@ def scatter_(mat: T.Tensor, inds: T.LongTensor, val: T.Scalar) -> T.Tensor:
     """
     return mat.scatter_(1, inds.unsqueeze(1), val)
 
-def index_select(mat: T.Tensor, index: T.LongTensor, dim: int = 0) -> T.Tensor:
+def index_select(mat: T.Tensor, index: T.LongTensor, dim: int = 0,
+                 out: T.Tensor = None) -> T.Tensor:
     """
     Select the specified indices of a tensor along dimension dim.
     For example, dim = 1 is equivalent to mat[:, index] in numpy.
@@ -276,6 +329,7 @@ def index_select(mat: T.Tensor, index: T.LongTensor, dim: int = 0) -> T.Tensor:
         mat (tensor (num_samples, num_units))
         index (tensor; 1 -dimensional)
         dim (int)
+        out (optional; tensor): a tensor to store the result in
 
     Returns:
         if dim == 0:
@@ -284,8 +338,31 @@ def index_select(mat: T.Tensor, index: T.LongTensor, dim: int = 0) -> T.Tensor:
             mat[:, index]
 
     """
+    if out is not None:
+        return torch.index_select(mat, dim, index, out=out)
     return torch.index_select(mat, dim, index)
 
+def index_copy_(mat: T.Tensor, index: T.LongTensor, values: T.Tensor,
+                dim: int = 0) -> None:
+    """
+    Copy values into the specified indices of a tensor along dimension dim.
+    For example, dim = 1 is equivalent to mat[:, index] = values in numpy.
+
+    Notes:
+        Modifies mat in place.
+
+    Args:
+        mat (tensor (num_samples, num_units))
+        index (tensor; 1 -dimensional)
+        values (tensor): with the shape of index_select(mat, index, dim)
+        dim (int)
+
+    Returns:
+        None
+
+    """
+    mat.index_copy_(dim, index, values)
+
 def sign(tensor: T.TorchTensor) -> T.FloatTensor:
     """
     Return the elementwise sign of a tensor.
@@ -533,6 +610,94 @@ def square_mix_inplace(w: T.FloatingPoint,
     x.mul_(w)
     x.add_(y.mul(y).mul(1-w))
 
+def momentum_step_(lr: T.FloatingPoint, mean_weight: T.FloatingPoint,
+                   param: T.FloatTensor, grad: T.FloatTensor,
+                   mean: T.FloatTensor) -> None:
+    """
+    Fused step of gradient descent with momentum:
+
+    mean <- mean_weight * mean + (1 - mean_weight) * grad
+    param <- param - lr * mean
+
+    Notes:
+        Modifies param and mean in place.
+
+    Args:
+        lr: The stepsize.
+        mean_weight: The mixing coefficient of the mean gradient.
+        param: A tensor of parameters.
+        grad: The gradient of the parameters.
+        mean: The running average of the gradient.
+
+    Returns:
+        None
+
+    """
+    mean.lerp_(grad, 1 - float(mean_weight))
+    param.add_(mean, alpha=-float(lr))
+
+def rmsprop_step_(lr: T.FloatingPoint, mean_square_weight: T.FloatingPoint,
+                  param: T.FloatTensor, grad: T.FloatTensor,
+                  mean_square: T.FloatTensor) -> None:
+    """
+    Fused step of RMSProp:
+
+    mean_square <- mean_square_weight * mean_square + (1 - mean_square_weight) * grad**2
+    param <- param - lr * grad / sqrt(EPSILON + mean_square / (1 - mean_square_weight))
+
+    Notes:
+        Modifies param and mean_square in place.
+
+    Args:
+        lr: The stepsize.
+        mean_square_weight: The mixing coefficient of the mean square gradient.
+        param: A tensor of parameters.
+        grad: The gradient of the parameters.
+        mean_square: The running average of the squared gradient.
+
+    Returns:
+        None
+
+    """
+    w = float(mean_square_weight)
+    mean_square.mul_(w).addcmul_(grad, grad, value=1 - w)
+    denominator = mean_square.div(1 - w).add_(float(EPSILON)).sqrt_()
+    param.addcdiv_(grad, denominator, value=-float(lr))
+
+def adam_step_(lr: T.FloatingPoint, mean_weight: T.FloatingPoint,
+               mean_square_weight: T.FloatingPoint, param: T.FloatTensor,
+               grad: T.FloatTensor, mean: T.FloatTensor,
+               mean_square: T.FloatTensor) -> None:
+    """
+    Fused step of ADAM:
+
+    mean <- mean_weight * mean + (1 - mean_weight) * grad
+    mean_square <- mean_square_weight * mean_square + (1 - mean_square_weight) * grad**2
+    param <- param - lr * (mean / (1 - mean_weight))
+        / sqrt(EPSILON + mean_square / (1 - mean_square_weight))
+
+    Notes:
+        Modifies param, mean, and mean_square in place.
+
+    Args:
+        lr: The stepsize.
+        mean_weight: The mixing coefficient of the mean gradient.
+        mean_square_weight: The mixing coefficient of the mean square gradient.
+        param: A tensor of parameters.
+        grad: The gradient of the parameters.
+        mean: The running average of the gradient.
+        mean_square: The running average of the squared gradient.
+
+    Returns:
+        None
+
+    """
+    w1, w2 = float(mean_weight), float(mean_square_weight)
+    mean.lerp_(grad, 1 - w1)
+    mean_square.mul_(w2).addcmul_(grad, grad, value=1 - w2)
+    denominator = mean_square.div(1 - w2).add_(float(EPSILON)).sqrt_()
+    param.addcdiv_(mean, denominator, value=-float(lr) / (1 - w1))
+
 def sqrt_div(x: T.FloatTensor, y: T.FloatTensor) -> T.FloatTensor:
     """
     Elementwise division of x by sqrt(y).
@@ -886,18 +1051,23 @@ def not_equal(x: T.FloatTensor, y: T.FloatTensor) -> T.ByteTensor:
     """
     return torch.ne(x, y)
 
-def greater(x: T.FloatTensor, y: T.FloatTensor) -> T.ByteTensor:
+def greater(x: T.FloatTensor, y: T.FloatTensor,
+            out: T.FloatTensor = None) -> T.ByteTensor:
     """
     Elementwise test if x > y.
 
     Args:
         x: A tensor.
         y: A tensor.
+        out (optional; tensor): a tensor to store the result in,
+            as 0/1 if it is a float tensor
 
     Returns:
         tensor (of bools): Elementwise test of x > y.
 
     """
+    if out is not None:
+        return out.copy_(torch.gt(x, y))
     return torch.gt(x, y)
 
 def greater_equal(x: T.FloatTensor, y: T.FloatTensor) -> T.ByteTensor:
@@ -914,18 +1084,23 @@ def greater_equal(x: T.FloatTensor, y: T.FloatTensor) -> T.ByteTensor:
     """
     return torch.ge(x, y)
 
-def lesser(x: T.FloatTensor, y: T.FloatTensor) -> T.ByteTensor:
+def lesser(x: T.FloatTensor, y: T.FloatTensor,
+           out: T.FloatTensor = None) -> T.ByteTensor:
     """
     Elementwise test if x < y.
 
     Args:
         x: A tensor.
         y: A tensor.
+        out (optional; tensor): a tensor to store the result in,
+            as 0/1 if it is a float tensor
 
     Returns:
         tensor (of bools): Elementwise test of x < y.
 
     """
+    if out is not None:
+        return out.copy_(torch.lt(x, y))
     return torch.lt(x, y)
 
 def lesser_equal(x: T.FloatTensor, y: T.FloatTensor) -> T.ByteTensor:
@@ -1036,7 +1211,8 @@ def argmin(x: T.FloatTensor, axis: int = None) -> T.LongTensor:
     # needs flatten because numpy argmin always returns a 1-D array
     return flatten(x.min(dim=axis)[1])
 
-def dot(a: T.FloatTensor, b: T.FloatTensor) -> T.FloatingPoint:
+def dot(a: T.FloatTensor, b: T.FloatTensor,
+        out: T.FloatTensor = None) -> T.FloatingPoint:
     """
     Compute the matrix/dot product of tensors a and b.
 
@@ -1052,6 +1228,7 @@ def dot(a: T.FloatTensor, b: T.FloatTensor) -> T.FloatingPoint:
     Args:
         a: A tensor.
         b: A tensor:
+        out (optional; tensor): a tensor to store the matrix product in
 
     Returns:
         if a and b are 1-dimensions:
@@ -1060,6 +1237,8 @@ def dot(a: T.FloatTensor, b: T.FloatTensor) -> T.FloatingPoint:
             tensor: the matrix product of tensors a and b
 
     """
+    if out is not None:
+        return torch.matmul(a, b, out=out)
     return a @ b
 
 def outer(x: T.FloatTensor, y: T.FloatTensor) -> T.FloatTensor:
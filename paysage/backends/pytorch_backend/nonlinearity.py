@@ -1,3 +1,4 @@
+import math
 import torch
 from . import matrix
 from . import typedef as T
@@ -91,17 +92,22 @@ def tanh(x: T.FloatTensor) -> T.FloatTensor:
     """
     return torch.tanh(x)
 
-def expit(x: T.FloatTensor) -> T.FloatTensor:
+def expit(x: T.FloatTensor, out: T.FloatTensor = None) -> T.FloatTensor:
     """
     Elementwise expit (a.k.a. logistic) function of a tensor.
 
     Args:
         x: A tensor.
+        out (optional; tensor): a tensor to store the result in,
+            which may be x itself
 
     Returns:
         tensor: Elementwise expit (a.k.a. logistic).
 
     """
+    if out is not None:
+        torch.mul(x, 0.5, out=out)
+        return out.tanh_().add_(1.0).mul_(0.5)
     return 0.5 * (1.0 + tanh(0.5 * x))
 
 def softmax(x: T.Tensor) -> T.Tensor:
@@ -121,6 +127,34 @@ def softmax(x: T.Tensor) -> T.Tensor:
     y = torch.exp(xreg)
     return matrix.divide(matrix.tsum(y, axis=1, keepdims=True), y)
 
+def logsumexp(x: T.FloatTensor, axis: int = None,
+              keepdims: bool = False) -> T.FloatingPoint:
+    """
+    Compute log(sum(exp(x))) along an axis without overflow.
+
+    Args:
+        x: A tensor.
+        axis (optional): The axis for the sum.
+        keepdims (optional): If this is set to true, the dimension of the tensor
+                             is unchanged. Otherwise, the reduced axis is removed
+                             and the dimension of the array is 1 less.
+
+    Returns:
+        if axis is None:
+            float: log(sum(exp(x)))
+        else:
+            tensor: log(sum(exp(x))) along the specified axis.
+
+    """
+    if axis is None:
+        xmax = matrix.tmax(x)
+        return xmax + math.log(matrix.tsum(torch.exp(x - xmax)))
+    xmax = matrix.tmax(x, axis=axis, keepdims=True)
+    y = xmax + torch.log(matrix.tsum(torch.exp(x - xmax), axis=axis, keepdims=True))
+    if keepdims:
+        return y
+    return y.squeeze(axis)
+
 def reciprocal(x: T.FloatTensor) -> T.FloatTensor:
     """
     Elementwise inverse of a tensor.
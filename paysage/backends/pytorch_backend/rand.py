@@ -27,19 +27,20 @@ def set_seed(n: int = DEFAULT_SEED):
     # set the seed for the gpu generator if needed
     DTYPE.manual_seed(int(n))
 
-def rand(shape: T.Tuple[int]) -> T.FloatTensor:
+def rand(shape: T.Tuple[int], out: T.FloatTensor = None) -> T.FloatTensor:
     """
     Generate a tensor of the specified shape filled with uniform random numbers
     between 0 and 1.
 
     Args:
         shape: Desired shape of the random tensor.
+        out (optional; tensor): a tensor of the same shape to fill
 
     Returns:
         tensor: Random numbers between 0 and 1.
 
     """
-    x = matrix.zeros(shape)
+    x = matrix.zeros(shape) if out is None else out
     x.uniform_()
     return x
 
@@ -59,19 +60,20 @@ def rand_like(tensor: T.TorchTensor) -> T.FloatTensor:
     x.uniform_()
     return x
 
-def randn(shape: T.Tuple[int]) -> T.FloatTensor:
+def randn(shape: T.Tuple[int], out: T.FloatTensor = None) -> T.FloatTensor:
     """
     Generate a tensor of the specified shape filled with random numbers
     drawn from a standard normal distribution (mean = 0, variance = 1).
 
     Args:
         shape: Desired shape of the random tensor.
+        out (optional; tensor): a tensor of the same shape to fill
 
     Returns:
         tensor: Random numbers between from a standard normal distribution.
 
     """
-    x = matrix.zeros(shape)
+    x = matrix.zeros(shape) if out is None else out
     x.normal_()
     return x
 
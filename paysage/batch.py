@@ -1,8 +1,20 @@
 import os
+import glob
+import json
+import time
+import warnings
+import queue
+import threading
+import multiprocessing
+import collections
+import concurrent.futures
 import numpy
 import pandas
+import tables
+from collections import namedtuple
 from . import backends as be
 from . import preprocess as pre
+from . import math_utils
 
 
 def inclusive_slice(tensor, start, stop, step):
@@ -14,30 +26,121 @@ def inclusive_slice(tensor, start, stop, step):
         yield tensor[result[0]:result[1]]
 
 
+def permuted_slice(tensor, permutation, step, buffer):
+    """
+    Gather the rows of a tensor in the order given by a permutation.
+    Each minibatch is written into (the first rows of) the same buffer.
+
+    Args:
+        tensor (num_samples, num_units): the tensor to read from
+        permutation (tensor; 1-dimensional): the row indices in order
+        step (int): the number of rows per minibatch
+        buffer (step, num_units): the preallocated output tensor
+
+    Returns:
+        generator of views of buffer
+
+    """
+    num_indices = len(permutation)
+    current = 0
+    while current < num_indices:
+        next_iter = min(num_indices, current + step)
+        out = buffer[:next_iter - current]
+        be.index_select(tensor, permutation[current:next_iter], out=out)
+        current = next_iter
+        yield out
+
+
+def compact_rows(tensor, storage=None):
+    """
+    Convert a tensor to a compact numpy array for storage.
+
+    Args:
+        tensor (num_samples, num_units): the data
+        storage (str; optional): one of
+            None: keep the tensor as it is
+            'uint8': cast to unsigned 8-bit integers (e.g., pixel colors)
+            'bits': pack binary (0/1) values into 8 columns per byte
+
+    Returns:
+        tensor or numpy array
+
+    """
+    if storage is None:
+        return tensor
+    x = numpy.asarray(be.to_numpy_array(tensor))
+    if storage == 'uint8':
+        return x.astype(numpy.uint8)
+    if storage == 'bits':
+        return numpy.packbits(x != 0, axis=1)
+    raise ValueError("unknown storage {}".format(storage))
+
+
+def expand_rows(rows, storage, ncols):
+    """
+    Expand rows stored with compact_rows to a float tensor.
+
+    Args:
+        rows (num_samples, num_stored_columns): the stored rows
+        storage (str): the storage used by compact_rows
+        ncols (int): the number of units
+
+    Returns:
+        float tensor (num_samples, ncols)
+
+    """
+    if storage == 'bits':
+        rows = numpy.unpackbits(rows, axis=1, count=ncols)
+    return be.float_tensor(rows)
+
+
 class InMemoryBatch(object):
     """
     Serves up minibatches from a tensor held in memory.
     The validation set is taken as the last (1 - train_fraction)
     samples in the store.
     The data should probably be randomly shuffled if being used to
-    train a non-recurrent model.
+    train a non-recurrent model, or shuffle=True should be used.
+
+    Notes:
+        If shuffle=True, a new random permutation of the training indices
+        is drawn every time the training generator is reset. The training
+        minibatches are gathered into a single preallocated buffer, so
+        a minibatch is overwritten by the next call to get('train')
+        (unless the transform returns a new tensor). The reuses_buffers
+        attribute tells wrappers (e.g., PrefetchBatch) whether to copy
+        the minibatches.
+
+        If storage is 'uint8' or 'bits', the data are held in memory in
+        that compact form (see compact_rows), and each minibatch is
+        expanded to a new float tensor when it is served. This uses 4x
+        (uint8) or 32x (bits) less memory than a float tensor.
+
+        The tensor can also be sparse (see be.sparse_tensor), in which case
+        the minibatches are sparse tensors.
 
     """
     def __init__(self, tensor, batch_size, train_fraction=0.9,
-                 transform=pre.do_nothing):
+                 transform=pre.do_nothing, shuffle=False, storage=None):
 
-        self.tensor = tensor
         self.batch_size = batch_size
         self.transform = transform
-        self.nrows, self.ncols = be.shape(self.tensor)
+        self.shuffle = shuffle
+        self.storage = storage
+        self.nrows, self.ncols = be.shape(tensor)
+        self.tensor = compact_rows(tensor, self.storage)
         self.split = int(numpy.ceil(train_fraction * self.nrows))
 
+        # compact and sparse tensors are gathered by fancy indexing,
+        # dense tensors are gathered into a buffer
+        self.gather = self.storage is not None or be.is_sparse(self.tensor)
+        self.reuses_buffers = self.shuffle and not self.gather
+        if self.reuses_buffers:
+            self.buffer = be.zeros((self.batch_size, self.ncols))
+
         # create iterators over the data for the train/validate sets
         self.iterators = {}
-        self.iterators['train'] = inclusive_slice(self.tensor, 0, self.split,
-                                                  self.batch_size)
-        self.iterators['validate'] = inclusive_slice(self.tensor, self.split,
-                                                  self.nrows, self.batch_size)
+        self.reset_generator('all')
 
     def num_validation_samples(self) -> int:
         return self.nrows - self.split
@@ -48,16 +151,25 @@ class InMemoryBatch(object):
     def num_training_batches(self):
         return int(numpy.floor(self.split / self.batch_size))
 
+    def _train_iterator(self):
+        if self.shuffle and self.gather:
+            permutation = numpy.random.permutation(self.split)
+            return (self.tensor[idx] for idx in inclusive_slice(
+                    permutation, 0, self.split, self.batch_size))
+        if self.shuffle:
+            permutation = be.int_tensor(numpy.random.permutation(self.split))
+            return permuted_slice(self.tensor, permutation, self.batch_size,
+                                  self.buffer)
+        return inclusive_slice(self.tensor, 0, self.split, self.batch_size)
+
     def reset_generator(self, mode: str) -> None:
         if mode == 'train':
-            self.iterators['train'] = inclusive_slice(self.tensor, 0, self.split,
-                                                  self.batch_size)
+            self.iterators['train'] = self._train_iterator()
         elif mode == 'validate':
             self.iterators['validate'] = inclusive_slice(self.tensor, self.split,
                                                   self.nrows, self.batch_size)
         else:
-            self.iterators['train'] = inclusive_slice(self.tensor, 0, self.split,
-                                                  self.batch_size)
+            self.iterators['train'] = self._train_iterator()
             self.iterators['validate'] = inclusive_slice(self.tensor, self.split,
                                                   self.nrows, self.batch_size)
 
@@ -67,70 +179,564 @@ class InMemoryBatch(object):
         except StopIteration:
             self.reset_generator(mode)
             raise StopIteration
+        if self.storage is not None:
+            vals = expand_rows(vals, self.storage, self.ncols)
         trans_vals = self.transform(vals)
         return trans_vals
 
     def get_by_index(self, index):
+        if self.storage is not None:
+            idx = numpy.asarray(list(index), dtype=numpy.int64)
+            return self.transform(expand_rows(self.tensor[idx], self.storage,
+                                              self.ncols))
         return self.transform(self.tensor[index])
 
 
+def block_shuffled_slice(read, start, stop, block_size, blocks_per_buffer, step):
+    """
+    Read contiguous blocks of rows in a random order, and serve
+    minibatches from a buffer of several blocks with shuffled rows.
+
+    Notes:
+        Gives a nearly uniform shuffle with mostly sequential reads.
+        At most blocks_per_buffer * block_size + step rows are held in memory.
+
+    Args:
+        read (callable): read(start, stop) returns an array with the rows
+            in [start, stop)
+        start (int): the first row
+        stop (int): the row after the last row
+        block_size (int): the number of rows per block
+        blocks_per_buffer (int): the number of blocks to shuffle together
+        step (int): the number of rows per minibatch
+
+    Returns:
+        generator of arrays
+
+    """
+    block_starts = numpy.arange(start, stop, block_size)
+    numpy.random.shuffle(block_starts)
+    leftover = None
+    for i in range(0, len(block_starts), blocks_per_buffer):
+        blocks = [read(b, min(b + block_size, stop))
+                  for b in block_starts[i : i + blocks_per_buffer]]
+        # carry the rows that did not fill a minibatch over to the next buffer
+        if leftover is not None:
+            blocks.append(leftover)
+        buffer = numpy.concatenate(blocks)
+        numpy.random.shuffle(buffer)
+        num_full = len(buffer) - len(buffer) % step
+        for j in range(0, num_full, step):
+            yield buffer[j : j + step]
+        leftover = buffer[num_full:]
+    if leftover is not None and len(leftover) > 0:
+        yield leftover
+
+
+def _hdf_path(key):
+    """
+    Convert a pandas style key (e.g., 'train/images') to a PyTables path.
+
+    """
+    return key if key.startswith('/') else '/' + key
+
+
+class HDFArrayReader(object):
+    """
+    Reads rows of a 2D dataset in an HDF5 file directly with PyTables,
+    without building pandas DataFrames.
+
+    Supports the plain array layout written by append_hdf_array
+    (including bit-packed arrays, which are unpacked as they are read),
+    as well as pandas tables and fixed frames with a single block of values
+    (i.e., where all of the columns have the same dtype).
+
+    """
+    def __init__(self, filename, key):
+        """
+        Open the dataset stored under key.
+
+        Args:
+            filename (str): the name of the HDF5 file.
+            key (str): the key of the dataset.
+
+        Raises:
+            ValueError: if the layout of the dataset is not supported.
+
+        Returns:
+            HDFArrayReader
+
+        """
+        self.file = tables.open_file(filename, mode='r')
+        try:
+            self.node, self.field = self._find_values(self.file.get_node(_hdf_path(key)))
+        except Exception:
+            self.file.close()
+            raise
+
+        self.storage = None
+        if self.field is None:
+            self.nrows, self.ncols = self.node.shape
+            self.dtype = numpy.dtype(self.node.dtype)
+            if 'packed_ncols' in self.node.attrs:
+                self.storage = 'bits'
+                self.ncols = int(self.node.attrs.packed_ncols)
+        else:
+            self.nrows = self.node.nrows
+            self.ncols = self.node.coldtypes[self.field].shape[0]
+            self.dtype = self.node.coldtypes[self.field].base
+
+    @staticmethod
+    def _find_values(node):
+        """
+        Find the leaf that holds the values, and the field of the values
+        if the leaf is a table.
+
+        """
+        if isinstance(node, tables.Array):
+            if len(node.shape) != 2:
+                raise ValueError("only 2D arrays are supported")
+            return node, None
+        pandas_type = getattr(node._v_attrs, 'pandas_type', None)
+        if pandas_type == 'frame_table':
+            fields = [c for c in node.table.colnames
+                      if c.startswith('values_block')]
+            if len(fields) != 1:
+                raise ValueError("only tables with a single block of values "
+                                 "are supported")
+            return node.table, fields[0]
+        if pandas_type == 'frame':
+            if node._v_attrs.nblocks != 1:
+                raise ValueError("only frames with a single block of values "
+                                 "are supported")
+            return node.block0_values, None
+        raise ValueError("unsupported layout for {}".format(node._v_pathname))
+
+    def close(self) -> None:
+        self.file.close()
+
+    def _buffer(self, num_rows, out):
+        if out is None:
+            return numpy.empty((num_rows, self.ncols), dtype=numpy.float32)
+        return out[:num_rows]
+
+    def read(self, start, stop, out=None):
+        """
+        Read the rows [start, stop).
+
+        Args:
+            start (int): the first row.
+            stop (int): one past the last row.
+            out (optional; numpy array): a float32 buffer with at least
+                stop - start rows to read into.
+
+        Returns:
+            numpy array (float32)
+
+        """
+        stop = min(stop, self.nrows)
+        buffer = self._buffer(stop - start, out)
+        if self.storage == 'bits':
+            buffer[:] = numpy.unpackbits(self.node.read(start, stop), axis=1,
+                                         count=self.ncols)
+        elif self.field is None and self.dtype == buffer.dtype:
+            self.node.read(start, stop, out=buffer)
+        elif self.field is None:
+            buffer[:] = self.node.read(start, stop)
+        else:
+            buffer[:] = self.node.read(start, stop, field=self.field)
+        return buffer
+
+    def read_rows(self, index, out=None):
+        """
+        Read the rows at some positions.
+
+        Args:
+            index (iterable of ints): the positions of the rows.
+            out (optional; numpy array): a float32 buffer with at least
+                len(index) rows to read into.
+
+        Returns:
+            numpy array (float32)
+
+        """
+        index = numpy.asarray(list(index), dtype=numpy.int64)
+        # HDF5 point selections have to be sorted
+        coords, inverse = numpy.unique(index, return_inverse=True)
+        if self.field is None:
+            rows = self.node[coords, :]
+        else:
+            rows = self.node.read_coordinates(coords, field=self.field)
+        if self.storage == 'bits':
+            rows = numpy.unpackbits(rows, axis=1, count=self.ncols)
+        buffer = self._buffer(len(index), out)
+        buffer[:] = rows[inverse]
+        return buffer
+
+    def read_labels(self):
+        """
+        Read the index labels of the rows of a pandas table or frame.
+
+        Returns:
+            numpy array, or None for the plain array layout
+
+        """
+        group = self.node._v_parent
+        pandas_type = getattr(group._v_attrs, 'pandas_type', None)
+        if pandas_type == 'frame_table':
+            return self.node.col('index')
+        if pandas_type == 'frame':
+            return group.axis1.read()
+        return None
+
+
+def append_hdf_array(h5file, key, values, complevel=5, complib='zlib',
+                     storage=None):
+    """
+    Append rows to a plain 2D array in an open PyTables file.
+    The array is created if it does not exist, with chunks of whole rows,
+    which is the layout that HDFArrayReader reads fastest.
+
+    Args:
+        h5file (tables.File): a writeable file.
+        key (str): the key of the array.
+        values (numpy array): the rows to append.
+        complevel (optional; int): the compression level.
+        complib (optional; str): the compression library.
+        storage (optional; str): the compact storage (see compact_rows).
+            Has to be the same for every append to an array.
+
+    Returns:
+        None
+
+    """
+    path = _hdf_path(key)
+    num_units = values.shape[1]
+    values = numpy.asarray(compact_rows(values, storage))
+    if path not in h5file:
+        where, name = os.path.split(path)
+        ncols = values.shape[1]
+        chunk_rows = max(1, 2**20 // (ncols * values.dtype.itemsize))
+        h5file.create_earray(where, name,
+                             atom=tables.Atom.from_dtype(values.dtype),
+                             shape=(0, ncols),
+                             chunkshape=(chunk_rows, ncols),
+                             filters=tables.Filters(complevel=complevel,
+                                                    complib=complib),
+                             createparents=True)
+        if storage == 'bits':
+            h5file.get_node(path).attrs.packed_ncols = num_units
+    h5file.get_node(path).append(values)
+
+
+def write_hdf_array(filename, key, values, mode='a', complevel=5, complib='zlib',
+                    storage=None):
+    """
+    Write a tensor to an HDF5 file in the plain array layout.
+
+    Args:
+        filename (str): the name of the file.
+        key (str): the key of the array.
+        values (numpy array): the data.
+        mode (optional; str): the mode to open the file with.
+        complevel (optional; int): the compression level.
+        complib (optional; str): the compression library.
+        storage (optional; str): the compact storage (see compact_rows).
+
+    Returns:
+        None
+
+    """
+    with tables.open_file(filename, mode=mode) as h5file:
+        append_hdf_array(h5file, key, numpy.asarray(values),
+                         complevel=complevel, complib=complib, storage=storage)
+
+
 class HDFBatch(object):
     """
-    Serves up minibatches from an HDFStore.
+    Serves up minibatches from an HDF5 file.
     The validation set is taken as the last (1 - train_fraction)
     samples in the store.
     The data should probably be randomly shuffled if being used to
-    train a non-recurrent model.
+    train a non-recurrent model, or shuffle=True should be used.
+
+    Notes:
+        If direct=True, the rows are read with an HDFArrayReader straight
+        into float tensors, without building pandas DataFrames.
+        This works for the plain array layout written by write_hdf_array
+        and for pandas tables with a single dtype. Other layouts fall back
+        to reading through pandas. In both cases, get_by_index selects
+        the rows of pandas files by their index labels.
+
+        If reuse_buffers=True as well, the direct reader reads the sequential
+        minibatches into preallocated buffers, so a minibatch is overwritten
+        by the next call to get with the same mode (see reuses_buffers).
+
+        If shuffle=True, the training set is read in contiguous blocks
+        that are visited in a new random order each epoch. The rows of
+        blocks_per_buffer blocks are shuffled together in a buffer that
+        fits in allowed_mem (in GiB), as in TableStatistics.chunksize.
+        This makes an offline pass with the DataShuffler optional.
 
     """
     def __init__(self, filename, key, batch_size,
+                 train_fraction=0.9,
+                 transform=pre.do_nothing,
+                 shuffle=False,
+                 allowed_mem=1,
+                 blocks_per_buffer=10,
+                 direct=True,
+                 reuse_buffers=False):
+
+        assert callable(transform)
+        self.transform = transform
+        self.filename = filename
+        self.key = key
+        self.batch_size = batch_size
+
+        # open the file, get the dimensions of the keyed table
+        self.reader = None
+        self.store = None
+        if direct:
+            try:
+                self.reader = HDFArrayReader(filename, key)
+            except ValueError:
+                pass
+        if self.reader is not None:
+            self.ncols = self.reader.ncols
+            self.nrows = self.reader.nrows
+            # the rows are read straight into the backend tensors
+            # when they share memory with their numpy arrays
+            probe = be.zeros((1, self.ncols))
+            self.shared_buffers = numpy.shares_memory(be.to_numpy_array(probe),
+                                                      be.to_numpy_array(probe))
+            if reuse_buffers:
+                self.buffers = {mode: be.zeros((self.batch_size, self.ncols))
+                                for mode in ['train', 'validate']}
+                self.buffer_arrays = {mode: be.to_numpy_array(self.buffers[mode])
+                                      for mode in self.buffers}
+            # the index labels of the rows are read on the first get_by_index
+            self.labels = None
+            self.labels_read = False
+        else:
+            self.store = pandas.HDFStore(filename, mode='r')
+            self.ncols = self.store.get_storer(key).ncols
+            self.nrows = self.store.get_storer(key).nrows
+        self.split = int(numpy.ceil(train_fraction * self.nrows))
+        self.split -= self.split % self.batch_size
+        self.reuses_buffers = reuse_buffers and self.reader is not None
+
+        # set the block size so that the shuffle buffer fits in allowed_mem
+        self.shuffle = shuffle
+        self.blocks_per_buffer = blocks_per_buffer
+        if self.shuffle:
+            if self.reader is not None:
+                table_stats = TableStatistics.from_reader(self.reader)
+            else:
+                table_stats = TableStatistics(self.store, key)
+            buffer_rows = table_stats.chunksize(allowed_mem)
+            self.block_size = max(self.batch_size,
+                                  buffer_rows // self.blocks_per_buffer)
+
+        self.generators = {}
+        self.reset_generator('all')
+
+    def num_validation_samples(self) -> int:
+        return self.nrows - self.split
+
+    def close(self) -> None:
+        if self.reader is not None:
+            self.reader.close()
+        else:
+            self.store.close()
+
+    def num_training_batches(self):
+        return int(numpy.floor(self.split / self.batch_size))
+
+    def _read_rows(self, start, stop):
+        if self.reader is not None:
+            return self.reader.read(start, stop)
+        return self.store.select(self.key, start=start, stop=stop).values
+
+    def _direct_generator(self, mode, start, stop):
+        for i in range(start, stop, self.batch_size):
+            num_rows = min(i + self.batch_size, stop) - i
+            if self.reuses_buffers:
+                buffer = self.buffers[mode][:num_rows]
+                array = self.buffer_arrays[mode]
+            else:
+                buffer = be.zeros((num_rows, self.ncols))
+                array = be.to_numpy_array(buffer)
+            vals = self.reader.read(i, i + num_rows, array)
+            if self.shared_buffers:
+                yield buffer
+            else:
+                yield be.float_tensor(vals)
+
+    def _sequential_generator(self, mode, start, stop):
+        if self.reader is None:
+            return (be.float_tensor(df.values) for df in
+                    self.store.select(self.key, start=start, stop=stop,
+                                      iterator=True, chunksize=self.batch_size))
+        return self._direct_generator(mode, start, stop)
+
+    def _train_generator(self):
+        if self.shuffle:
+            return (be.float_tensor(vals) for vals in
+                    block_shuffled_slice(self._read_rows, 0, self.split,
+                                         self.block_size, self.blocks_per_buffer,
+                                         self.batch_size))
+        return self._sequential_generator('train', 0, self.split)
+
+    def reset_generator(self, mode: str) -> None:
+        if mode == 'train':
+            self.generators['train'] = self._train_generator()
+        elif mode == 'validate':
+            self.generators['validate'] = self._sequential_generator(
+                'validate', self.split, self.nrows)
+        else:
+            self.generators['train'] = self._train_generator()
+            self.generators['validate'] = self._sequential_generator(
+                'validate', self.split, self.nrows)
+
+    def get(self, mode: str):
+        try:
+            vals = next(self.generators[mode])
+        except StopIteration:
+            self.reset_generator(mode)
+            raise StopIteration
+        trans_vals = self.transform(vals)
+        return trans_vals
+
+    def statistics(self):
+        """
+        The cached statistics of the transformed training set.
+
+        Returns:
+            DataStatistics, or None if they have not been computed
+
+        """
+        return load_statistics(self.filename, self.key, 0, self.split,
+                               self.transform)
+
+    def compute_statistics(self, allowed_mem=1, num_workers=None):
+        """
+        Compute the statistics of the transformed training set,
+        and cache them next to the data file (see compute_statistics).
+
+        Args:
+            allowed_mem (float; optional): the memory for the chunks in GiB
+            num_workers (int; optional): the number of worker processes
+
+        Returns:
+            DataStatistics
+
+        """
+        stats = compute_statistics(self.filename, self.key, 0, self.split,
+                                   self.transform, allowed_mem, num_workers)
+        save_statistics(self.filename, self.key, 0, self.split,
+                        self.transform, stats)
+        return stats
+
+    def _label_positions(self, index):
+        """
+        Map index labels to row positions for the direct reader.
+
+        """
+        if not self.labels_read:
+            labels = self.reader.read_labels()
+            # positions are labels for the plain array layout,
+            # and for pandas files written with the default index
+            if labels is not None and not numpy.array_equal(
+                    labels, numpy.arange(self.nrows)):
+                self.labels = pandas.Index(labels)
+            self.labels_read = True
+        if self.labels is None:
+            return index
+        positions = self.labels.get_indexer(list(index))
+        if (positions < 0).any():
+            raise KeyError("index labels not found in {}".format(self.key))
+        return positions
+
+    def get_by_index(self, index):
+        if self.reader is not None:
+            rows = self.reader.read_rows(self._label_positions(index))
+            return self.transform(be.float_tensor(rows))
+        idx = list(index)
+        tmp = self.store.select(self.key, where="index={}".format(idx))
+        return self.transform(be.float_tensor(tmp.values))
+
+
+class MemmapBatch(object):
+    """
+    Serves up minibatches from a memory mapped numpy array on disk.
+    The file can be a .npy file, or a raw binary file with a JSON header
+    (see write_memmap_header) stored next to it.
+    Raw files written by write_memmap can hold bit-packed binary data,
+    which are unpacked as the minibatches are served.
+    The validation set is taken as the last (1 - train_fraction)
+    samples in the file.
+    The data should probably be randomly shuffled if being used to
+    train a non-recurrent model.
+
+    Notes:
+        Minibatches are sliced directly from the OS page cache and converted
+        to float tensors once, so the file can be larger than memory and
+        can be shared read-only between processes.
+
+    """
+    def __init__(self, filename, batch_size,
                  train_fraction=0.9,
                  transform=pre.do_nothing):
 
         assert callable(transform)
         self.transform = transform
 
-        # open the store, get the dimensions of the keyed table
-        self.store = pandas.HDFStore(filename, mode='r')
-        self.key = key
+        # map the file into memory, get the dimensions of the array
+        self.filename = filename
+        self.data = open_memmap(filename)
         self.batch_size = batch_size
-        self.ncols = self.store.get_storer(key).ncols
-        self.nrows = self.store.get_storer(key).nrows
+        self.nrows, self.ncols = self.data.shape
+        self.storage = None
+        packed_ncols = read_memmap_header(filename).get("packed_ncols")
+        if packed_ncols is not None:
+            self.storage = 'bits'
+            self.ncols = packed_ncols
         self.split = int(numpy.ceil(train_fraction * self.nrows))
         self.split -= self.split % self.batch_size
+        # every minibatch is converted to a new float tensor
+        self.reuses_buffers = False
 
         # create iterators over the data for the train/validate sets
         self.iterators = {}
-        self.iterators['train'] = self.store.select(key, stop=self.split,
-                                                    iterator=True,
-                                                    chunksize=self.batch_size)
-        self.iterators['validate'] = self.store.select(key, start=self.split,
-                                                       iterator=True,
-                                                       chunksize=self.batch_size)
-        self.generators = {mode: self.iterators[mode].__iter__()
-                           for mode in self.iterators}
+        self.reset_generator('all')
 
     def num_validation_samples(self) -> int:
         return self.nrows - self.split
 
     def close(self) -> None:
-        self.store.close()
+        # drop the references to the mapped file
+        self.iterators = {}
+        self.data = None
 
     def num_training_batches(self):
         return int(numpy.floor(self.split / self.batch_size))
 
     def reset_generator(self, mode: str) -> None:
         if mode == 'train':
-            self.generators['train'] = self.iterators['train'].__iter__()
+            self.iterators['train'] = inclusive_slice(self.data, 0, self.split,
+                                                      self.batch_size)
         elif mode == 'validate':
-            self.generators['validate'] = self.iterators['validate'].__iter__()
+            self.iterators['validate'] = inclusive_slice(self.data, self.split,
+                                                         self.nrows, self.batch_size)
         else:
-            self.generators = {mode: self.iterators[mode].__iter__()
-                               for mode in self.iterators}
+            self.reset_generator('train')
+            self.reset_generator('validate')
 
     def get(self, mode: str):
         try:
-            vals = be.float_tensor(next(self.generators[mode]).as_matrix())
+            vals = expand_rows(next(self.iterators[mode]), self.storage,
+                               self.ncols)
         except StopIteration:
             self.reset_generator(mode)
             raise StopIteration
@@ -138,9 +744,563 @@ class HDFBatch(object):
         return trans_vals
 
     def get_by_index(self, index):
-        idx = list(index)
-        tmp = self.store.select(self.key, where="index={}".format(idx))
-        return self.transform(be.float_tensor(tmp.as_matrix()))
+        idx = numpy.asarray(list(index), dtype=numpy.int64)
+        return self.transform(expand_rows(self.data[idx], self.storage,
+                                          self.ncols))
+
+
+def write_memmap(filename, tensor, storage=None):
+    """
+    Write a tensor to a raw binary file with a JSON header,
+    to be read with a MemmapBatch.
+
+    Notes:
+        Performs an IO operation.
+
+    Args:
+        filename (str): the name of the raw binary file
+        tensor (num_samples, num_units): the data
+        storage (str; optional): the compact storage (see compact_rows)
+
+    Returns:
+        None
+
+    """
+    x = numpy.asarray(be.to_numpy_array(compact_rows(tensor, storage)))
+    x.tofile(filename)
+    packed_ncols = be.shape(tensor)[1] if storage == 'bits' else None
+    write_memmap_header(filename, x.dtype, x.shape, packed_ncols=packed_ncols)
+
+
+def write_memmap_header(filename, dtype, shape, offset=0, packed_ncols=None):
+    """
+    Write the JSON header that describes a raw binary array file.
+
+    Notes:
+        Performs an IO operation.
+        The header is stored in filename + '.json'.
+
+    Args:
+        filename (str): the name of the raw binary file
+        dtype (numpy.dtype or str): the type of the array elements
+        shape (tuple): the (num_rows, num_columns) shape of the array
+        offset (int; optional): the number of bytes before the array data
+        packed_ncols (int; optional): the number of units, if the rows
+            are bit-packed binary data
+
+    Returns:
+        None
+
+    """
+    header = {"dtype": numpy.dtype(dtype).str,
+              "shape": [int(s) for s in shape],
+              "offset": int(offset)}
+    if packed_ncols is not None:
+        header["packed_ncols"] = int(packed_ncols)
+    with open(filename + '.json', 'w') as outfile:
+        json.dump(header, outfile)
+
+
+def read_memmap_header(filename):
+    """
+    Read the JSON header that describes a raw binary array file.
+
+    Args:
+        filename (str): the name of the raw binary file
+
+    Returns:
+        dict (empty for .npy files)
+
+    """
+    if os.path.splitext(filename)[1] == '.npy':
+        return {}
+    with open(filename + '.json', 'r') as infile:
+        return json.load(infile)
+
+
+def open_memmap(filename, mode='r'):
+    """
+    Open a read-only memory map of a .npy file, or of a raw binary file
+    described by a JSON header written with write_memmap_header.
+
+    Args:
+        filename (str): the name of the file
+        mode (str; optional): the mode to open the memory map with
+
+    Returns:
+        numpy.memmap
+
+    """
+    if os.path.splitext(filename)[1] == '.npy':
+        return numpy.load(filename, mmap_mode=mode)
+    header = read_memmap_header(filename)
+    return numpy.memmap(filename, dtype=numpy.dtype(header["dtype"]),
+                        mode=mode, offset=header["offset"],
+                        shape=tuple(header["shape"]))
+
+
+def _column_stats(x):
+    """
+    Sufficient statistics of the columns of a shard, as lists for JSON.
+
+    """
+    x = numpy.asarray(x, dtype=numpy.float64)
+    return {"sum": x.sum(axis=0).tolist(),
+            "sum_sq": (x * x).sum(axis=0).tolist(),
+            "min": x.min(axis=0).tolist(),
+            "max": x.max(axis=0).tolist()}
+
+
+def combine_column_stats(shards):
+    """
+    Combine the column statistics of several shards.
+
+    Args:
+        shards (list of dicts): shard entries of a manifest
+
+    Returns:
+        dict: with the mean, var, min, and max of each column (as lists)
+
+    """
+    nrows = sum(shard["nrows"] for shard in shards)
+    total = numpy.sum([shard["stats"]["sum"] for shard in shards], axis=0)
+    total_sq = numpy.sum([shard["stats"]["sum_sq"] for shard in shards], axis=0)
+    mean = total / nrows
+    var = numpy.maximum(total_sq / nrows - mean * mean, 0)
+    return {"mean": mean.tolist(),
+            "var": var.tolist(),
+            "min": numpy.min([shard["stats"]["min"] for shard in shards],
+                             axis=0).tolist(),
+            "max": numpy.max([shard["stats"]["max"] for shard in shards],
+                             axis=0).tolist()}
+
+
+def read_manifest(dirname):
+    """
+    Read the manifest of a sharded dataset.
+
+    Args:
+        dirname (str): the directory of the dataset
+
+    Returns:
+        dict
+
+    """
+    with open(os.path.join(dirname, 'manifest.json'), 'r') as infile:
+        return json.load(infile)
+
+
+class ShardWriter(object):
+    """
+    Writes a sharded dataset: a directory of raw binary shards with
+    shard_size rows each (see write_memmap), and a manifest.json file with
+    the row count, dtype, and column statistics of every shard.
+
+    Notes:
+        Opening a writer on an existing dataset appends new shards without
+        rewriting the old ones. The last shard of each writer may have
+        fewer than shard_size rows. The manifest is replaced atomically
+        when the writer is closed, so readers always see complete shards.
+
+    """
+    def __init__(self, dirname, shard_size, storage=None):
+        """
+        Create a shard writer.
+
+        Args:
+            dirname (str): the directory of the dataset
+            shard_size (int): the number of rows per shard
+            storage (str; optional): the compact storage of the shards
+                (see compact_rows)
+
+        Returns:
+            ShardWriter
+
+        """
+        self.dirname = dirname
+        self.shard_size = shard_size
+        os.makedirs(self.dirname, exist_ok=True)
+        if os.path.exists(os.path.join(self.dirname, 'manifest.json')):
+            self.manifest = read_manifest(self.dirname)
+            assert self.manifest["storage"] == storage
+        else:
+            self.manifest = {"ncols": None, "storage": storage, "shards": []}
+        self.buffer = []
+        self.buffered_rows = 0
+
+    def append(self, tensor) -> None:
+        """
+        Append rows to the dataset, writing every full shard.
+
+        Args:
+            tensor (num_samples, num_units): the rows to append
+
+        Returns:
+            None
+
+        """
+        x = numpy.asarray(be.to_numpy_array(tensor))
+        if self.manifest["ncols"] is None:
+            self.manifest["ncols"] = x.shape[1]
+        assert x.shape[1] == self.manifest["ncols"]
+        self.buffer.append(x)
+        self.buffered_rows += len(x)
+        if self.buffered_rows >= self.shard_size:
+            x = numpy.concatenate(self.buffer)
+            num_full = len(x) - len(x) % self.shard_size
+            for start in range(0, num_full, self.shard_size):
+                self._write_shard(x[start:start + self.shard_size])
+            self.buffer = [x[num_full:]]
+            self.buffered_rows = len(x) - num_full
+
+    def close(self) -> None:
+        """
+        Write the remaining rows and the manifest.
+
+        Returns:
+            None
+
+        """
+        if self.buffered_rows > 0:
+            self._write_shard(numpy.concatenate(self.buffer))
+        self.buffer = []
+        self.buffered_rows = 0
+        if self.manifest["shards"]:
+            self.manifest["stats"] = combine_column_stats(self.manifest["shards"])
+        tmp_filename = os.path.join(self.dirname, 'manifest.json.tmp')
+        with open(tmp_filename, 'w') as outfile:
+            json.dump(self.manifest, outfile)
+        os.replace(tmp_filename, os.path.join(self.dirname, 'manifest.json'))
+
+    def _write_shard(self, x) -> None:
+        filename = "shard_{:05d}.bin".format(len(self.manifest["shards"]))
+        write_memmap(os.path.join(self.dirname, filename), x,
+                     storage=self.manifest["storage"])
+        self.manifest["shards"].append({"filename": filename,
+                                        "nrows": len(x),
+                                        "dtype": x.dtype.str,
+                                        "stats": _column_stats(x)})
+
+
+class ShardedBatch(object):
+    """
+    Serves up minibatches from a sharded dataset (see ShardWriter).
+    The validation set is taken as the last (1 - train_fraction)
+    samples in each shard.
+
+    Notes:
+        The shards are loaded concurrently by a pool of num_threads threads,
+        and the minibatches of up to num_threads loaded shards are
+        interleaved. With num_workers > 1, each worker (e.g., a training
+        process) reads the disjoint subset of shards
+        shards[worker_index::num_workers].
+
+        If shuffle=True, the shards are visited in a new random order every
+        epoch and the training rows of each shard are shuffled.
+        The training rows left over after the last full minibatch of an
+        epoch are dropped.
+
+    """
+    def __init__(self, dirname, batch_size,
+                 train_fraction=0.9,
+                 transform=pre.do_nothing,
+                 shuffle=False,
+                 worker_index=0,
+                 num_workers=1,
+                 num_threads=4):
+
+        assert callable(transform)
+        assert 0 <= worker_index < num_workers
+        self.transform = transform
+        self.dirname = dirname
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.num_threads = num_threads
+
+        # assign a disjoint subset of the shards to this worker
+        self.manifest = read_manifest(dirname)
+        self.storage = self.manifest["storage"]
+        self.ncols = self.manifest["ncols"]
+        self.shards = self.manifest["shards"][worker_index::num_workers]
+        self.splits = [int(numpy.ceil(train_fraction * shard["nrows"]))
+                       for shard in self.shards]
+        self.nrows = sum(shard["nrows"] for shard in self.shards)
+        self.split = sum(self.splits)
+        self.offsets = numpy.cumsum([0] + [shard["nrows"] for shard in self.shards])
+        # every minibatch is converted to a new float tensor
+        self.reuses_buffers = False
+
+        self.pool = concurrent.futures.ThreadPoolExecutor(self.num_threads)
+        self.generators = {}
+        self.reset_generator('all')
+
+    def num_validation_samples(self) -> int:
+        return self.nrows - self.split
+
+    def close(self) -> None:
+        self.generators = {}
+        self.pool.shutdown()
+
+    def num_training_batches(self):
+        return int(numpy.floor(self.split / self.batch_size))
+
+    def _open_shard(self, i):
+        return open_memmap(os.path.join(self.dirname, self.shards[i]["filename"]))
+
+    def _load_shard(self, i, mode, seed):
+        """
+        Read the training or validation rows of shard i into memory.
+
+        """
+        data = self._open_shard(i)
+        if mode == 'train':
+            rows = numpy.array(data[:self.splits[i]])
+            if self.shuffle:
+                numpy.random.RandomState(seed).shuffle(rows)
+        else:
+            rows = numpy.array(data[self.splits[i]:])
+        return rows
+
+    def _generator(self, mode):
+        order = list(range(len(self.shards)))
+        if self.shuffle and mode == 'train':
+            numpy.random.shuffle(order)
+        # the seeds are drawn here, so that the threads do not share a RNG
+        seeds = numpy.random.randint(2**31, size=len(order))
+        pending = iter(zip(order, seeds))
+
+        def load_next():
+            args = next(pending, None)
+            if args is not None:
+                loading.append(self.pool.submit(self._load_shard, args[0],
+                                                mode, args[1]))
+
+        # keep at most num_threads shards loading or loaded
+        loading = collections.deque()
+        active = collections.deque()
+        for _ in range(self.num_threads):
+            load_next()
+
+        # interleave the minibatches of the loaded shards
+        leftover = []
+        while loading or active:
+            while loading and (not active or loading[0].done()):
+                rows = loading.popleft().result()
+                active.append(inclusive_slice(rows, 0, len(rows), self.batch_size))
+            shard_iterator = active.popleft()
+            rows = next(shard_iterator, None)
+            if rows is None:
+                load_next()
+                continue
+            active.append(shard_iterator)
+            if len(rows) == self.batch_size:
+                yield rows
+                continue
+            # combine the partial minibatches at the ends of the shards
+            leftover.append(rows)
+            if sum(len(r) for r in leftover) >= self.batch_size:
+                rows = numpy.concatenate(leftover)
+                leftover = [rows[self.batch_size:]]
+                yield rows[:self.batch_size]
+
+        if mode != 'train' and sum(len(r) for r in leftover) > 0:
+            yield numpy.concatenate(leftover)
+
+    def reset_generator(self, mode: str) -> None:
+        if mode == 'train':
+            self.generators['train'] = self._generator('train')
+        elif mode == 'validate':
+            self.generators['validate'] = self._generator('validate')
+        else:
+            self.reset_generator('train')
+            self.reset_generator('validate')
+
+    def get(self, mode: str):
+        try:
+            vals = expand_rows(next(self.generators[mode]), self.storage,
+                               self.ncols)
+        except StopIteration:
+            self.reset_generator(mode)
+            raise StopIteration
+        trans_vals = self.transform(vals)
+        return trans_vals
+
+    def get_by_index(self, index):
+        """
+        Get rows by their position in the concatenation of the shards
+        of this worker.
+
+        """
+        index = numpy.asarray(list(index), dtype=numpy.int64)
+        shard_index = numpy.searchsorted(self.offsets, index, side='right') - 1
+        data = {i: self._open_shard(i) for i in numpy.unique(shard_index)}
+        rows = numpy.stack([data[i][j - self.offsets[i]]
+                            for i, j in zip(shard_index, index)])
+        return self.transform(expand_rows(rows, self.storage, self.ncols))
+
+
+class PrefetchBatch(object):
+    """
+    Wraps another batch object (e.g., InMemoryBatch, HDFBatch) and
+    keeps the next few transformed minibatches loaded in a bounded queue.
+    The queue is filled by a background thread so that reading from disk
+    and applying the transform overlap with the computations on the
+    training thread.
+
+    The StopIteration at the end of an epoch and the reset_generator
+    semantics of the wrapped batch object are preserved.
+    The minibatches are copied into the queue if the wrapped batch object
+    overwrites the minibatch it returned on the next call to get, as shown
+    by its reuses_buffers attribute (batch objects without the attribute
+    are assumed to reuse their buffers).
+
+    Notes:
+        The time the consumer spends waiting on an empty queue is recorded
+        for each mode. If the starvation time of an epoch is a large fraction
+        of the epoch time then training is I/O bound.
+
+    """
+    def __init__(self, batch, num_prefetch=4):
+
+        self.batch = batch
+        self.num_prefetch = num_prefetch
+        self.batch_size = batch.batch_size
+        self.ncols = batch.ncols
+        self.nrows = batch.nrows
+        self.split = batch.split
+        # the queued minibatches are not overwritten
+        self.reuses_buffers = False
+        self.copy = getattr(batch, 'reuses_buffers', True)
+
+        # the wrapped batch is only ever accessed while holding the lock
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.workers = {}
+        self.stop_events = {}
+
+        # time spent waiting for data: in the current and last finished epoch
+        self.wait_time = {'train': 0.0, 'validate': 0.0}
+        self.last_wait_time = {'train': 0.0, 'validate': 0.0}
+
+    @property
+    def transform(self):
+        return self.batch.transform
+
+    @transform.setter
+    def transform(self, transform):
+        # minibatches in the queues were made with the old transform
+        self.reset_generator('all')
+        self.batch.transform = transform
+
+    def num_validation_samples(self) -> int:
+        return self.batch.num_validation_samples()
+
+    def num_training_batches(self):
+        return self.batch.num_training_batches()
+
+    def close(self) -> None:
+        self._stop_worker('train')
+        self._stop_worker('validate')
+        self.batch.close()
+
+    def statistics(self):
+        """
+        The cached statistics of the wrapped batch, if it has any.
+
+        Returns:
+            DataStatistics or None
+
+        """
+        if hasattr(self.batch, 'statistics'):
+            return self.batch.statistics()
+        return None
+
+    def starvation_time(self, mode: str = 'train') -> float:
+        """
+        The time (in seconds) spent waiting for data in the last full epoch.
+
+        Args:
+            mode (str): 'train' or 'validate'
+
+        Returns:
+            float
+
+        """
+        return self.last_wait_time[mode]
+
+    def _fill_queue(self, mode, data_queue, stop_event):
+        """
+        Read minibatches from the wrapped batch object into a queue.
+        Finishes the queue with None at the end of the epoch,
+        or with the exception raised by the wrapped batch object.
+
+        """
+        while not stop_event.is_set():
+            try:
+                with self.lock:
+                    item = self.batch.get(mode)
+                    if self.copy:
+                        item = be.copy_tensor(item)
+            except StopIteration:
+                item = None
+            except Exception as err:
+                item = err
+            # wait for space in the queue, unless asked to stop
+            while not stop_event.is_set():
+                try:
+                    data_queue.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if item is None or isinstance(item, Exception):
+                return
+
+    def _start_worker(self, mode):
+        self.queues[mode] = queue.Queue(maxsize=self.num_prefetch)
+        self.stop_events[mode] = threading.Event()
+        self.workers[mode] = threading.Thread(target=self._fill_queue,
+                                              args=(mode, self.queues[mode],
+                                                    self.stop_events[mode]),
+                                              daemon=True)
+        self.wait_time[mode] = 0.0
+        self.workers[mode].start()
+
+    def _stop_worker(self, mode):
+        if mode in self.workers:
+            self.stop_events[mode].set()
+            self.workers[mode].join()
+            del self.workers[mode]
+            del self.queues[mode]
+            del self.stop_events[mode]
+
+    def reset_generator(self, mode: str) -> None:
+        if mode in ['train', 'validate']:
+            self._stop_worker(mode)
+        else:
+            self._stop_worker('train')
+            self._stop_worker('validate')
+        with self.lock:
+            self.batch.reset_generator(mode)
+
+    def get(self, mode: str):
+        if mode not in self.workers:
+            self._start_worker(mode)
+        start_time = time.time()
+        item = self.queues[mode].get()
+        self.wait_time[mode] += time.time() - start_time
+        if item is None:
+            # the wrapped batch has already reset its generator
+            self.last_wait_time[mode] = self.wait_time[mode]
+            self._stop_worker(mode)
+            raise StopIteration
+        if isinstance(item, Exception):
+            self._stop_worker(mode)
+            raise item
+        return item
+
+    def get_by_index(self, index):
+        with self.lock:
+            return self.batch.get_by_index(index)
 
 
 class TableStatistics(object):
@@ -150,9 +1310,29 @@ class TableStatistics(object):
     """
     def __init__(self, store, key):
         self.key_store = store.get_storer(key)
+        self._set_shape((self.key_store.nrows, self.key_store.ncols),
+                        self.key_store.dtype[1].base)
+
+    @classmethod
+    def from_reader(cls, reader):
+        """
+        Create the statistics of a dataset opened with an HDFArrayReader.
+
+        Args:
+            reader (HDFArrayReader)
+
+        Returns:
+            TableStatistics
+
+        """
+        tmp = cls.__new__(cls)
+        tmp.key_store = None
+        tmp._set_shape((reader.nrows, reader.ncols), reader.dtype)
+        return tmp
 
-        self.shape = (self.key_store.nrows, self.key_store.ncols)
-        self.dtype = self.key_store.dtype[1].base
+    def _set_shape(self, shape, dtype):
+        self.shape = shape
+        self.dtype = numpy.dtype(dtype)
         self.itemsize = self.dtype.itemsize
         self.mem_footprint = numpy.prod(self.shape) * self.itemsize / 1024**3 # in GiB
 
@@ -165,21 +1345,281 @@ class TableStatistics(object):
         return int(self.shape[0] * allowed_mem / self.mem_footprint)
 
 
+# the statistics of the columns of a dataset
+DataStatistics = namedtuple("DataStatistics",
+                            ["num", "mean", "var", "min", "max", "nonzero"])
+
+
+def _transform_name(transform):
+    """
+    A name that identifies a transform in the statistics cache,
+    or None if the transform cannot be identified (e.g., a lambda).
+
+    """
+    name = "{}.{}".format(getattr(transform, '__module__', None),
+                          getattr(transform, '__qualname__', None))
+    if 'None' in name or '<' in name:
+        return None
+    return name
+
+
+def _read_hdf_rows(filename, key, start, stop):
+    """
+    Read rows of a dataset in an HDF5 file, directly if possible.
+
+    """
+    try:
+        reader = HDFArrayReader(filename, key)
+    except ValueError:
+        return pandas.read_hdf(filename, key, start=start, stop=stop).values
+    rows = reader.read(start, stop)
+    reader.close()
+    return rows
+
+
+def _chunk_statistics(args):
+    """
+    Compute the moments, minimum, maximum, and nonzero counts
+    of the columns of a chunk of rows.
+    Used by the worker processes of compute_statistics.
+
+    Args:
+        args (tuple): (filename, key, start, stop, transform)
+
+    Returns:
+        tuple: (MeanVarianceArrayCalculator, min, max, nonzero count)
+
+    """
+    filename, key, start, stop, transform = args
+    x = be.dense(transform(be.float_tensor(_read_hdf_rows(filename, key,
+                                                          start, stop))))
+    moments = math_utils.MeanVarianceArrayCalculator()
+    moments.update(x, axis=0)
+    nonzero = be.tsum(be.float_tensor(x != 0), axis=0)
+    return moments, be.tmin(x, axis=0), be.tmax(x, axis=0), nonzero
+
+
+def compute_statistics(filename, key, start=0, stop=None,
+                       transform=pre.do_nothing, allowed_mem=1,
+                       num_workers=None):
+    """
+    Compute the mean, variance, minimum, maximum, and fraction of nonzero
+    values of each column of a dataset in an HDF5 file.
+    The rows are read in chunks by parallel worker processes.
+
+    Notes:
+        The statistics are of the transformed rows. The transform has to be
+        picklable (e.g., a function in the preprocess module).
+
+    Args:
+        filename (str): the name of the HDF5 file
+        key (str): the key of the dataset
+        start (int; optional): the first row
+        stop (int; optional): one past the last row (default all rows)
+        transform (callable; optional): the transform of the rows
+        allowed_mem (float; optional): the memory for the chunks in GiB
+        num_workers (int; optional): the number of worker processes
+            (default the number of CPUs)
+
+    Returns:
+        DataStatistics
+
+    """
+    num_workers = num_workers or multiprocessing.cpu_count()
+    try:
+        reader = HDFArrayReader(filename, key)
+        table_stats = TableStatistics.from_reader(reader)
+        reader.close()
+    except ValueError:
+        with pandas.HDFStore(filename, mode='r') as store:
+            table_stats = TableStatistics(store, key)
+    stop = table_stats.shape[0] if stop is None else stop
+    # each worker holds one chunk in memory at a time
+    chunksize = max(1, table_stats.chunksize(allowed_mem / num_workers))
+    tasks = [(filename, key, i, min(i + chunksize, stop), transform)
+             for i in range(start, stop, chunksize)]
+
+    pool = None
+    mapper = map
+    if num_workers > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(num_workers, len(tasks)))
+        mapper = pool.imap
+
+    moments = math_utils.MeanVarianceArrayCalculator()
+    tmin = tmax = nonzero = None
+    for chunk_moments, chunk_min, chunk_max, chunk_nonzero in mapper(
+            _chunk_statistics, tasks):
+        moments.combine(chunk_moments)
+        if tmin is None:
+            tmin, tmax, nonzero = chunk_min, chunk_max, chunk_nonzero
+        else:
+            tmin = be.tmin(be.stack([tmin, chunk_min], axis=0), axis=0)
+            tmax = be.tmax(be.stack([tmax, chunk_max], axis=0), axis=0)
+            nonzero = nonzero + chunk_nonzero
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    return DataStatistics(moments.num, moments.mean, moments.var, tmin, tmax,
+                          nonzero / max(moments.num, 1))
+
+
+def statistics_filename(filename):
+    """
+    The name of the file that caches the statistics of the datasets
+    in a data file.
+
+    Args:
+        filename (str): the name of the data file
+
+    Returns:
+        str
+
+    """
+    return os.path.splitext(filename)[0] + "_stats.json"
+
+
+def save_statistics(filename, key, start, stop, transform, stats):
+    """
+    Store the statistics of the rows [start, stop) of a dataset next to
+    the data file, replacing any statistics of the same rows.
+
+    Notes:
+        Performs an IO operation.
+
+    Args:
+        filename (str): the name of the data file
+        key (str): the key of the dataset
+        start (int): the first row
+        stop (int): one past the last row
+        transform (callable): the transform of the rows
+        stats (DataStatistics)
+
+    Returns:
+        None
+
+    """
+    name = _transform_name(transform)
+    if name is None:
+        return
+    entries = [e for e in _read_statistics_file(filename)
+               if (e["key"], e["start"], e["stop"], e["transform"])
+               != (key, start, stop, name)]
+    entry = {"key": key, "start": int(start), "stop": int(stop),
+             "transform": name, "num": int(stats.num)}
+    for field in DataStatistics._fields[1:]:
+        entry[field] = be.to_numpy_array(getattr(stats, field)).tolist()
+    entries.append(entry)
+
+    tmp_filename = statistics_filename(filename) + '.tmp'
+    with open(tmp_filename, 'w') as outfile:
+        json.dump(entries, outfile)
+    os.replace(tmp_filename, statistics_filename(filename))
+
+
+def load_statistics(filename, key, start, stop, transform):
+    """
+    Load the cached statistics of the rows [start, stop) of a dataset.
+
+    Args:
+        filename (str): the name of the data file
+        key (str): the key of the dataset
+        start (int): the first row
+        stop (int): one past the last row
+        transform (callable): the transform of the rows
+
+    Returns:
+        DataStatistics, or None if they have not been computed
+
+    """
+    name = _transform_name(transform)
+    for e in _read_statistics_file(filename):
+        if (e["key"], e["start"], e["stop"], e["transform"]) \
+            == (key, start, stop, name):
+            return DataStatistics(e["num"], *[be.float_tensor(e[field])
+                                  for field in DataStatistics._fields[1:]])
+    return None
+
+
+def _read_statistics_file(filename):
+    if not os.path.exists(statistics_filename(filename)):
+        return []
+    with open(statistics_filename(filename), 'r') as infile:
+        return json.load(infile)
+
+
+def _shuffle_bucket(args):
+    """
+    Read a bucket of rows from a raw binary file and shuffle it.
+    Used by the worker processes of the DataShuffler.
+
+    Args:
+        args (tuple): (filename, dtype, ncols, seed), where ncols is None
+            for the rows of a structured dtype
+
+    Returns:
+        numpy array
+
+    """
+    filename, dtype, ncols, seed = args
+    x = numpy.fromfile(filename, dtype=dtype)
+    if ncols is not None:
+        x = x.reshape(-1, ncols)
+    return x[numpy.random.RandomState(seed).permutation(len(x))]
+
+
+def _table_rows(df):
+    """
+    Get the rows of a table as a numpy array that can be written to
+    a raw binary file. Tables with one column dtype give a 2D array,
+    and tables with mixed column dtypes give a 1D structured array.
+    Used by the DataShuffler.
+
+    Args:
+        df (pandas.DataFrame)
+
+    Returns:
+        numpy array
+
+    """
+    dtypes = set(df.dtypes)
+    if any(dt == object for dt in dtypes):
+        raise ValueError("cannot shuffle columns with object dtype")
+    if len(dtypes) == 1:
+        return df.values
+    return df.to_records(index=False).view(numpy.ndarray)
+
+
 class DataShuffler(object):
     """
     Shuffles data in an HDF5 file.
     Synchronized shuffling between tables (with matching numbers of rows).
 
+    Uses a two pass external shuffle that is linear in the number of rows.
+    The first pass streams through the table and appends each row to a
+    randomly chosen bucket. In the second pass, worker processes read and
+    shuffle the buckets in parallel, and the buckets are written to the
+    shuffled table in order. The result is deterministic for a fixed seed
+    and allowed_mem, and does not depend on the number of workers.
+
+    The shuffled tables are written as pandas tables (layout='table'),
+    or as plain arrays for the HDFArrayReader (layout='array').
+
     """
     def __init__(self, filename, shuffled_filename,
                  allowed_mem=1,
                  complevel=5,
-                 seed=137):
+                 seed=137,
+                 num_workers=None,
+                 layout='table'):
+        assert layout in ['table', 'array']
         self.filename = filename
         self.allowed_mem = allowed_mem # in GiB
         self.seed = seed # should keep this fixed for long-term determinism
         self.complevel = complevel
         self.complib = 'zlib'
+        self.layout = layout
 
         # get the keys and statistics
         self.store = pandas.HDFStore(filename, mode='r')
@@ -187,18 +1627,41 @@ class DataShuffler(object):
         self.table_stats = {k: TableStatistics(self.store, k)
                             for k in self.keys}
 
+        # the array layout stores a single dtype per table
+        if self.layout == 'array' and any(
+                len(set(self.store.select(k, start=0, stop=0).dtypes)) > 1
+                for k in self.keys):
+            self.store.close()
+            raise ValueError("the array layout needs one column dtype per table")
+
         # choose the smallest chunksize
         self.chunksize = min([self.table_stats[k].chunksize(self.allowed_mem)
                               for k in self.keys])
 
-        # store for chunked data
-        self.chunk_filename = os.path.splitext(filename)[0] + "_chunk.h5"
-        self.chunk_store = pandas.HDFStore(self.chunk_filename, mode='w')
+        # the expected bucket size does not depend on the number of workers,
+        # so the shuffle only depends on the seed and allowed_mem
+        self.bucketsize = max(1, self.chunksize // 16)
+
+        # the second pass holds one bucket per worker and one being written,
+        # and a bucket can be up to about twice the expected size, so at most
+        # chunksize / (2 * bucketsize) - 1 workers fit in allowed_mem
+        max_workers = max(1, self.chunksize // (2 * self.bucketsize) - 1)
+        self.num_workers = max(1, min(num_workers or multiprocessing.cpu_count(),
+                                      max_workers))
+        if num_workers is not None and num_workers > self.num_workers:
+            warnings.warn("using {} workers instead of {} to stay within allowed_mem"
+                          .format(self.num_workers, num_workers))
+
+        # directory for the bucketed data
+        self.chunk_dirname = os.path.splitext(filename)[0] + "_chunks"
 
         # setup the output file
-        self.shuffled_store = pandas.HDFStore(shuffled_filename, mode='w',
-                                              complevel=self.complevel,
-                                              complib=self.complib)
+        if self.layout == 'array':
+            self.shuffled_store = tables.open_file(shuffled_filename, mode='w')
+        else:
+            self.shuffled_store = pandas.HDFStore(shuffled_filename, mode='w',
+                                                  complevel=self.complevel,
+                                                  complib=self.complib)
 
 
     def shuffle(self):
@@ -207,13 +1670,12 @@ class DataShuffler(object):
 
         """
         for k in self.keys:
-            numpy.random.seed(self.seed)
             self.shuffle_table(k)
 
         self.store.close()
         self.shuffled_store.close()
-        self.chunk_store.close()
-        os.remove(self.chunk_filename)
+        if os.path.exists(self.chunk_dirname):
+            os.rmdir(self.chunk_dirname)
 
 
     def shuffle_table(self, key):
@@ -221,87 +1683,98 @@ class DataShuffler(object):
         Shuffle a table in the HDFStore, write to a new file.
 
         """
-        # split up the table into chunks
-        num_chunks, chunk_keys, chunk_counts = self.divide_table_into_chunks(key)
-
-        # if there is one chunk, move it and finish
-        if num_chunks == 1:
-            self.shuffled_store.put(key, self.chunk_store[chunk_keys[0]],
-                                    format='table')
-            return
+        # tables with the same number of rows get the same bucket assignments
+        num_buckets = int(numpy.ceil(self.table_stats[key].shape[0]
+                                     / self.bucketsize))
 
-        self.reassemble_table(key, num_chunks, chunk_keys, chunk_counts)
+        # split up the table into buckets, removing the buckets
+        # left over by an interrupted run
+        os.makedirs(self.chunk_dirname, exist_ok=True)
+        for filename in glob.glob(self._bucket_filename('*')):
+            os.remove(filename)
+        buckets, dtype = self.divide_table_into_chunks(key, num_buckets)
+        self.reassemble_table(key, buckets, dtype)
 
 
-    def divide_table_into_chunks(self, key):
+    def divide_table_into_chunks(self, key, num_buckets):
         """
-        Divides a table into chunks, each with their own table.
-        Shuffles the chunked tables.
+        Streams through a table and appends each row to a random bucket.
+        Each bucket is a raw binary file in the chunk directory, so that
+        an append costs about the same no matter how many buckets there are.
 
         """
+        rng = numpy.random.RandomState(self.seed)
         num_read = 0
-        i_chunk = 0
-        chunk_keys = []
-        chunk_counts = []
-
-        # get the column names
-        column_names = list(self.store.select(key, start=0, stop=0))
+        bucket_counts = numpy.zeros(num_buckets, dtype=numpy.int64)
+        dtype = None
 
-        # read, shuffle, and write chunks
+        # read chunks, group the rows by bucket, and append to the buckets
         while num_read < self.table_stats[key].shape[0]:
-            x = self.store.select(key, start=i_chunk*self.chunksize,
-                                  stop=(i_chunk+1)*self.chunksize).as_matrix()
-            numpy.random.shuffle(x)
-            chunk_key = key + str(i_chunk)
-            self.chunk_store.put(chunk_key,
-                                 pandas.DataFrame(x, columns=column_names),
-                                 format='table')
-
-            # increment counters
+            x = _table_rows(self.store.select(key, start=num_read,
+                                              stop=num_read + self.chunksize))
+            dtype = x.dtype
+            buckets = rng.randint(num_buckets, size=len(x))
+            order = numpy.argsort(buckets, kind='mergesort')
+            counts = numpy.bincount(buckets, minlength=num_buckets)
+            offsets = numpy.concatenate([[0], numpy.cumsum(counts)])
+            # copy one bucket at a time, rather than the whole chunk,
+            # and truncate the bucket files the first time they are written
+            for j in numpy.nonzero(counts)[0]:
+                mode = 'ab' if bucket_counts[j] else 'wb'
+                with open(self._bucket_filename(j), mode) as f:
+                    x[order[offsets[j]:offsets[j+1]]].tofile(f)
+            bucket_counts += counts
             num_read += len(x)
-            i_chunk += 1
-            chunk_counts.append(len(x))
-            chunk_keys.append(chunk_key)
 
-        return (i_chunk, chunk_keys, chunk_counts)
+        return list(numpy.nonzero(bucket_counts)[0]), dtype
 
 
-    def reassemble_table(self, key, num_chunks, chunk_keys, chunk_counts):
+    def reassemble_table(self, key, buckets, dtype):
         """
-        Takes a set of chunked tables and rebuilds the shuffled table.
+        Shuffles the buckets in parallel and writes them to the shuffled table.
 
         """
-        # find a streaming map
-        stream_map = numpy.concatenate([chunk_counts[i]*[i]
-                                        for i in range(len(chunk_counts))])
-        numpy.random.shuffle(stream_map)
+        column_names = list(self.store.select(key, start=0, stop=0))
+        ncols = None if dtype.names else len(column_names)
+        tasks = [(self._bucket_filename(j), dtype, ncols,
+                  self.seed + 1 + i) for i, j in enumerate(buckets)]
+
+        pool = None
+        mapper = map
+        if self.num_workers > 1:
+            pool = multiprocessing.Pool(self.num_workers)
+            mapper = pool.map
 
-        # stream from the chunks into the shuffled store
-        chunk_read_inds = num_chunks * [0]
+        # shuffle one bucket per worker at a time, to bound the memory,
+        # and write the buckets in order, setting the index
         num_streamed = 0
-        # read data in chunks
-        for i_chunk in range(num_chunks):
-            # get the count for each chunk table
-            chunk_inds = stream_map[i_chunk*self.chunksize
-                                    : (i_chunk+1)*self.chunksize]
-            chunk_read_counts = [numpy.sum(chunk_inds == j)
-                                 for j in range(num_chunks)]
-
-            # now read chunks into an empty array
-            arr = numpy.zeros((len(chunk_inds), self.table_stats[key].shape[1]),
-                              self.table_stats[key].dtype)
-            arr_ix = 0
-            for j in range(num_chunks):
-                num_read = chunk_read_counts[j]
-                df_chunk = self.chunk_store.select(chunk_keys[j],
-                                                   start=chunk_read_inds[j],
-                                                   stop=chunk_read_inds[j] + num_read)
-                arr[arr_ix : arr_ix + num_read] = df_chunk
-                arr_ix += num_read
-                chunk_read_inds[j] += num_read
-            # shuffle the array and write it, setting the index
-            numpy.random.shuffle(arr)
-            df = pandas.DataFrame(arr, columns=list(df_chunk))
-            df.index = range(num_streamed, num_streamed + len(arr))
-            num_streamed += len(arr)
-            self.shuffled_store.append(key, df)
+        for i in range(0, len(tasks), self.num_workers):
+            wave = tasks[i : i + self.num_workers]
+            for task, arr in zip(wave, mapper(_shuffle_bucket, wave)):
+                os.remove(task[0])
+                if self.layout == 'array':
+                    append_hdf_array(self.shuffled_store, key, arr,
+                                     complevel=self.complevel,
+                                     complib=self.complib)
+                    continue
+                df = pandas.DataFrame(arr)
+                df.columns = column_names
+                df.index = range(num_streamed, num_streamed + len(arr))
+                num_streamed += len(arr)
+                self.shuffled_store.append(key, df, index=False)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        # indexing the table once at the end keeps the appends cheap
+        if self.layout == 'table':
+            self.shuffled_store.create_table_index(key)
+
+
+    def _bucket_filename(self, j):
+        """
+        The name of the raw binary file that stores bucket j.
+
+        """
+        return os.path.join(self.chunk_dirname, "bucket_{}.bin".format(j))
@@ -1,21 +1,41 @@
 import time
+import numpy
+import multiprocessing
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 from . import backends as be
 from . import metrics as M
 from . import schedules
-from .models.model_utils import State
+from .models.model_utils import State, SamplingBuffers
 from . import layers
 from.models.model import Model
+from .models import gradient_util as gu
 
 class Sampler(object):
-    """Base class for the sequential Monte Carlo samplers"""
-    def __init__(self, model, updater='markov_chain', **kwargs):
+    """
+    Base class for the sequential Monte Carlo samplers.
+
+    By default, a sampler has one particle per sample of the state it is
+    initialized with (e.g., one minibatch). A sampler can instead own a pool
+    of num_particles particles, drawn from as many batches as needed,
+    and update a random subset of num_updated of them at each call to
+    update_state. The gradient is averaged over the whole pool.
+
+    """
+    def __init__(self, model, updater='markov_chain', num_particles=None,
+                 num_updated=None, **kwargs):
         """
         Create a sampler.
 
         Args:
             model: a model object
+            updater (str; optional): how to update the particles
+            num_particles (int; optional): the size of the particle pool
+                set from a batch, defaults to the batch size
+            num_updated (int; optional): the number of randomly chosen
+                particles updated per call to update_state,
+                defaults to all of them
             kwargs (optional)
 
         Returns:
@@ -27,6 +47,11 @@ class Sampler(object):
         self.clamped = []
         self.update_method = updater
         self.updater = getattr(model, updater)
+        self.updater_ = getattr(model, updater + '_')
+        self.buffers = None
+        self.num_particles = num_particles
+        self.num_updated = num_updated
+        self.subset = None
 
     def set_state(self, state):
         """
@@ -34,6 +59,7 @@ class Sampler(object):
 
         Notes:
             Modifies the state attribute in place.
+            Copies the state, because the sampler updates it in place.
 
         Args:
             state (State): The state of the units.
@@ -42,7 +68,27 @@ class Sampler(object):
             None
 
         """
-        self.state = state
+        self.state = State.from_state(state)
+
+    def _buffers_for(self, state):
+        """
+        Get the preallocated buffers for in-place updates of a state.
+        The buffers are reused for as long as the batch size does not change.
+
+        Notes:
+            Modifies the buffers attribute in place.
+
+        Args:
+            state (State): The state of the units.
+
+        Returns:
+            SamplingBuffers
+
+        """
+        batch_size = be.shape(state.units[0])[0]
+        if self.buffers is None or self.buffers.batch_size != batch_size:
+            self.buffers = SamplingBuffers.from_model(batch_size, self.model)
+        return self.buffers
 
     def set_state_from_batch(self, batch):
         """
@@ -58,10 +104,97 @@ class Sampler(object):
             None
 
         """
-        vdata = batch.get('train')
+        if self.num_particles is None:
+            # set_state copies, because some batch objects reuse their output buffers
+            vdata = be.dense(batch.get('train'))
+        else:
+            vdata = self._visible_pool(batch)
         self.set_state(State.from_visible(vdata, self.model))
         batch.reset_generator('all')
 
+    def _visible_pool(self, batch):
+        """
+        Read num_particles visible vectors from a batch object,
+        cycling through the training set as many times as needed.
+
+        Args:
+            batch: a Batch object
+
+        Returns:
+            tensor (num_particles, num_visible)
+
+        """
+        batch.reset_generator('train')
+        pool = []
+        num_rows = 0
+        while num_rows < self.num_particles:
+            try:
+                vdata = be.dense(batch.get('train'))
+            except StopIteration:
+                if num_rows == 0:
+                    raise ValueError("the batch has no training data")
+                continue
+            # copy, because some batch objects reuse their output buffers
+            pool.append(be.copy_tensor(vdata))
+            num_rows += be.shape(vdata)[0]
+        return be.vstack(pool)[:self.num_particles]
+
+    def _select_particles(self, dropout_mask=None):
+        """
+        Choose the particles to update.
+        Gathers a random subset of num_updated particles into the subset
+        attribute, or chooses all of them.
+
+        Notes:
+            Modifies the subset attribute in place.
+
+        Args:
+            dropout_mask (State; optional): mask on model units
+
+        Returns:
+            tuple (tensor or None, State, State): the indices of the particles
+                (None for all of them), their state, and their dropout mask
+
+        """
+        num_particles = be.shape(self.state.units[0])[0]
+        if self.num_updated is None or self.num_updated >= num_particles:
+            return None, self.state, dropout_mask
+
+        index = be.int_tensor(numpy.random.choice(num_particles, self.num_updated,
+                                                  replace=False))
+        if self.subset is None or be.shape(self.subset.units[0])[0] != self.num_updated:
+            self.subset = State([be.index_select(u, index) for u in self.state.units])
+        else:
+            for u, s in zip(self.state.units, self.subset.units):
+                be.index_select(u, index, out=s)
+
+        # masks with one row per particle follow the particles
+        if dropout_mask is not None and \
+            be.shape(dropout_mask.units[0])[0] == num_particles > 1:
+            dropout_mask = State([be.index_select(m, index)
+                                  for m in dropout_mask.units])
+        return index, self.subset, dropout_mask
+
+    def _store_particles(self, index):
+        """
+        Copy the updated subset of particles back into the pool.
+
+        Notes:
+            Modifies the state attribute in place.
+
+        Args:
+            index (tensor or None): the indices from _select_particles
+
+        Returns:
+            None
+
+        """
+        if index is not None:
+            for u, s in zip(self.state.units, self.subset.units):
+                be.index_copy_(u, index, s)
+            # the units of the pool changed in place
+            self.state.clear_fields()
+
     @classmethod
     def from_batch(cls, model, batch, **kwargs):
         """
@@ -83,21 +216,44 @@ class Sampler(object):
 
 class SequentialMC(Sampler):
     """Basic sequential Monte Carlo sampler"""
-    def __init__(self, model, clamped=None, updater='markov_chain'):
+    def __init__(self, model, clamped=None, updater='markov_chain',
+                 num_particles=None, num_updated=None, tolerance=None,
+                 damping=0.0, max_iters=100):
         """
         Create a sequential Monte Carlo sampler.
 
         Args:
             model: a model object
-            method (str; optional): how to update the particles
+            clamped (List[int]; optional): the clamped layers
+            updater (str; optional): how to update the particles
+            num_particles (int; optional): the size of the particle pool
+                set from a batch, defaults to the batch size
+            num_updated (int; optional): the number of randomly chosen
+                particles updated per call to update_state,
+                defaults to all of them
+            tolerance (float; optional): if set, update_state iterates the
+                mean field updates of each particle until the change of its
+                units is below the tolerance, instead of taking a fixed
+                number of steps. Requires the mean_field_iteration updater.
+            damping (float in [0,1); optional): the damping of the mean field
+                updates, if tolerance is set
+            max_iters (int; optional): the maximum number of mean field updates,
+                if tolerance is set
 
         Returns:
             SequentialMC
 
         """
-        super().__init__(model, updater=updater)
+        if tolerance is not None and updater != 'mean_field_iteration':
+            raise ValueError("a tolerance requires the mean_field_iteration updater")
+        super().__init__(model, updater=updater, num_particles=num_particles,
+                         num_updated=num_updated)
         if clamped is not None:
             self.clamped = clamped
+        self.tolerance = tolerance
+        self.damping = damping
+        self.max_iters = max_iters
+        self.iterations = None
 
     def update_state(self, steps, dropout_mask=None):
         """
@@ -105,6 +261,9 @@ class SequentialMC(Sampler):
 
         Notes:
             Modifies the state attribute in place.
+            If the sampler has a tolerance, the steps are ignored
+            and the iterations attribute holds the number of mean field
+            updates of each updated particle.
 
         Args:
             steps (int): the number of Monte Carlo steps
@@ -118,10 +277,19 @@ class SequentialMC(Sampler):
             raise AttributeError(
                 'You must call the initialize(self, array_or_shape)'
                 +' method to set the initial state of the Markov Chain')
+        index, state, dropout_mask = self._select_particles(dropout_mask)
         clamping = self.model.graph.clamped_sampling
         self.model.graph.set_clamped_sampling(self.clamped)
-        self.state = self.updater(steps, self.state, dropout_mask)
+        if self.tolerance is None:
+            self.updater_(steps, state, dropout_mask, buffers=self._buffers_for(state))
+        else:
+            solution, self.iterations = self.model.mean_field_solve(
+                state, dropout_mask, tolerance=self.tolerance,
+                damping=self.damping, max_iters=self.max_iters)
+            for u, s in zip(state.units, solution.units):
+                be.copy_tensor(s, out=u)
         self.model.graph.set_clamped_sampling(clamping)
+        self._store_particles(index)
 
     def state_for_grad(self, target_layer, dropout_mask=None):
         """
@@ -157,12 +325,14 @@ class SequentialMC(Sampler):
 
         """
         self.state = None
+        self.subset = None
 
 
 class DrivenSequentialMC(Sampler):
     """An accelerated sequential Monte Carlo sampler"""
     def __init__(self, model, clamped=None, updater='markov_chain', beta_momentum=0.9,
-                 beta_std=0.6, schedule=schedules.Constant(initial=1.0)):
+                 beta_std=0.6, schedule=schedules.Constant(initial=1.0),
+                 num_particles=None, num_updated=None):
         """
         Create a sequential Monte Carlo sampler.
 
@@ -171,12 +341,18 @@ class DrivenSequentialMC(Sampler):
             beta_momentum (float in [0,1]): autoregressive coefficient of beta
             beta_std (float > 0): the standard deviation of beta
             schedule (generator; optional)
+            num_particles (int; optional): the size of the particle pool
+                set from a batch, defaults to the batch size
+            num_updated (int; optional): the number of randomly chosen
+                particles updated per call to update_state,
+                defaults to all of them
 
         Returns:
             DrivenSequentialMC
 
         """
-        super().__init__(model, updater=updater)
+        super().__init__(model, updater=updater, num_particles=num_particles,
+                         num_updated=num_updated)
         if clamped is not None:
             self.clamped = clamped
 
@@ -222,9 +398,10 @@ class DrivenSequentialMC(Sampler):
 
         """
         nu, c = self._anneal()
-        if not self.has_beta:
+        beta_shape = (be.shape(self.state.units[0])[0], 1)
+        if not self.has_beta or self.beta_shape != beta_shape:
             self.has_beta = True
-            self.beta_shape = (be.shape(self.state.units[0])[0], 1)
+            self.beta_shape = beta_shape
             self.beta = self.gamma(nu, c/(1-self.phi), size=self.beta_shape)
         z = self.poisson(lam=self.beta * self.phi/c)
         self.beta = self.gamma(nu + z, c)
@@ -254,12 +431,19 @@ class DrivenSequentialMC(Sampler):
             raise AttributeError(
                 'You must call the initialize(self, array_or_shape)'
                 +' method to set the initial state of the Markov Chain')
+        index, state, dropout_mask = self._select_particles(dropout_mask)
+        clamping = self.model.graph.clamped_sampling
+        self.model.graph.set_clamped_sampling(self.clamped)
+        buffers = self._buffers_for(state)
         for _ in range(steps):
+            # every particle keeps its own beta process
             self._update_beta()
-            clamping = self.model.graph.clamped_sampling
-            self.model.graph.set_clamped_sampling(self.clamped)
-            self.state = self.updater(1, self.state, dropout_mask, beta=self._beta())
-            self.model.graph.set_clamped_sampling(clamping)
+            beta = self._beta()
+            if index is not None:
+                beta = be.index_select(beta, index)
+            self.updater_(1, state, dropout_mask, beta=beta, buffers=buffers)
+        self.model.graph.set_clamped_sampling(clamping)
+        self._store_particles(index)
 
     def state_for_grad(self, target_layer, dropout_mask=None):
         """
@@ -295,10 +479,599 @@ class DrivenSequentialMC(Sampler):
 
         """
         self.state = None
+        self.subset = None
         self.beta = None
         self.has_beta = False
 
 
+class ParallelTempering(Sampler):
+    """
+    Parallel tempering (replica exchange) sampler.
+
+    Runs chains at num_temperatures inverse temperatures
+    1 = beta_0 > beta_1 > ... > beta_{K-1} = min_beta
+    as a single stacked batch, using the beta argument of the updater.
+    After every step, neighboring temperatures propose to swap their
+    particles with the Metropolis acceptance probability
+    min(1, exp((beta_k - beta_{k+1}) * (E_k - E_{k+1}))),
+    computed from the joint energies of all chains at once.
+    The swaps alternate between the even and the odd pairs of temperatures.
+
+    The interior of the temperature ladder adapts to equalize the swap
+    acceptance rates between neighboring temperatures. The step size
+    of the adaptation decays as adapt_rate / (1 + t) after t adaptations,
+    so that the ladder settles and the chains sample from fixed
+    tempered distributions.
+
+    The state attribute holds the chains at beta = 1.
+    Every step updates all of the chains.
+
+    """
+    def __init__(self, model, num_temperatures=5, min_beta=0.25, clamped=None,
+                 updater='markov_chain', adapt_rate=0.05, acceptance_momentum=0.9,
+                 num_particles=None):
+        """
+        Create a parallel tempering sampler.
+
+        Args:
+            model: a model object
+            num_temperatures (int): the number of inverse temperatures
+            min_beta (float in (0,1)): the smallest inverse temperature
+            clamped (List[int]; optional): the clamped layers
+            updater (str; optional): how to update the particles
+            adapt_rate (float >= 0; optional): the initial step size of the
+                ladder adaptation, 0 keeps the initial geometric ladder
+            acceptance_momentum (float in [0,1]; optional): the autoregressive
+                coefficient of the running swap acceptance rates
+            num_particles (int; optional): the number of chains per temperature
+                set from a batch, defaults to the batch size
+
+        Returns:
+            ParallelTempering
+
+        """
+        super().__init__(model, updater=updater, num_particles=num_particles)
+        if clamped is not None:
+            self.clamped = clamped
+
+        self.num_temperatures = num_temperatures
+        self.min_beta = min_beta
+        self.adapt_rate = adapt_rate
+        self.acceptance_momentum = acceptance_momentum
+
+        # geometric ladder
+        self.betas = numpy.power(min_beta, numpy.linspace(0, 1, num_temperatures))
+        self.acceptance = numpy.ones(max(num_temperatures - 1, 0))
+        self.num_adaptations = 0
+        self.stacked_state = None
+        self.num_chains = None
+        self.num_swaps = 0
+
+    def set_state(self, state):
+        """
+        Set the state of the chains at every temperature.
+
+        Notes:
+            Modifies the state and stacked_state attributes in place.
+
+        Args:
+            state (State): The state of the units for each temperature.
+
+        Returns:
+            None
+
+        """
+        self.num_chains = be.shape(state.units[0])[0]
+        self.stacked_state = State([be.vstack([u] * self.num_temperatures)
+                                    for u in state.units])
+        self._set_cold_state()
+
+    def _set_cold_state(self):
+        """Point the state attribute at the chains with beta = 1."""
+        self.state = State([u[:self.num_chains]
+                            for u in self.stacked_state.units])
+
+    def _beta(self):
+        """Return the inverse temperature of every stacked chain."""
+        betas = numpy.repeat(self.betas, self.num_chains)
+        return be.float_tensor(betas.reshape(-1, 1))
+
+    def _swap(self):
+        """
+        Propose swaps of the particles between neighboring temperatures.
+
+        Notes:
+            Modifies the stacked_state and acceptance attributes in place.
+            Only the rows of the swapped particles are copied.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        K, N = self.num_temperatures, self.num_chains
+        lower = numpy.arange(self.num_swaps % 2, K - 1, 2)
+        self.num_swaps += 1
+        if len(lower) == 0:
+            return
+
+        energy = be.to_numpy_array(
+                self.model.joint_energy(self.stacked_state)).reshape(K, N)
+        log_ratio = (self.betas[lower] - self.betas[lower + 1])[:, None] \
+                    * (energy[lower] - energy[lower + 1])
+        accept = numpy.log(numpy.random.rand(len(lower), N)) < log_ratio
+
+        # running average of the acceptance probabilities
+        prob = numpy.exp(numpy.minimum(log_ratio, 0)).mean(axis=1)
+        self.acceptance[lower] = self.acceptance_momentum * self.acceptance[lower] \
+                                 + (1 - self.acceptance_momentum) * prob
+
+        if accept.any():
+            pair, chain = numpy.nonzero(accept)
+            rows = lower[pair] * N + chain
+            source = be.int_tensor(numpy.concatenate([rows + N, rows]))
+            target = be.int_tensor(numpy.concatenate([rows, rows + N]))
+            for u in self.stacked_state.units:
+                be.index_copy_(u, target, be.index_select(u, source))
+            # the units changed in place
+            self.stacked_state.clear_fields()
+
+    def _adapt_ladder(self):
+        """
+        Move the interior inverse temperatures to equalize the acceptance rates.
+        The gaps in log(beta) between pairs with high acceptance rates grow,
+        and those between pairs with low acceptance rates shrink.
+
+        Notes:
+            Modifies the betas and num_adaptations attributes in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        if self.adapt_rate == 0 or self.num_temperatures < 3:
+            return
+        # a decaying step size, for the chains to converge
+        rate = self.adapt_rate / (1 + self.num_adaptations)
+        self.num_adaptations += 1
+        log_gaps = numpy.diff(-numpy.log(self.betas))
+        log_gaps *= numpy.exp(rate * (self.acceptance - self.acceptance.mean()))
+        log_gaps *= -numpy.log(self.min_beta) / log_gaps.sum()
+        self.betas = numpy.exp(-numpy.concatenate([[0], numpy.cumsum(log_gaps)]))
+
+    def update_state(self, steps, dropout_mask=None):
+        """
+        Update the state of the particles.
+
+        Notes:
+            Modifies the state attribute in place.
+
+        Args:
+            steps (int): the number of Monte Carlo steps
+            dropout_mask (State object): mask on model units;
+                has to broadcast to the stacked chains
+
+        Returns:
+            None
+
+        """
+        if not self.state:
+            raise AttributeError(
+                'You must call the initialize(self, array_or_shape)'
+                +' method to set the initial state of the Markov Chain')
+        clamping = self.model.graph.clamped_sampling
+        self.model.graph.set_clamped_sampling(self.clamped)
+        buffers = self._buffers_for(self.stacked_state)
+        for _ in range(steps):
+            self.updater_(1, self.stacked_state, dropout_mask, beta=self._beta(),
+                          buffers=buffers)
+            self._swap()
+            self._adapt_ladder()
+        self.model.graph.set_clamped_sampling(clamping)
+        self._set_cold_state()
+
+    def state_for_grad(self, target_layer, dropout_mask=None):
+        """
+        Peform a mean field update of the target layer
+        of the chains with beta = 1.
+
+        Args:
+            target_layer (int): the layer to update
+            dropout_mask (State): mask on model units
+
+        Returns:
+            state
+
+        """
+        layer_list = range(self.model.num_layers)
+        clamping = self.model.graph.clamped_sampling
+        self.model.graph.set_clamped_sampling([i for i in layer_list if i != target_layer])
+        grad_state = self.model.mean_field_iteration(1, self.state, dropout_mask)
+        self.model.graph.set_clamped_sampling(clamping)
+        return grad_state
+
+    def reset(self):
+        """
+        Reset the sampler state.
+
+        Notes:
+            Modifies sampler.state attribute in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.state = None
+        self.stacked_state = None
+        self.num_chains = None
+
+
+def _share_params(model):
+    """
+    Allocate shared memory for the parameters of a model.
+
+    Args:
+        model: a Model object
+
+    Returns:
+        List[List[tuple]]: a (RawArray, dtype, shape) tuple for every
+            parameter of every layer and weight, followed by the multipliers
+
+    """
+    tensors = [list(obj.params) for obj in model.layers + model.weights]
+    tensors.append([model.multipliers])
+    shared = []
+    for group in tensors:
+        shared.append([])
+        for tensor in group:
+            array = be.to_numpy_array(tensor)
+            raw = multiprocessing.RawArray(
+                numpy.ctypeslib.as_ctypes_type(array.dtype), array.size)
+            shared[-1].append((raw, array.dtype, array.shape))
+    return shared
+
+def _shared_views(shared, writeable=False):
+    """
+    Get numpy views of the parameters in shared memory.
+
+    Args:
+        shared (List[List[tuple]]): from _share_params
+        writeable (bool): whether the views can be written to
+
+    Returns:
+        List[List[numpy.ndarray]]
+
+    """
+    views = []
+    for group in shared:
+        views.append([])
+        for raw, dtype, shape in group:
+            view = numpy.frombuffer(raw, dtype=dtype).reshape(shape)
+            view.flags.writeable = writeable
+            views[-1].append(view)
+    return views
+
+def _shard_worker(connection, config, shared, seed, updater):
+    """
+    Run the particles of one shard of a ShardedSampler.
+
+    Reads the model parameters from shared memory, and answers the
+    (command, args) requests from the connection with (success, result).
+
+    Args:
+        connection (multiprocessing.Connection)
+        config (dict): the configuration of the model
+        shared (List[List[tuple]]): from _share_params
+        seed (int): the seed of the random number generator
+        updater (str): how to update the particles
+
+    Returns:
+        None
+
+    """
+    be.set_seed(seed)
+    model = Model.from_config(config)
+    views = _shared_views(shared)
+    update_ = getattr(model, updater + '_')
+    state = None
+    buffers = None
+    while True:
+        command, args = connection.recv()
+        if command == 'close':
+            break
+        try:
+            result = None
+            if command == 'params':
+                # the parameters are read-only views of the shared memory
+                for obj, params in zip(model.layers + model.weights, views):
+                    obj.params = obj.params.__class__(*params)
+                model.multipliers = views[-1][0]
+                model.invalidate_caches()
+            elif command == 'set_state':
+                state = State(args)
+                buffers = SamplingBuffers.from_model(be.shape(state.units[0])[0], model)
+            elif command == 'update':
+                # the parameters may have changed in the shared memory
+                model.invalidate_caches()
+                steps, clamped, dropout_mask = args
+                model.graph.set_clamped_sampling(clamped)
+                update_(steps, state, dropout_mask, buffers=buffers)
+            elif command == 'derivatives':
+                model.invalidate_caches()
+                target_layer, dropout_mask = args
+                model.graph.set_clamped_sampling(
+                    [i for i in range(model.num_layers) if i != target_layer])
+                grad_state = model.mean_field_iteration(1, state, dropout_mask)
+                result = model.phase_derivatives(grad_state, dropout_mask,
+                                                 penalize=False)
+            elif command == 'get_state':
+                result = state.units
+            connection.send((True, result))
+        except Exception as error:
+            connection.send((False, error))
+    connection.close()
+
+class ShardedSampler(Sampler):
+    """
+    Sequential Monte Carlo sampler that splits its particles into
+    num_workers shards updated by worker processes.
+
+    Each worker holds a replica of the model whose parameters are read-only
+    views of shared memory. The sampler copies the parameters of the model
+    into the shared memory at each call to update_state, i.e., after each
+    optimizer update. The particles stay in the workers, and state_for_grad
+    gathers only the derivatives of the model parameters on each shard
+    (averages of the units and of their outer products), not the states.
+    So, state_for_grad returns a Gradient, which model.gradient accepts
+    in place of the sampled state.
+
+    Only supports the python backend.
+    The state attribute is None; use gather_state to get the particles.
+    Call close to stop the workers.
+
+    """
+    def __init__(self, model, num_workers=None, clamped=None,
+                 updater='markov_chain', num_particles=None):
+        """
+        Create a sharded sampler.
+
+        Args:
+            model: a model object
+            num_workers (int; optional): the number of worker processes,
+                defaults to the number of cores
+            clamped (List[int]; optional): the clamped layers
+            updater (str; optional): how to update the particles
+            num_particles (int; optional): the size of the particle pool
+                set from a batch, defaults to the batch size
+
+        Returns:
+            ShardedSampler
+
+        """
+        if be.config.BACKEND != 'python':
+            raise NotImplementedError(
+                "sharded sampling is only supported by the python backend")
+        super().__init__(model, updater=updater, num_particles=num_particles)
+        if clamped is not None:
+            self.clamped = clamped
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.shard_sizes = None
+        self.workers = []
+        self.connections = []
+        self.shared = None
+        self.shared_views = None
+
+    def _start(self):
+        """
+        Start the worker processes.
+
+        Notes:
+            Modifies the workers attributes in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.shared = _share_params(self.model)
+        self.shared_views = _shared_views(self.shared, writeable=True)
+        config = self.model.get_config()
+        seeds = numpy.random.randint(2**31, size=self.num_workers)
+        for seed in seeds:
+            parent, child = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_shard_worker,
+                args=(child, config, self.shared, int(seed), self.update_method),
+                daemon=True)
+            worker.start()
+            child.close()
+            self.workers.append(worker)
+            self.connections.append(parent)
+        self._broadcast('params')
+
+    def _broadcast(self, command, args=None):
+        """
+        Send a command to every worker and wait for the results.
+
+        Args:
+            command (str): the command
+            args (optional; list): the arguments for each worker
+
+        Returns:
+            list: the results of the workers
+
+        """
+        if args is None:
+            args = [None] * len(self.connections)
+        for connection, arg in zip(self.connections, args):
+            connection.send((command, arg))
+        results = [connection.recv() for connection in self.connections]
+        for success, result in results:
+            if not success:
+                raise result
+        return [result for success, result in results]
+
+    def _refresh_params(self):
+        """
+        Copy the model parameters into the shared memory.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        tensors = [list(obj.params) for obj in self.model.layers + self.model.weights]
+        tensors.append([self.model.multipliers])
+        for group, views in zip(tensors, self.shared_views):
+            for tensor, view in zip(group, views):
+                numpy.copyto(view, be.to_numpy_array(tensor))
+
+    def _shard_masks(self, dropout_mask):
+        """
+        Split a dropout mask with one row per particle across the shards.
+
+        Args:
+            dropout_mask (State; optional): mask on model units
+
+        Returns:
+            list: the mask for each shard
+
+        """
+        if dropout_mask is None or \
+            be.shape(dropout_mask.units[0])[0] != sum(self.shard_sizes) or \
+            sum(self.shard_sizes) == 1:
+            return [dropout_mask] * self.num_workers
+        bounds = numpy.cumsum([0] + self.shard_sizes)
+        return [State([m[bounds[k]:bounds[k+1]] for m in dropout_mask.units])
+                for k in range(self.num_workers)]
+
+    def set_state(self, state):
+        """
+        Split the state across the workers.
+
+        Notes:
+            Starts the workers if needed.
+
+        Args:
+            state (State): The state of the units.
+
+        Returns:
+            None
+
+        """
+        if not self.workers:
+            self._start()
+        num_samples = be.shape(state.units[0])[0]
+        if num_samples < self.num_workers:
+            raise ValueError("cannot split {} particles across {} workers"
+                             .format(num_samples, self.num_workers))
+        shards = [numpy.array_split(be.to_numpy_array(u), self.num_workers)
+                  for u in state.units]
+        self.shard_sizes = [len(s) for s in shards[0]]
+        self._broadcast('set_state',
+                        [[s[k] for s in shards] for k in range(self.num_workers)])
+
+    def update_state(self, steps, dropout_mask=None):
+        """
+        Update the state of the particles in every shard.
+
+        Notes:
+            Copies the model parameters into the shared memory.
+
+        Args:
+            steps (int): the number of Monte Carlo steps
+            dropout_mask (optional; State): mask on model units; 1=on, 0=dropped
+
+        Returns:
+            None
+
+        """
+        if self.shard_sizes is None:
+            raise AttributeError(
+                'You must call the initialize(self, array_or_shape)'
+                +' method to set the initial state of the Markov Chain')
+        self._refresh_params()
+        self._broadcast('update', [(steps, self.clamped, mask)
+                                   for mask in self._shard_masks(dropout_mask)])
+
+    def state_for_grad(self, target_layer, dropout_mask=None):
+        """
+        Peform a mean field update of the target layer in every shard, and
+        average the derivatives of the model parameters over the shards.
+
+        Args:
+            target_layer (int): the layer to update
+            dropout_mask (State): mask on model units
+
+        Returns:
+            Gradient: the derivatives of the negative phase
+
+        """
+        grads = self._broadcast('derivatives', [(target_layer, mask)
+                                for mask in self._shard_masks(dropout_mask)])
+        return gu.grad_weighted_mean(grads, self.shard_sizes)
+
+    def gather_state(self):
+        """
+        Collect the particles of every shard.
+
+        Args:
+            None
+
+        Returns:
+            State
+
+        """
+        shards = self._broadcast('get_state')
+        return State([be.vstack([s[i] for s in shards])
+                      for i in range(self.model.num_layers)])
+
+    def reset(self):
+        """
+        Reset the sampler state.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.shard_sizes = None
+
+    def close(self):
+        """
+        Stop the worker processes.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        for connection in self.connections:
+            connection.send(('close', None))
+            connection.close()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+        self.connections = []
+        self.shard_sizes = None
+
+
 class ProgressMonitor(object):
     """
     Monitor the progress of training by computing statistics on the
@@ -311,7 +1084,8 @@ class ProgressMonitor(object):
 
         Args:
             batch (int): the
-            metrics (list[str]): list of metrics to compute
+            metrics (list[str or metric]): list of metrics to compute,
+                by name or as metric objects (e.g., to set their arguments)
 
         Returns:
             ProgressMonitor
@@ -319,7 +1093,8 @@ class ProgressMonitor(object):
         """
         self.batch = batch
         self.update_steps = 10
-        self.metrics = [M.__getattribute__(m)() for m in metrics]
+        self.metrics = [M.__getattribute__(m)() if isinstance(m, str) else m
+                        for m in metrics]
         self.memory = []
 
     def check_progress(self, model, store=False, show=False):
@@ -342,7 +1117,7 @@ class ProgressMonitor(object):
 
         while True:
             try:
-                v_data = self.batch.get(mode='validate')
+                v_data = be.dense(self.batch.get(mode='validate'))
             except StopIteration:
                 break
 
@@ -459,20 +1234,59 @@ def persistent_contrastive_divergence(vdata, model, positive_phase, negative_pha
         gradient
 
     """
-    target_layer = model.num_layers - 1
+    grad_data_state = _positive_phase(vdata, model, positive_phase,
+                                      positive_dropout, steps)
+    grad_model_state, dropout_scale = _persistent_negative_phase(model,
+                                                                 negative_phase,
+                                                                 steps)
+    return model.gradient(grad_data_state, grad_model_state, positive_dropout, dropout_scale)
 
-    # compute the update of the positive phase
+def _positive_phase(vdata, model, positive_phase, positive_dropout=None, steps=1):
+    """
+    Compute the state of the positive phase of the gradient.
+
+    Notes:
+        Modifies the state of the sampler.
+
+    Args:
+        vdata (tensor): observed visible units
+        model: a model object
+        positive_phase: a sampler object
+        positive_dropout (State object): mask on model units for positive phase dropout
+         1: on 0: dropped-out
+        steps (int): the number of Monte Carlo steps
+
+    Returns:
+        State
+
+    """
     data_state = State.from_visible(vdata, model)
     positive_phase.set_state(data_state)
     positive_phase.update_state(steps, positive_dropout)
-    grad_data_state = positive_phase.state_for_grad(target_layer, positive_dropout)
+    return positive_phase.state_for_grad(model.num_layers - 1, positive_dropout)
+
+def _persistent_negative_phase(model, negative_phase, steps=1):
+    """
+    Compute the state of the negative phase of the gradient,
+    persisting the state of the sampler from the previous iteration.
+
+    Notes:
+        Modifies the state of the sampler.
+        Does not depend on the minibatch.
 
-    # PCD persists the state of the sampler from the previous iteration
+    Args:
+        model: a model object
+        negative_phase: a sampler object
+        steps (int): the number of Monte Carlo steps
+
+    Returns:
+        tuple (State, State): the state and the dropout scale
+
+    """
     dropout_scale = State.dropout_rescale(model)
     negative_phase.update_state(steps, dropout_scale)
-    grad_model_state = negative_phase.state_for_grad(target_layer, dropout_scale)
-
-    return model.gradient(grad_data_state, grad_model_state, positive_dropout, dropout_scale)
+    grad_model_state = negative_phase.state_for_grad(model.num_layers - 1, dropout_scale)
+    return grad_model_state, dropout_scale
 
 # alias
 pcd = persistent_contrastive_divergence
@@ -522,7 +1336,7 @@ def tap(vdata, model, positive_phase, negative_phase=None, steps=1, init_lr_EMF=
 class StochasticGradientDescent(object):
     """Stochastic gradient descent with minibatches"""
     def __init__(self, model, batch, optimizer, epochs, sampler, method=pcd,
-                 mcsteps=1, monitor=None):
+                 mcsteps=1, monitor=None, concurrent=False, positive_tolerance=None):
         """
         Create a StochasticGradientDescent object.
 
@@ -536,19 +1350,38 @@ class StochasticGradientDescent(object):
                                gradient [cd, pcd, tap]
             mcsteps (int, optional): the number of Monte Carlo steps per gradient
             monitor (optional): a progress monitor
+            concurrent (bool, optional): compute the negative phase on a
+                worker thread while the main thread computes the positive phase.
+                Only for pcd, whose negative phase does not depend on the
+                minibatch. The random numbers of the two phases interleave,
+                so runs are not reproducible from a seed.
+            positive_tolerance (float, optional): if set, the positive phase
+                iterates the mean field updates of the hidden units until they
+                converge to this tolerance, instead of taking mcsteps steps
+                with the updater of the sampler.
 
         Returns:
             StochasticGradientDescent
 
         """
+        if concurrent and method is not pcd:
+            raise ValueError("concurrent phases are only supported for pcd")
+
         self.model = model
         self.batch = batch
         self.epochs = epochs
         self.grad_approx = method
-
-        self.positive_phase = SequentialMC.from_batch(model, batch,
-                                                      updater=sampler.update_method,
-                                                      clamped=[0])
+        self.concurrent = concurrent
+
+        if positive_tolerance is None:
+            self.positive_phase = SequentialMC.from_batch(model, batch,
+                                                          updater=sampler.update_method,
+                                                          clamped=[0])
+        else:
+            self.positive_phase = SequentialMC.from_batch(model, batch,
+                                                          updater='mean_field_iteration',
+                                                          clamped=[0],
+                                                          tolerance=positive_tolerance)
         self.negative_phase = sampler
 
         self.mcsteps = mcsteps
@@ -573,24 +1406,10 @@ class StochasticGradientDescent(object):
             start_time = time.time()
             self.optimizer.update_lr()
 
-            while True:
-                try:
-                    v_data = self.batch.get(mode='train')
-                except StopIteration:
-                    break
-
-                # the dropout mask is fixed for each batch
-                self.optimizer.update(
-                    self.model,
-                    self.grad_approx(
-                        v_data,
-                        self.model,
-                        self.positive_phase,
-                        self.negative_phase,
-                        positive_dropout=State.dropout_mask(self.model, be.shape(v_data)[0]),
-                        steps=self.mcsteps
-                    )
-                )
+            if self.concurrent:
+                self._train_epoch_concurrent()
+            else:
+                self._train_epoch()
 
             # end of epoch processing
             print('End of epoch {}: '.format(epoch))
@@ -609,6 +1428,85 @@ class StochasticGradientDescent(object):
 
         return None
 
+    def _train_epoch(self):
+        """
+        Train the model for one epoch.
+
+        Notes:
+            Updates the model parameters in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        while True:
+            try:
+                v_data = self.batch.get(mode='train')
+            except StopIteration:
+                break
+
+            # the dropout mask is fixed for each batch
+            self.optimizer.update(
+                self.model,
+                self.grad_approx(
+                    v_data,
+                    self.model,
+                    self.positive_phase,
+                    self.negative_phase,
+                    positive_dropout=State.dropout_mask(self.model, be.shape(v_data)[0]),
+                    steps=self.mcsteps
+                )
+            )
+
+    def _train_epoch_concurrent(self):
+        """
+        Train the model for one epoch with pcd,
+        computing the negative phase on a worker thread.
+
+        Both phases only read the model parameters. The main thread waits for
+        the negative phase before computing the gradient and updating the
+        parameters, and the next negative phase starts after the update.
+
+        Notes:
+            Updates the model parameters in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        with ThreadPoolExecutor(max_workers=1) as worker:
+            while True:
+                try:
+                    v_data = self.batch.get(mode='train')
+                except StopIteration:
+                    break
+
+                negative = worker.submit(_persistent_negative_phase, self.model,
+                                         self.negative_phase, self.mcsteps)
+
+                # the dropout mask is fixed for each batch
+                positive_dropout = State.dropout_mask(self.model, be.shape(v_data)[0])
+                try:
+                    grad_data_state = _positive_phase(v_data, self.model,
+                                                      self.positive_phase,
+                                                      positive_dropout,
+                                                      self.mcsteps)
+                finally:
+                    # wait for the negative phase before touching the parameters
+                    grad_model_state, dropout_scale = negative.result()
+
+                self.optimizer.update(
+                    self.model,
+                    self.model.gradient(grad_data_state, grad_model_state,
+                                        positive_dropout, dropout_scale)
+                )
+
 # alias
 sgd = SGD = StochasticGradientDescent
 
@@ -700,6 +1598,7 @@ class LayerwisePretrain(object):
             else:
                 # halve the weights of the other layers
                 self.model.weights[i].params.matrix[:] = 0.5 * submodels[i].weights[0].W()
+        self.model.invalidate_caches()
 
     def train(self):
         """
@@ -90,7 +90,7 @@ class BernoulliLayer(Layer):
         tmp = be.clip(magnetization.mean,  a_min=a_min, a_max=a_max)
         return self.get_magnetization(tmp)
 
-    def log_partition_function(self, external_field, quadratic_field):
+    def log_partition_function(self, external_field, quadratic_field=None):
         """
         Compute the logarithm of the partition function of the layer
         with external field (B) and quadratic field (A).
@@ -106,12 +106,15 @@ class BernoulliLayer(Layer):
 
         Args:
             external_field (tensor (num_samples, num_units)): external field
-            quadratic_field (tensor (num_samples, num_units)): quadratic field
+            quadratic_field (tensor (num_samples, num_units); optional):
+                quadratic field, defaults to zero
 
         Returns:
             logZ (tensor (num_samples, num_units)): log partition function
 
         """
+        if quadratic_field is None:
+            return be.softplus(be.add(self.params.loc, external_field))
         return be.softplus(be.add(self.params.loc, be.subtract(quadratic_field, external_field)))
 
     def grad_log_partition_function(self, external_field, quadratic_field):
@@ -246,6 +249,27 @@ class BernoulliLayer(Layer):
         self.moments.update(units, axis=0)
         self.set_params(ParamsBernoulli(be.logit(self.moments.mean)))
 
+    def moments_param_update(self, moments):
+        """
+        Update the parameters using precomputed moments of the data
+        (e.g., cached statistics of the dataset).
+        Used for initializing the layer parameters.
+
+        Notes:
+            Modifies layer.params in place.
+
+        Args:
+            moments: an object with num, mean, and var attributes
+                (e.g., a MeanVarianceArrayCalculator or DataStatistics)
+
+        Returns:
+            None
+
+        """
+        self.moments.num = moments.num
+        self.moments.mean = be.float_tensor(moments.mean)
+        self.set_params(ParamsBernoulli(be.logit(self.moments.mean)))
+
     def shrink_parameters(self, shrinkage=1):
         """
         Apply shrinkage to the parameters of the layer.
@@ -273,6 +297,23 @@ class BernoulliLayer(Layer):
         """
         return observations
 
+    def rescale_(self, observations):
+        """
+        Rescale is trivial for the Bernoulli layer.
+
+        Notes:
+            Modifies observations in place.
+
+        Args:
+            observations (tensor (num_samples, num_units)):
+                Values of the observed units.
+
+        Returns:
+            None
+
+        """
+        pass
+
     def derivatives(self, units, connected_units, connected_weights, penalize=True):
         """
         Compute the derivatives of the layer parameters.
@@ -320,7 +361,7 @@ class BernoulliLayer(Layer):
         """
         return [be.apply(be.rand_like, self.params)]
 
-    def _conditional_params(self, scaled_units, weights, beta=None):
+    def _conditional_params(self, scaled_units, weights, beta=None, out=None):
         """
         Compute the parameters of the layer conditioned on the state
         of the connected layers.
@@ -332,21 +373,23 @@ class BernoulliLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
 
         Returns:
             tensor: conditional parameters
 
         """
         assert(len(scaled_units) == len(weights))
-        field = be.dot(scaled_units[0], weights[0])
+        field = be.dot(scaled_units[0], weights[0], out=out)
         for i in range(1, len(weights)):
             field += be.dot(scaled_units[i], weights[i])
         field += self.params.loc
         if beta is not None:
-            field = be.multiply(beta, field)
+            be.multiply_(beta, field)
         return field
 
-    def conditional_mode(self, scaled_units, weights, beta=None):
+    def conditional_mode(self, scaled_units, weights, beta=None, out=None):
         """
         Compute the mode of the distribution conditioned on the state
         of the connected layers.
@@ -358,15 +401,19 @@ class BernoulliLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
 
         Returns:
             tensor (num_samples, num_units): The mode of the distribution
 
         """
-        field = self._conditional_params(scaled_units, weights, beta)
-        return be.float_tensor(field > 0.0)
+        field = self._conditional_params(scaled_units, weights, beta, out=out)
+        if out is None:
+            return be.float_tensor(field > 0.0)
+        return be.greater(field, 0.0, out=out)
 
-    def conditional_mean(self, scaled_units, weights, beta=None):
+    def conditional_mean(self, scaled_units, weights, beta=None, out=None):
         """
         Compute the mean of the distribution conditioned on the state
         of the connected layers.
@@ -378,15 +425,18 @@ class BernoulliLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
 
         Returns:
             tensor (num_samples, num_units): The mean of the distribution.
 
         """
-        field = self._conditional_params(scaled_units, weights, beta)
-        return be.expit(field)
+        field = self._conditional_params(scaled_units, weights, beta, out=out)
+        return be.expit(field, out=field)
 
-    def conditional_sample(self, scaled_units, weights, beta=None):
+    def conditional_sample(self, scaled_units, weights, beta=None, out=None,
+                           scratch=None):
         """
         Draw a random sample from the disribution conditioned on the state
         of the connected layers.
@@ -398,15 +448,21 @@ class BernoulliLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
+            scratch (tensor (num_samples, num_units), optional):
+                A tensor to store the random numbers in.
 
         Returns:
             tensor (num_samples, num_units): Sampled units.
 
         """
-        field = self._conditional_params(scaled_units, weights, beta)
-        p = be.expit(field)
-        r = self.rand(be.shape(p))
-        return be.float_tensor(r < p)
+        field = self._conditional_params(scaled_units, weights, beta, out=out)
+        p = be.expit(field, out=field)
+        r = self.rand(be.shape(p), out=scratch)
+        if out is None:
+            return be.float_tensor(r < p)
+        return be.lesser(r, p, out=out)
 
     def random(self, array_or_shape):
         """
@@ -431,7 +487,7 @@ class BernoulliLayer(Layer):
             shape = array_or_shape
 
         r = self.rand(shape)
-        p = be.expit(self.params.loc)
+        p = self.cached('mean', lambda: be.expit(self.params.loc))
         return be.float_tensor(r < p)
 
     def onehot(self, n):
@@ -6,11 +6,16 @@ from .layer import Layer, CumulantsTAP
 
 ParamsGaussian = namedtuple("ParamsGaussian", ["loc", "log_var"])
 
+LOG_2PI = 1.8378770664093453
+
 class GaussianLayer(Layer):
     """
     Layer with Gaussian units.
 
     """
+    # the derivatives of the variance use the field from the connected layers
+    uses_connected_field = True
+
     def __init__(self, num_units, dropout_p=0.0):
         """
         Create a layer with Gaussian units.
@@ -180,6 +185,38 @@ class GaussianLayer(Layer):
     # Methods for sampling and sample-based training
     #
 
+    def _var(self):
+        """
+        Get the variance of the units, exp(log_var).
+
+        Notes:
+            Cached until the parameters change. Do not modify it in place.
+
+        Args:
+            None
+
+        Returns:
+            tensor (num_units,): the variance
+
+        """
+        return self.cached('var', lambda: be.exp(self.params.log_var))
+
+    def _std(self):
+        """
+        Get the standard deviation of the units, exp(log_var / 2).
+
+        Notes:
+            Cached until the parameters change. Do not modify it in place.
+
+        Args:
+            None
+
+        Returns:
+            tensor (num_units,): the standard deviation
+
+        """
+        return self.cached('std', lambda: be.exp(0.5 * self.params.log_var))
+
     def energy(self, units):
         """
         Compute the energy of the Gaussian layer.
@@ -194,10 +231,10 @@ class GaussianLayer(Layer):
             tensor (num_samples,): energy per sample
 
         """
-        scale = be.exp(self.params.log_var)
-        diff = units - self.params.loc
+        scale = self._var()
+        diff = be.dense(units) - self.params.loc
         result = be.square(diff) / scale
-        return 0.5 * be.mean(result, axis=1)
+        return 0.5 * be.tsum(result, axis=1)
 
     def log_partition_function(self, external_field):
        """
@@ -210,7 +247,7 @@ class GaussianLayer(Layer):
        Z_i = \int d x_i exp( -(x_i - u_i)^2 / (2 s_i^2) + \phi_i x_i)
        = exp(b_i u_i + b_i^2 s_i^2 / 2) sqrt(2 pi) s_i
 
-       log(Z_i) = log(s_i) + phi_i u_i + phi_i^2 s_i^2 / 2
+       log(Z_i) = log(sqrt(2 pi) s_i) + phi_i u_i + phi_i^2 s_i^2 / 2
 
        Args:
            external_field (tensor (num_samples, num_units)z0: external field
@@ -219,10 +256,10 @@ class GaussianLayer(Layer):
            logZ (tensor, (num_samples, num_units)): log partition function
 
        """
-       variance = be.exp(self.params.log_var)
+       variance = self._var()
        logZ = be.multiply(self.params.loc, external_field)
        logZ += be.multiply(variance, be.square(external_field)) / 2
-       logZ += be.log(variance) / 2
+       logZ += (self.params.log_var + LOG_2PI) / 2
        return logZ
 
     def online_param_update(self, units):
@@ -243,6 +280,29 @@ class GaussianLayer(Layer):
         self.moments.update(units)
         self.set_params(ParamsGaussian(self.moments.mean, be.log(self.moments.var)))
 
+    def moments_param_update(self, moments):
+        """
+        Update the parameters using precomputed moments of the data
+        (e.g., cached statistics of the dataset).
+        Used for initializing the layer parameters.
+
+        Notes:
+            Modifies layer.params in place.
+
+        Args:
+            moments: an object with num, mean, and var attributes
+                (e.g., a MeanVarianceArrayCalculator or DataStatistics)
+
+        Returns:
+            None
+
+        """
+        self.moments.num = moments.num
+        self.moments.mean = be.float_tensor(moments.mean)
+        self.moments.var = be.float_tensor(moments.var)
+        self.moments.square = self.moments.var * max(moments.num - 1, 1)
+        self.set_params(ParamsGaussian(self.moments.mean, be.log(self.moments.var)))
+
     def shrink_parameters(self, shrinkage=0.1):
         """
         Apply shrinkage to the variance parameters of the layer.
@@ -277,10 +337,29 @@ class GaussianLayer(Layer):
             tensor: Rescaled observations
 
         """
-        scale = be.exp(self.params.log_var)
-        return be.divide(scale, observations)
+        return be.divide(self._var(), be.dense(observations))
+
+    def rescale_(self, observations):
+        """
+        Scale the observations by the variance of the layer.
+
+        v'_i = v_i / var_i
+
+        Notes:
+            Modifies observations in place.
+
+        Args:
+            observations (tensor (num_samples, num_units)):
+                Values of the observed units.
+
+        Returns:
+            None
+
+        """
+        be.divide_(self._var(), observations)
 
-    def derivatives(self, units, connected_units, connected_weights, penalize=True):
+    def derivatives(self, units, connected_units, connected_weights, penalize=True,
+                    field=None):
         """
         Compute the derivatives of the layer parameters.
 
@@ -291,11 +370,19 @@ class GaussianLayer(Layer):
                 The rescaled values of the connected units.
             connected_weights list[tensor, (num_connected_units, num_units)]:
                 The weights connecting the layers.
+            penalize (bool): whether to add the penalties to the derivatives
+            field (tensor (num_samples, num_units), optional):
+                The field from the connected layers, sum_i dot(connected_units[i],
+                connected_weights[i]), if it is already known.
+                Then, the connected units and weights are not used.
 
         Returns:
             grad (namedtuple): param_name: tensor (contains gradient)
 
         """
+        # the derivatives need dense units
+        units = be.dense(units)
+
         # initialize tensors for the location and scale derivatives
         loc = be.zeros(self.len),
         log_var = be.zeros(self.len)
@@ -310,8 +397,11 @@ class GaussianLayer(Layer):
         # compute the derivative with respect to the scale parameter
         log_var = -0.5 * be.mean(be.square(be.subtract(
             self.params.loc, units)), axis=0)
-        for i in range(len(connected_units)):
-            log_var += be.batch_dot(connected_units[i], connected_weights[i], units, axis=0) / len(units)
+        if field is not None:
+            log_var += be.mean(be.multiply(field, units), axis=0)
+        else:
+            for i in range(len(connected_units)):
+                log_var += be.batch_dot(connected_units[i], connected_weights[i], units, axis=0) / len(units)
         log_var = self.rescale(log_var)
 
         if penalize:
@@ -346,7 +436,33 @@ class GaussianLayer(Layer):
         """
         return [be.apply(be.rand_like, self.params)]
 
-    def _conditional_params(self, scaled_units, weights, beta=None):
+    def _conditional_mean(self, scaled_units, weights, out=None, field=None):
+        """
+        Compute the mean of the layer conditioned on the state
+        of the connected layers, which does not depend on the temperature.
+
+        Args:
+            scaled_units list[tensor (num_samples, num_connected_units)]:
+                The rescaled values of the connected units.
+            weights list[tensor (num_connected_units, num_units)]:
+                The weights connecting the layers.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
+            field (tensor (num_samples, num_units), optional):
+                A tensor to store the field from the connected layers in.
+
+        Returns:
+            tensor: conditional mean
+
+        """
+        total = be.dot(scaled_units[0], weights[0], out=out if field is None else field)
+        for i in range(1, len(weights)):
+            total += be.dot(scaled_units[i], weights[i])
+        mean = total if field is None else be.copy_tensor(field, out=out)
+        mean += self.params.loc
+        return mean
+
+    def _conditional_params(self, scaled_units, weights, beta=None, field=None):
         """
         Compute the parameters of the layer conditioned on the state
         of the connected layers.
@@ -358,21 +474,20 @@ class GaussianLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            field (tensor (num_samples, num_units), optional):
+                A tensor to store the field from the connected layers in.
 
         Returns:
             tuple (tensor, tensor): conditional parameters
 
         """
-        mean = be.dot(scaled_units[0], weights[0])
-        for i in range(1, len(weights)):
-            mean += be.dot(scaled_units[i], weights[i])
-        mean += self.params.loc
-        var = be.broadcast(be.exp(self.params.log_var), mean)
+        mean = self._conditional_mean(scaled_units, weights, field=field)
+        var = be.broadcast(self._var(), mean)
         if beta is not None:
             var = be.divide(beta, var)
         return mean, var
 
-    def conditional_mode(self, scaled_units, weights, beta=None):
+    def conditional_mode(self, scaled_units, weights, beta=None, out=None, field=None):
         """
         Compute the mode of the distribution conditioned on the state
         of the connected layers. For a Gaussian layer, the mode equals
@@ -385,15 +500,18 @@ class GaussianLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
+            field (tensor (num_samples, num_units), optional):
+                A tensor to store the field from the connected layers in.
 
         Returns:
             tensor (num_samples, num_units): The mode of the distribution
 
         """
-        mean, var = self._conditional_params(scaled_units, weights, beta)
-        return mean
+        return self._conditional_mean(scaled_units, weights, out=out, field=field)
 
-    def conditional_mean(self, scaled_units, weights, beta=None):
+    def conditional_mean(self, scaled_units, weights, beta=None, out=None, field=None):
         """
         Compute the mean of the distribution conditioned on the state
         of the connected layers.
@@ -405,15 +523,19 @@ class GaussianLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
+            field (tensor (num_samples, num_units), optional):
+                A tensor to store the field from the connected layers in.
 
         Returns:
             tensor (num_samples, num_units): The mean of the distribution.
 
         """
-        mean, var = self._conditional_params(scaled_units, weights, beta)
-        return mean
+        return self._conditional_mean(scaled_units, weights, out=out, field=field)
 
-    def conditional_sample(self, scaled_units, weights, beta=None):
+    def conditional_sample(self, scaled_units, weights, beta=None, out=None,
+                           scratch=None, field=None):
         """
         Draw a random sample from the disribution conditioned on the state
         of the connected layers.
@@ -425,14 +547,30 @@ class GaussianLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
+            scratch (tensor (num_samples, num_units), optional):
+                A tensor to store the random numbers in.
+            field (tensor (num_samples, num_units), optional):
+                A tensor to store the field from the connected layers in.
 
         Returns:
             tensor (num_samples, num_units): Sampled units.
 
         """
-        mean, var = self._conditional_params(scaled_units, weights, beta)
-        r = be.float_tensor(self.rand(be.shape(mean)))
-        return mean + be.sqrt(var)*r
+        if out is None:
+            mean, var = self._conditional_params(scaled_units, weights, beta, field=field)
+            r = be.float_tensor(self.rand(be.shape(mean)))
+            return mean + be.sqrt(var)*r
+        mean = self._conditional_mean(scaled_units, weights, out=out, field=field)
+        # scale the noise by the standard deviation without a (num_samples,
+        # num_units) variance tensor
+        r = self.rand(be.shape(mean), out=scratch)
+        be.multiply_(self._std(), r)
+        if beta is not None:
+            be.divide_(be.sqrt(beta), r)
+        be.add_(r, mean)
+        return mean
 
     def random(self, array_or_shape):
         """
@@ -456,11 +594,8 @@ class GaussianLayer(Layer):
         except Exception:
             shape = array_or_shape
 
-        mean = self.params.loc
-        var = be.exp(self.params.log_var)
         r = self.rand(shape)
-
-        return be.add(mean, be.multiply(be.sqrt(var), r))
+        return be.add(self.params.loc, be.multiply(self._std(), r))
 
     def onehot(self, n):
         """
@@ -474,5 +609,4 @@ class GaussianLayer(Layer):
             tensor (n, n)
 
         """
-        std = be.sqrt(be.exp(self.params.log_var))
-        return be.diagonal_matrix(3*std)
+        return be.diagonal_matrix(3*self._std())
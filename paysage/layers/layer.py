@@ -12,11 +12,64 @@ CumulantsTAP = namedtuple("CumulantsTAP", ["mean", "variance"])
 # Params type must be redefined for all Layers
 ParamsLayer = namedtuple("Params", [])
 
-class Layer(object):
+class ParamCache(object):
+    """
+    A mixin for objects with parameters (i.e., layers and weights)
+    that caches quantities derived from the parameters.
+
+    """
+    def cached(self, name, func):
+        """
+        Get a quantity derived from the parameters, computing it only
+        if the parameters have changed since it was last computed.
+
+        Notes:
+            The cache is cleared by set_params, parameter_step, load_params,
+            and enforce_constraints. Call clear_cache after modifying
+            the params in place in any other way.
+            The cached tensors are shared, so do not modify them in place.
+
+        Args:
+            name (str): the name of the quantity
+            func (callable): computes the quantity from the parameters
+
+        Returns:
+            the quantity
+
+        """
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = func()
+            return value
+
+    def clear_cache(self):
+        """
+        Discard the quantities derived from the parameters.
+
+        Notes:
+            Modifies the _cache attribute in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self._cache = {}
+
+
+class Layer(ParamCache):
     """
     A general layer class with common functionality.
 
     """
+    # whether the derivatives can use the field from the connected layers,
+    # which the conditional methods can store for reuse (see their field
+    # argument); layers that set it must accept the field argument
+    uses_connected_field = False
+
     def __init__(self, num_units, dropout_p, *args, **kwargs):
         """
         Basic layer initialization method.
@@ -40,6 +93,8 @@ class Layer(object):
         self.len = num_units
         self.fixed_params = []
         self.moments = None
+        # quantities derived from the params, e.g., the variance
+        self._cache = {}
 
     def set_fixed_params(self, fixed_params):
         """
@@ -88,6 +143,7 @@ class Layer(object):
         """
         for i in self._get_trainable_indices():
             self.params[i][:] = new_params[i]
+        self.clear_cache()
 
     def use_dropout(self):
         """
@@ -238,6 +294,7 @@ class Layer(object):
         """
         for param_name in self.constraints:
             self.constraints[param_name](getattr(self.params, param_name))
+        self.clear_cache()
 
     def add_penalty(self, penalty):
         """
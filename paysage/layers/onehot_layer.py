@@ -14,7 +14,6 @@ class OneHotLayer(Layer):
     Dropout is unused.
 
     """
-
     def __init__(self, num_units, dropout_p=0):
         """
         Create a layer with 1-hot units.
@@ -93,20 +92,33 @@ class OneHotLayer(Layer):
         """
         raise NotImplementedError
 
-    def log_partition_function(self, external_field, quadratic_field):
+    def log_partition_function(self, external_field, quadratic_field=None):
         """
         Compute the logarithm of the partition function of the layer
         with external field (B) and quadratic field (A).
 
+        Let a_i be the loc parameter of unit i.
+        Let B_i be an external field
+        Let A_i be a quadratic field
+
+        Exactly one unit is on, so x_i^2 = x_i and
+        Z = Tr_{x} exp( \sum_i a_i x_i + B_i x_i - A_i x_i^2)
+        = \sum_i exp(a_i + B_i - A_i)
+
         Args:
             external_field (tensor (num_samples, num_units)): external field
-            quadratic_field (tensor (num_samples, num_units)): quadratic field
+            quadratic_field (tensor (num_samples, num_units); optional):
+                quadratic field, defaults to zero
 
         Returns:
-            logZ (tensor (num_samples, num_units)): log partition function
+            logZ (tensor (num_samples, 1)): log partition function
+                of the whole layer, which is a single 1-hot variable
 
         """
-        raise NotImplementedError
+        field = be.add(self.params.loc, external_field)
+        if quadratic_field is not None:
+            field = be.subtract(quadratic_field, field)
+        return be.logsumexp(field, axis=1, keepdims=True)
 
     def grad_log_partition_function(self, external_field, quadratic_field):
         """
@@ -219,6 +231,27 @@ class OneHotLayer(Layer):
         self.moments.update(units, axis=0)
         self.set_params(ParamsOneHot(be.log(self.moments.mean)))
 
+    def moments_param_update(self, moments):
+        """
+        Update the parameters using precomputed moments of the data
+        (e.g., cached statistics of the dataset).
+        Used for initializing the layer parameters.
+
+        Notes:
+            Modifies layer.params in place.
+
+        Args:
+            moments: an object with num, mean, and var attributes
+                (e.g., a MeanVarianceArrayCalculator or DataStatistics)
+
+        Returns:
+            None
+
+        """
+        self.moments.num = moments.num
+        self.moments.mean = be.float_tensor(moments.mean)
+        self.set_params(ParamsOneHot(be.log(self.moments.mean)))
+
     def shrink_parameters(self, shrinkage=1):
         """
         Apply shrinkage to the parameters of the layer.
@@ -247,6 +280,23 @@ class OneHotLayer(Layer):
         """
         return observations
 
+    def rescale_(self, observations):
+        """
+        Rescale is trivial on the 1-hot layer.
+
+        Notes:
+            Modifies observations in place.
+
+        Args:
+            observations (tensor (num_samples, num_units)):
+                Values of the observed units.
+
+        Returns:
+            None
+
+        """
+        pass
+
     def derivatives(self, units, connected_units, connected_weights, penalize=True):
         """
         Compute the derivatives of the layer parameters.
@@ -294,7 +344,7 @@ class OneHotLayer(Layer):
         """
         return [be.apply(be.rand_like, self.params)]
 
-    def _conditional_params(self, scaled_units, weights, beta=None):
+    def _conditional_params(self, scaled_units, weights, beta=None, out=None):
         """
         Compute the parameters of the layer conditioned on the state
         of the connected layers.
@@ -306,12 +356,14 @@ class OneHotLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
 
         Returns:
             tensor: conditional parameters
 
         """
-        field = be.dot(scaled_units[0], weights[0])
+        field = be.dot(scaled_units[0], weights[0], out=out)
         for i in range(1, len(weights)):
             field += be.dot(scaled_units[i], weights[i])
         if beta is not None:
@@ -319,7 +371,7 @@ class OneHotLayer(Layer):
         field += self.params.loc
         return field
 
-    def conditional_mode(self, scaled_units, weights, beta=None):
+    def conditional_mode(self, scaled_units, weights, beta=None, out=None):
         """
         Compute the mode of the distribution conditioned on the state
         of the connected layers.
@@ -331,21 +383,25 @@ class OneHotLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
 
         Returns:
             tensor (num_samples, num_units): The mode of the distribution
 
         """
-        # compute the softmax probabilities
-        field = self._conditional_params(scaled_units, weights, beta)
-        probs = be.softmax(field)
-        # find the modes
-        on_units = be.argmax(probs, axis=1)
-        units = be.zeros_like(field)
+        # the softmax is monotonic, so the modes maximize the field
+        field = self._conditional_params(scaled_units, weights, beta, out=out)
+        on_units = be.argmax(field, axis=1)
+        if out is None:
+            units = be.zeros_like(field)
+        else:
+            units = out
+            units[:] = 0.
         be.scatter_(units, on_units, 1.)
         return units
 
-    def conditional_mean(self, scaled_units, weights, beta=None):
+    def conditional_mean(self, scaled_units, weights, beta=None, out=None):
         """
         Compute the mean of the distribution conditioned on the state
         of the connected layers.
@@ -357,15 +413,20 @@ class OneHotLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
 
         Returns:
             tensor (num_samples, num_units): The mean of the distribution.
 
         """
-        field = self._conditional_params(scaled_units, weights, beta)
-        return be.softmax(field)
+        field = self._conditional_params(scaled_units, weights, beta, out=out)
+        if out is None:
+            return be.softmax(field)
+        return be.copy_tensor(be.softmax(field), out=out)
 
-    def conditional_sample(self, scaled_units, weights, beta=None):
+    def conditional_sample(self, scaled_units, weights, beta=None, out=None,
+                           scratch=None):
         """
         Draw a random sample from the disribution conditioned on the state
         of the connected layers.
@@ -377,13 +438,19 @@ class OneHotLayer(Layer):
                 The weights connecting the layers.
             beta (tensor (num_samples, 1), optional):
                 Inverse temperatures.
+            out (tensor (num_samples, num_units), optional):
+                A tensor to store the result in.
+            scratch (tensor (num_samples, num_units), optional):
+                Unused by the 1-hot layer.
 
         Returns:
             tensor (num_samples, num_units): Sampled units.
 
         """
-        field = self._conditional_params(scaled_units, weights, beta)
-        return self.rand(field)
+        field = self._conditional_params(scaled_units, weights, beta, out=out)
+        if out is None:
+            return self.rand(field)
+        return be.copy_tensor(self.rand(field), out=out)
 
     def random(self, array_or_shape):
         """
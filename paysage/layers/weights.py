@@ -5,6 +5,7 @@ import pandas
 from .. import penalties
 from .. import constraints
 from .. import backends as be
+from .layer import ParamCache
 
 
 def weights_from_config(config):
@@ -24,7 +25,7 @@ def weights_from_config(config):
 
 ParamsWeights = namedtuple("ParamsWeights", ["matrix"])
 
-class Weights(object):
+class Weights(ParamCache):
     """
     Layer class for weights.
 
@@ -52,6 +53,8 @@ class Weights(object):
         # these attributes are mutable (their keys do change)
         self.penalties = OrderedDict()
         self.constraints = OrderedDict()
+        # quantities derived from the params
+        self._cache = {}
 
     def get_config(self):
         """
@@ -133,7 +136,7 @@ class Weights(object):
             params.append(be.float_tensor(
                 store.get(os.path.join(key, 'parameters', 'key'+str(i))).as_matrix()
             ).squeeze()) # collapse trivial dimensions to a vector
-        self.params = self.params.__class__(*params)
+        self.set_params(self.params.__class__(*params))
 
     def add_constraint(self, constraint):
         """
@@ -167,6 +170,7 @@ class Weights(object):
         """
         for param_name in self.constraints:
             self.constraints[param_name](getattr(self.params, param_name))
+        self.clear_cache()
 
     def add_penalty(self, penalty):
         """
@@ -224,6 +228,24 @@ class Weights(object):
             return deriv + self.penalties[param_name].grad(
                     getattr(self.params, param_name))
 
+    def set_params(self, new_params):
+        """
+        Set the value of the layer params attribute.
+
+        Notes:
+            Modifies layer.params in place.
+
+        Args:
+            new_params (namedtuple)
+
+        Returns:
+            None
+
+        """
+        for i in range(len(self.params)):
+            self.params[i][:] = be.reshape(new_params[i], be.shape(self.params[i]))
+        self.clear_cache()
+
     def parameter_step(self, deltas):
         """
         Update the values of the parameters:
@@ -240,7 +262,7 @@ class Weights(object):
             None
 
         """
-        self.params = be.mapzip(be.subtract, deltas[0], self.params)
+        be.mapzip_(be.subtract_, deltas[0], self.params)
         self.enforce_constraints()
 
     def W(self):
@@ -290,11 +312,46 @@ class Weights(object):
             derivs (List[namedtuple]): List['matrix': tensor] (contains gradient)
 
         """
-        tmp = -be.batch_outer(units_target, units_domain) / len(units_target)
+        tmp = -be.batch_outer(units_target, units_domain) / be.shape(units_target)[0]
         if penalize:
             tmp = self.get_penalty_grad(tmp, "matrix")
         return [ParamsWeights(tmp)]
 
+    def contrastive_derivatives(self, data_target, data_domain, model_target,
+                                model_domain, penalize=True, out=None):
+        """
+        Compute the difference of the derivatives of the weights layer
+        for the data and the model, with a single matrix product.
+
+        dW_{ij} = - \frac{1}{num_data} * \sum_{k} v_{ki} h_{kj} (data)
+                  + \frac{1}{num_model} * \sum_{k} v_{ki} h_{kj} (model)
+
+        Notes:
+            Stacks the data and the model units, with the signed
+            normalization applied to the domain units, so that
+            the two sums are one (num_visible, num_hidden) GEMM.
+
+        Args:
+            data_target (tensor (num_data, num_visible)): Rescaled target units of the data.
+            data_domain (tensor (num_data, num_hidden)): Rescaled domain units of the data.
+            model_target (tensor (num_model, num_visible)): Rescaled target units of the model.
+            model_domain (tensor (num_model, num_hidden)): Rescaled domain units of the model.
+            penalize (bool): whether to add the penalty to the derivative
+            out (tensor (num_visible, num_hidden); optional):
+                A tensor to store the result in.
+
+        Returns:
+            derivs (List[namedtuple]): List['matrix': tensor] (contains gradient)
+
+        """
+        target = be.vstack([be.dense(data_target), be.dense(model_target)])
+        domain = be.vstack([be.tmul(-1.0 / be.shape(data_domain)[0], be.dense(data_domain)),
+                            be.tmul(1.0 / be.shape(model_domain)[0], be.dense(model_domain))])
+        tmp = be.dot(be.transpose(target), domain, out=out)
+        if penalize and "matrix" in self.penalties:
+            be.add_(self.penalties["matrix"].grad(self.params.matrix), tmp)
+        return [ParamsWeights(tmp)]
+
     def zero_derivatives(self):
         """
         Return an object like the derivatives that is filled with zeros.
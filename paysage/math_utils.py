@@ -281,3 +281,38 @@ class MeanVarianceArrayCalculator(object):
         self.mean = (self.num*self.mean + n*sample_mean) / max(new_num, 1)
         self.num = new_num
 
+
+    def combine(self, other) -> None:
+        """
+        Combine the calculation with another calculation on disjoint samples,
+        e.g., one computed in parallel on a different chunk of the data.
+        Uses the parallel variant of Welford's algorithm.
+        T.F. Chan, G.H. Golub, R.J. LeVeque, Technical Report STAN-CS-79-773.
+
+        Notes:
+            Modifies the metrics in place.
+
+        Args:
+            other (MeanVarianceArrayCalculator)
+
+        Returns:
+            None
+
+        """
+        if other.mean is None:
+            return
+        if self.mean is None:
+            self.num = other.num
+            self.mean = be.copy_tensor(other.mean)
+            self.square = be.copy_tensor(other.square)
+            self.var = be.copy_tensor(other.var)
+            return
+
+        delta = other.mean - self.mean
+        new_num = self.num + other.num
+        correction = self.num*other.num*be.square(delta) / max(new_num, 1)
+
+        self.square = self.square + other.square + correction
+        self.var = self.square / max(new_num-1, 1)
+        self.mean = (self.num*self.mean + other.num*other.mean) / max(new_num, 1)
+        self.num = new_num
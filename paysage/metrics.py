@@ -175,6 +175,89 @@ class EnergyDistance(object):
             return None
 
 
+class LogLikelihood(object):
+    """
+    Compute the average log-likelihood of the observations,
+    log p(v) = -F(v) - log Z,
+    estimating log Z with annealed importance sampling.
+    Requires a model with one hidden layer.
+
+    The number of annealing chains (num_particles) and of intermediate
+    distributions (num_betas) trade the accuracy of the estimate against
+    its cost. The estimate of log Z is computed once per check of the
+    progress, so it is shared by all of the minibatches.
+
+    """
+
+    name = 'LogLikelihood'
+
+    def __init__(self, num_particles=100, num_betas=1000):
+        """
+        Create a LogLikelihood object.
+
+        Args:
+            num_particles (int; optional): the number of annealing chains
+            num_betas (int; optional): the number of intermediate distributions
+
+        Returns:
+            LogLikelihood
+
+        """
+        self.num_particles = num_particles
+        self.num_betas = num_betas
+        self.calc = math_utils.MeanCalculator()
+        self.log_Z = None
+
+    def reset(self) -> None:
+        """
+        Reset the metric to its initial state.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.calc.reset()
+        self.log_Z = None
+
+    def update(self, update_args: MetricState) -> None:
+        """
+        Update the estimate for the log-likelihood using a batch
+        of observations.
+
+        Args:
+            update_args: uses visible layer of minibatch, and model
+
+        Returns:
+            None
+
+        """
+        model = update_args.model
+        if self.log_Z is None:
+            self.log_Z, _ = model.annealed_importance_sampling(self.num_particles,
+                                                               self.num_betas)
+        free_energy = model.marginal_free_energy(update_args.minibatch.units[0])
+        self.calc.update(-free_energy - self.log_Z)
+
+    def value(self) -> float:
+        """
+        Get the value of the log-likelihood.
+
+        Args:
+            None
+
+        Returns:
+            log-likelihood (float)
+
+        """
+        if self.calc.num is not None:
+            return self.calc.mean
+        else:
+            return None
+
+
 class EnergyGap(object):
     """
     Samples drawn from a model should have much lower energy
@@ -1,5 +1,5 @@
 
-from cytoolz import compose
+from cytoolz import compose, partial
 from math import sqrt
 from collections import namedtuple
 
@@ -10,6 +10,69 @@ Gradient = namedtuple("Gradient", [
     "weights"
 ])
 
+class FlatGradient(Gradient):
+    """
+    A Gradient whose tensors are views into one contiguous tensor,
+    so that the utility functions below can operate on the whole
+    gradient at once.
+
+    Attributes:
+        flat (tensor): the contiguous tensor
+        layout (ArenaLayout): the layout of the layers then the weights
+
+    """
+    @classmethod
+    def from_flat(cls, layout, flat, num_layers):
+        """
+        Create a FlatGradient from a contiguous tensor.
+
+        Args:
+            layout (ArenaLayout): the layout of the layers then the weights
+            flat (tensor (layout.size,)): the contiguous tensor
+            num_layers (int): the number of layers
+
+        Returns:
+            FlatGradient
+
+        """
+        views = layout.views(flat)
+        grad = cls([[v] for v in views[:num_layers]],
+                   [[v] for v in views[num_layers:]])
+        grad.flat = flat
+        grad.layout = layout
+        return grad
+
+    def like(self, flat):
+        """
+        Create a FlatGradient with the same layout from a contiguous tensor.
+
+        Args:
+            flat (tensor (layout.size,))
+
+        Returns:
+            FlatGradient
+
+        """
+        return FlatGradient.from_flat(self.layout, flat, len(self.layers))
+
+    def __reduce__(self):
+        # rebuild the views into the copy of the contiguous tensor
+        return (FlatGradient.from_flat, (self.layout, self.flat, len(self.layers)))
+
+def _flat(*grads):
+    """
+    Check if Gradient objects are FlatGradients with the same layout.
+
+    Args:
+        grads (Gradient)
+
+    Returns:
+        bool
+
+    """
+    return all(isinstance(g, FlatGradient) for g in grads) and \
+        all(g.layout == grads[0].layout for g in grads[1:])
+
 """
 Utility functions for manipulating Gradient objects
 """
@@ -96,6 +159,8 @@ def grad_apply(func, grad):
         Gradient
 
     """
+    if _flat(grad):
+        return grad.like(func(grad.flat))
     return Gradient(
         [[be.apply(func, sub_layer) for sub_layer in layer] for layer in grad.layers],
         [[be.apply(func, sub_weight) for sub_weight in weight] for weight in grad.weights]
@@ -116,6 +181,9 @@ def grad_apply_(func_, grad):
         None
 
     """
+    if _flat(grad):
+        func_(grad.flat)
+        return
     for layer in grad.layers:
         for sub_layer in layer:
             be.apply_(func_, sub_layer)
@@ -135,6 +203,8 @@ def grad_mapzip(func, grad1, grad2):
         Gradient
 
     """
+    if _flat(grad1, grad2):
+        return grad1.like(func(grad1.flat, grad2.flat))
     n = len(grad1.layers)
     m = len(grad1.weights)
     return Gradient(
@@ -160,6 +230,9 @@ def grad_mapzip_(func_, grad1, grad2):
         None
 
     """
+    if _flat(grad1, grad2):
+        func_(grad1.flat, grad2.flat)
+        return
     n = len(grad1.layers)
     m = len(grad1.weights)
     for i in range(n):
@@ -183,3 +256,42 @@ def grad_magnitude(grad):
     n = len(grad.layers) + len(grad.weights)
     tensor_mean_square = compose(be.mean, be.square)
     return sqrt(grad_accumulate(tensor_mean_square, grad) / n)
+
+def grad_norm(grad):
+    """
+    Compute the Euclidean norm of the gradient, over all of its entries.
+
+    Args:
+        grad (Gradient)
+
+    Returns:
+        norm (float)
+
+    """
+    if _flat(grad):
+        return float(be.norm(grad.flat))
+    return sqrt(grad_accumulate(compose(be.tsum, be.square), grad))
+
+def grad_weighted_mean(grads, weights):
+    """
+    Compute the weighted mean of a list of Gradient objects.
+
+    Notes:
+        Combines derivatives that are averages over disjoint sets of samples
+        into the average over all of the samples, if the weights are
+        the numbers of samples in each set.
+
+    Args:
+        grads (List[Gradient])
+        weights (List[float])
+
+    Returns:
+        Gradient
+
+    """
+    total = sum(weights)
+    result = grad_apply(partial(be.tmul, weights[0] / total), grads[0])
+    for grad, weight in zip(grads[1:], weights[1:]):
+        result = grad_mapzip(be.add, result,
+                             grad_apply(partial(be.tmul, weight / total), grad))
+    return result
@@ -2,6 +2,35 @@ from ... import backends as be
 from ... import math_utils as mu
 import math
 
+def _visible_param_update(batch, model):
+    """
+    Set the parameters of the visible layer from the moments of the data.
+    Uses the cached statistics of the batch if they have been computed
+    (see batch.HDFBatch.compute_statistics), otherwise makes a pass
+    through the training set.
+
+    Notes:
+        Modifies the model parameters in place.
+
+    Args:
+        batch: A batch object that provides minibatches of data.
+        model: A model to initialize.
+
+    Returns:
+        None
+
+    """
+    stats = batch.statistics() if hasattr(batch, 'statistics') else None
+    if stats is not None:
+        model.layers[0].moments_param_update(stats)
+        return
+    while True:
+        try:
+            v_data = be.dense(batch.get(mode='train'))
+        except StopIteration:
+            break
+        model.layers[0].online_param_update(v_data)
+
 def hinton(batch, model):
     """
     Initialize the parameters of an RBM.
@@ -31,12 +60,7 @@ def hinton(batch, model):
     for i in range(len(model.weights)):
         model.weights[i].params.matrix[:] = \
                         0.01 * be.randn(model.weights[i].shape)
-    while True:
-        try:
-            v_data = batch.get(mode='train')
-        except StopIteration:
-            break
-        model.layers[0].online_param_update(v_data)
+    _visible_param_update(batch, model)
     model.layers[0].shrink_parameters(shrinkage=0.01)
 
 def glorot_normal(batch, model):
@@ -72,10 +96,5 @@ def glorot_normal(batch, model):
                              + model.weights[i].shape[1]))
         model.weights[i].params.matrix[:] = \
                         sigma * be.randn(model.weights[i].shape)
-    while True:
-        try:
-            v_data = batch.get(mode='train')
-        except StopIteration:
-            break
-        model.layers[0].online_param_update(v_data)
+    _visible_param_update(batch, model)
     model.layers[0].shrink_parameters(shrinkage=0.01)
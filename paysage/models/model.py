@@ -1,5 +1,7 @@
 import os
+import numpy
 import pandas
+from concurrent.futures import ThreadPoolExecutor
 from cytoolz import partial
 from typing import List
 
@@ -51,6 +53,117 @@ class Model(object):
                     ) for weight_index in self.graph.weight_connections]
         self.num_weights = len(self.weights)
 
+        # alternating update plans, keyed by layer function and clamping
+        self._sampling_plans = {}
+
+        # preallocated gradients of the weights
+        self._weight_gradients = [None] * self.num_weights
+
+        # counts the updates of the parameters, to validate the fields
+        # stored in states by the sampling methods
+        self.parameter_version = 0
+
+        # optional contiguous storage of the parameters and the gradient
+        self.arena = None
+        self.arena_layout = None
+        self._arena_gradient = None
+
+    #
+    # Methods for contiguous parameter storage.
+    #
+
+    def use_arena(self) -> None:
+        """
+        Store all of the parameters of the model in one contiguous tensor,
+        the arena attribute, with the params of the layers and weights
+        becoming views into it. The gradients computed by Model.gradient are
+        then FlatGradients, views into one contiguous tensor reused by every
+        call, and so are the moments computed from them by the optimizers.
+        So, the optimizer updates are single operations over the whole model,
+        and the arena can be checkpointed as one tensor.
+
+        Notes:
+            Changes the params of the layers and weights in place.
+            Call again after replacing any of the layers or weights.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.arena_layout = mu.ArenaLayout([obj.params for obj in self.layers + self.weights])
+        self._attach_arena(self.arena_layout.pack(
+            [obj.params for obj in self.layers + self.weights]))
+
+    def _attach_arena(self, arena) -> None:
+        """
+        Make the params of the layers and weights views into an arena,
+        and allocate the gradient.
+
+        Notes:
+            Changes the model in place.
+
+        Args:
+            arena (tensor): the arena, with arena_layout
+
+        Returns:
+            None
+
+        """
+        self.arena = arena
+        views = self.arena_layout.views(arena)
+        for obj, params in zip(self.layers + self.weights, views):
+            obj.params = params
+        self._arena_gradient = gu.FlatGradient.from_flat(
+            self.arena_layout, be.zeros((self.arena_layout.size,)), self.num_layers)
+        self._reset_sampling_plans()
+        self.invalidate_caches()
+
+    def _arena_trainable_segments(self):
+        """
+        Get the contiguous ranges of the arena that hold trainable parameters.
+
+        Args:
+            None
+
+        Returns:
+            List[tuple (int, int)]: the start and stop indices of the ranges,
+                or None if all of the parameters are trainable
+
+        """
+        trainable = []
+        for i, layer in enumerate(self.layers):
+            for j, field in enumerate(layer.params._fields):
+                trainable.append((self.arena_layout.segment(i, j),
+                                  i in self.graph.trainable_layers
+                                  and field not in layer.fixed_params))
+        for i, weight in enumerate(self.weights):
+            for j in range(len(weight.params)):
+                trainable.append((self.arena_layout.segment(self.num_layers + i, j),
+                                  i in self.graph.trainable_weights))
+        if all(t for _, t in trainable):
+            return None
+        # merge the neighboring trainable tensors
+        segments = []
+        for (start, stop), t in trainable:
+            if not t:
+                continue
+            if segments and segments[-1][1] == start:
+                segments[-1] = (segments[-1][0], stop)
+            else:
+                segments.append((start, stop))
+        return segments
+
+    def __setstate__(self, state):
+        # copies of the views no longer share the copy of the arena
+        self.__dict__.update(state)
+        if self.__dict__.get('arena') is not None:
+            self.arena_layout.pack([obj.params for obj in self.layers + self.weights],
+                                   self.arena)
+            self._attach_arena(self.arena)
+
     #
     # Methods for saving and loading models.
     #
@@ -94,6 +207,7 @@ class Model(object):
         tmp = cls(layer_list)
         for i in range(len(config["weights"])):
             tmp.weights[i] = layers.weights_from_config(config["weights"][i])
+        tmp._reset_sampling_plans()
         return tmp
 
     def save(self, store: pandas.HDFStore) -> None:
@@ -182,14 +296,32 @@ class Model(object):
             list[tensor]: the rescaled values of the connected units
 
         """
-        connections = self.graph.layer_connections[i]
+        return self._rescaled_units(
+                [conn.layer for conn in self.graph.layer_connections[i]],
+                state, dropout_mask)
+
+    def _rescaled_units(self, layer_indices: List, state: mu.State,
+                        dropout_mask: mu.State = None) -> List:
+        """
+        Helper function to retrieve the rescaled units of a list of layers.
+
+        Args:
+            layer_indices (list[int]): the indices of the layers
+            state (State): the current state of the units
+            dropout_mask (State): mask on
+                model units for dropout, 1: on 0: dropped-out
+
+        Returns:
+            list[tensor]: the rescaled values of the units
+
+        """
         if dropout_mask is not None:
-            return [self.multipliers[conn.layer] * self.layers[conn.layer].rescale(
-                    be.multiply(dropout_mask.units[conn.layer], state.units[conn.layer]))
-                    for conn in connections]
+            return [self.multipliers[l] * self.layers[l].rescale(
+                    be.multiply(dropout_mask.units[l], state.units[l]))
+                    for l in layer_indices]
         else:
-            return [self.multipliers[conn.layer] * self.layers[conn.layer].rescale(
-                    state.units[conn.layer]) for conn in connections]
+            return [self.multipliers[l] * self.layers[l].rescale(state.units[l])
+                    for l in layer_indices]
 
     def _connected_weights(self, i:int) -> List:
         """
@@ -245,6 +377,7 @@ class Model(object):
         except AttributeError:
             print(method + ' is not a valid initialization method for latent models')
         func(data, self)
+        self.invalidate_caches()
         for l in self.layers:
             l.enforce_constraints()
         for w in self.weights:
@@ -283,20 +416,177 @@ class Model(object):
             new state
 
         """
-        # define even and odd sampling sets to alternate between, including
-        # only layers that can be sampled
-        (odd_layers, even_layers) = (range(1, self.num_layers, 2),
-                                     range(0, self.num_layers, 2))
-        layer_order = [i for i in list(odd_layers) + list(even_layers)
-                       if i in self.graph.get_sampled()]
-
         # update the odd then the even layers
-        for i in layer_order:
-            func = getattr(self.layers[i], func_name)
-            state.units[i] = func(
-                self._connected_rescaled_units(i, state, dropout_mask),
-                self._connected_weights(i),
-                beta=beta)
+        for step in self._sampling_plan(func_name):
+            i = step.layer
+            kwargs = {'beta': beta}
+            # store the fields that the derivatives use, without dropout
+            record = dropout_mask is None and self.layers[i].uses_connected_field
+            if record:
+                kwargs['field'] = state.field_buffer(i)
+            state.units[i] = step.update(
+                self._rescaled_units(step.connected_layers, state, dropout_mask),
+                [W() for W in step.connected_weights],
+                **kwargs)
+            if record:
+                state.set_field(i, kwargs['field'], self.parameter_version,
+                                [state.units[l] for l in step.connected_layers])
+
+    def _sampling_plan(self, func_name: str) -> tuple:
+        """
+        Get the layer updates of an alternating update for the current
+        clamping configuration: the odd then the even layers,
+        including only layers that can be sampled.
+
+        Notes:
+            The plans are computed once per layer function and clamping
+            configuration. Call _reset_sampling_plans after replacing any
+            of the layers or weights of the model.
+
+        Args:
+            func_name (str, function name): layer function name to apply to the units
+
+        Returns:
+            tuple[LayerUpdate]: the layer updates, in order
+
+        """
+        key = (func_name, tuple(self.graph.clamped_sampling))
+        try:
+            return self._sampling_plans[key]
+        except KeyError:
+            plan = tuple(mu.LayerUpdate(
+                    i,
+                    getattr(self.layers[i], func_name),
+                    tuple(conn.layer for conn in self.graph.layer_connections[i]),
+                    tuple(self.weights[conn.weight].W_T if conn.is_forward
+                          else self.weights[conn.weight].W
+                          for conn in self.graph.layer_connections[i]))
+                    for i in self.graph.get_sampling_order())
+            self._sampling_plans[key] = plan
+            return plan
+
+    def invalidate_caches(self) -> None:
+        """
+        Discard the quantities computed from the parameters: the cached
+        quantities of the layers and weights (e.g., the variance of
+        a Gaussian layer), and the fields stored in states by the
+        sampling methods.
+
+        Notes:
+            Changes the model in place.
+            The methods of the model that update the parameters call this.
+            Call it after modifying the params in place in any other way.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self.parameter_version += 1
+        for obj in self.layers + self.weights:
+            obj.clear_cache()
+
+    def _reset_sampling_plans(self) -> None:
+        """
+        Discard the cached alternating update plans.
+
+        Notes:
+            Changes the model in place.
+
+        Args:
+            None
+
+        Returns:
+            None
+
+        """
+        self._sampling_plans = {}
+
+    def _rescale_units_(self, i: int, state: mu.State, buffers: mu.SamplingBuffers,
+                        dropout_mask: mu.State = None) -> None:
+        """
+        Store the rescaled units of layer i in the buffers.
+
+        Notes:
+            Changes buffers in place.
+
+        Args:
+            i (int): the index of the layer of interest
+            state (State object): the current state of each layer
+            buffers (SamplingBuffers object): preallocated tensors
+            dropout_mask (State object): mask on model units
+                for dropout, 1: on 0: dropped-out
+
+        Returns:
+            None
+
+        """
+        rescaled = be.copy_tensor(state.units[i], out=buffers.rescaled.units[i])
+        if dropout_mask is not None:
+            be.multiply_(dropout_mask.units[i], rescaled)
+        self.layers[i].rescale_(rescaled)
+        if self.multipliers[i] != 1:
+            be.tmul_(self.multipliers[i], rescaled)
+
+    def _buffered_update_(self, func_name: str, n: int, state: mu.State,
+                          buffers: mu.SamplingBuffers = None,
+                          dropout_mask: mu.State = None, beta=None) -> None:
+        """
+        Performs n alternating layer updates writing into the state tensors.
+
+        Notes:
+            Changes state and buffers in place.
+            Does not allocate any (num_samples, num_units) tensors
+            after the buffers are created, except for layers connected
+            to more than one other layer and for 1-hot layers.
+            Without dropout, the fields computed for the last update of
+            each layer are stored in the state, in the field buffers.
+
+        Args:
+            func_name (str, function name): layer function name to apply to the units to sample
+            n (int): number of steps.
+            state (State object): the current state of each layer
+            buffers (SamplingBuffers object; optional): preallocated tensors
+                with the batch size of the state, created if None
+            dropout_mask (State object): mask on model units
+                for dropout, 1: on 0: dropped-out
+            beta (optional, tensor (batch_size, 1)): Inverse temperatures
+
+        Returns:
+            None
+
+        """
+        if buffers is None:
+            buffers = mu.SamplingBuffers.from_model(be.shape(state.units[0])[0], self)
+        # the units change in place, which invalidates any stored fields
+        state.clear_fields()
+        for i in range(self.num_layers):
+            self._rescale_units_(i, state, buffers, dropout_mask)
+
+        plan = self._sampling_plan(func_name)
+        use_scratch = func_name == 'conditional_sample'
+        for _ in range(n):
+            for step in plan:
+                i = step.layer
+                kwargs = {'beta': beta, 'out': state.units[i]}
+                if use_scratch:
+                    kwargs['scratch'] = buffers.scratch.units[i]
+                record = dropout_mask is None and self.layers[i].uses_connected_field
+                if record:
+                    kwargs['field'] = buffers.fields.units[i]
+                step.update([buffers.rescaled.units[l] for l in step.connected_layers],
+                            [W() for W in step.connected_weights],
+                            **kwargs)
+                self._rescale_units_(i, state, buffers, dropout_mask)
+                # the units of layer i changed in place, so the fields of the
+                # layers connected to it are stale
+                state.clear_fields([conn.layer for conn
+                                    in self.graph.layer_connections[i]])
+                if record:
+                    state.set_field(i, buffers.fields.units[i], self.parameter_version,
+                                    [state.units[l] for l in step.connected_layers])
 
     def markov_chain(self, n: int, state: mu.State, dropout_mask: mu.State = None,
                      beta=None) -> mu.State:
@@ -326,6 +616,34 @@ class Model(object):
                                       dropout_mask = dropout_mask, beta = beta)
         return new_state
 
+    def markov_chain_(self, n: int, state: mu.State, dropout_mask: mu.State = None,
+                      beta=None, buffers: mu.SamplingBuffers = None) -> None:
+        """
+        Perform multiple Gibbs sampling steps in alternating layers,
+        writing the results into the tensors of the state.
+
+        Notes:
+            Changes state in place.
+            The state tensors must be dense, writeable, and contiguous.
+            Reusing the buffers across calls avoids allocating
+            any new tensors.
+
+        Args:
+            n (int): number of steps.
+            state (State object): the current state of each layer
+            dropout_mask (State object):
+                mask on model units for dropout, 1: on 0: dropped-out
+            beta (optional, tensor (batch_size, 1)): Inverse temperatures
+            buffers (SamplingBuffers object; optional): preallocated tensors
+                with the batch size of the state, created if None
+
+        Returns:
+            None
+
+        """
+        self._buffered_update_('conditional_sample', n, state, buffers=buffers,
+                               dropout_mask=dropout_mask, beta=beta)
+
     def mean_field_iteration(self, n: int, state: mu.State, dropout_mask: mu.State = None,
                              beta=None) -> mu.State:
         """
@@ -354,6 +672,117 @@ class Model(object):
                                       dropout_mask=dropout_mask, beta=beta)
         return new_state
 
+    def mean_field_solve(self, state: mu.State, dropout_mask: mu.State = None,
+                         tolerance: float = 1e-4, damping: float = 0.0,
+                         max_iters: int = 100, beta=None) -> tuple:
+        """
+        Iterate the mean-field updates in alternating layers until the
+        units of every sample converge.
+
+        Notes:
+            A sample stops updating once the largest change of its units
+            in a sweep drops below the tolerance, so the converged samples
+            are removed from the batch that the later sweeps compute.
+            With damping d, each layer update is d * old + (1 - d) * new.
+
+        Args:
+            state (State object): the initial state of each layer
+            dropout_mask (State object):
+                mask on model units for dropout, 1: on 0: dropped-out
+            tolerance (float): the convergence threshold on the change of the units
+            damping (float in [0,1)): the weight of the old units in each update
+            max_iters (int): the maximum number of sweeps
+            beta (optional, tensor (batch_size, 1)): Inverse temperatures
+
+        Returns:
+            tuple (State, numpy array (batch_size,)): the new state
+                and the number of sweeps used by each sample
+
+        """
+        new_state = mu.State.from_state(state)
+        num_samples = be.shape(new_state.units[0])[0]
+        plan = self._sampling_plan('conditional_mean')
+        iterations = numpy.zeros(num_samples, dtype=numpy.int64)
+        active = numpy.arange(num_samples)
+        per_sample_mask = dropout_mask is not None and \
+            be.shape(dropout_mask.units[0])[0] == num_samples > 1
+        per_sample_beta = beta is not None and be.shape(beta)[0] == num_samples > 1
+
+        # the units, dropout mask, and inverse temperatures of the active samples
+        sub_state, sub_mask, sub_beta = new_state, dropout_mask, beta
+        for _ in range(max_iters):
+            if not plan or len(active) == 0:
+                break
+            change = None
+            for step in plan:
+                i = step.layer
+                mean = step.update(
+                    self._rescaled_units(step.connected_layers, sub_state, sub_mask),
+                    [W() for W in step.connected_weights],
+                    beta=sub_beta)
+                if damping > 0:
+                    mean = be.add(be.tmul(damping, sub_state.units[i]),
+                                  be.tmul(1 - damping, mean))
+                delta = be.tmax(be.tabs(be.subtract(sub_state.units[i], mean)), axis=1)
+                change = delta if change is None else be.maximum(change, delta)
+                sub_state.units[i] = mean
+            iterations[active] += 1
+
+            converged = be.to_numpy_array(change) < tolerance
+            if not converged.any():
+                continue
+            if sub_state is not new_state:
+                index = be.int_tensor(numpy.flatnonzero(converged))
+                for step in plan:
+                    be.index_copy_(new_state.units[step.layer],
+                                   be.int_tensor(active[converged]),
+                                   be.index_select(sub_state.units[step.layer], index))
+
+            # shrink the batch to the samples that have not converged
+            keep = numpy.flatnonzero(~converged)
+            active = active[keep]
+            index = be.int_tensor(keep)
+            sub_state = mu.State([be.index_select(u, index) for u in sub_state.units])
+            if per_sample_mask:
+                sub_mask = mu.State([be.index_select(m, index) for m in sub_mask.units])
+            if per_sample_beta:
+                sub_beta = be.index_select(sub_beta, index)
+
+        # store the samples that did not converge
+        if sub_state is not new_state and len(active) > 0:
+            for step in plan:
+                be.index_copy_(new_state.units[step.layer], be.int_tensor(active),
+                               sub_state.units[step.layer])
+        return new_state, iterations
+
+    def mean_field_iteration_(self, n: int, state: mu.State, dropout_mask: mu.State = None,
+                              beta=None, buffers: mu.SamplingBuffers = None) -> None:
+        """
+        Perform multiple mean-field updates in alternating layers,
+        writing the results into the tensors of the state.
+
+        Notes:
+            Changes state in place.
+            The state tensors must be dense, writeable, and contiguous.
+            Reusing the buffers across calls avoids allocating
+            any new tensors.
+
+        Args:
+            n (int): number of steps.
+            state (State object): the current state of each layer
+            dropout_mask (State object):
+                mask on model units for dropout, 1: on 0: dropped-out
+            beta (optional, tensor (batch_size, 1)): Inverse temperatures
+            buffers (SamplingBuffers object; optional): preallocated tensors
+                with the batch size of the state, created if None
+
+        Returns:
+            None
+
+        """
+        self._buffered_update_('conditional_mean', n, state, buffers=buffers,
+                               dropout_mask=dropout_mask, beta=beta)
+
     def deterministic_iteration(self, n: int, state: mu.State, dropout_mask: mu.State = None,
                                 beta=None) -> mu.State:
         """
@@ -383,14 +812,139 @@ class Model(object):
                                       dropout_mask=dropout_mask, beta=beta)
         return new_state
 
+    def deterministic_iteration_(self, n: int, state: mu.State, dropout_mask: mu.State = None,
+                                 beta=None, buffers: mu.SamplingBuffers = None) -> None:
+        """
+        Perform multiple deterministic (maximum probability) updates in alternating layers,
+        writing the results into the tensors of the state.
+
+        Notes:
+            Changes state in place.
+            The state tensors must be dense, writeable, and contiguous.
+            Reusing the buffers across calls avoids allocating
+            any new tensors.
+
+        Args:
+            n (int): number of steps.
+            state (State object): the current state of each layer
+            dropout_mask (State object):
+                mask on model units for dropout, 1: on 0: dropped-out
+            beta (optional, tensor (batch_size, 1)): Inverse temperatures
+            buffers (SamplingBuffers object; optional): preallocated tensors
+                with the batch size of the state, created if None
+
+        Returns:
+            None
+
+        """
+        self._buffered_update_('conditional_mode', n, state, buffers=buffers,
+                               dropout_mask=dropout_mask, beta=beta)
+
+    def phase_derivatives(self, state, dropout_mask=None, penalize=True):
+        """
+        Compute the derivatives of the model parameters for one phase
+        of the gradient, i.e., the averages over the samples of the state.
+
+        Args:
+            state (State object): The units of the phase.
+            dropout_mask (State object): mask on model units
+                for dropout, 1: on 0: dropped-out
+            penalize (bool): whether to add the penalties to the derivatives
+
+        Returns:
+            Gradient
+
+        """
+        deriv = gu.null_grad(self)
+        deriv.layers[:] = self._layer_derivatives(state, dropout_mask, penalize)
+
+        # compute the derivatives of the weights
+        for i in range(self.num_weights):
+            iL = self.graph.weight_connections[i][0]
+            iR = self.graph.weight_connections[i][1]
+            deriv.weights[i] = self.weights[i].derivatives(
+                self.layers[iL].rescale(state.units[iL]),
+                self.layers[iR].rescale(state.units[iR]),
+                penalize=penalize
+                )
+
+        return deriv
+
+    def _layer_derivatives(self, state, dropout_mask=None, penalize=True):
+        """
+        Compute the derivatives of the layer parameters for one phase
+        of the gradient.
+
+        Args:
+            state (State object): The units of the phase.
+            dropout_mask (State object): mask on model units
+                for dropout, 1: on 0: dropped-out
+            penalize (bool): whether to add the penalties to the derivatives
+
+        Returns:
+            list: the derivatives of each layer
+
+        """
+        state_dropout = mu.dropout_state(state, dropout_mask)
+        derivs = []
+        for i, layer in enumerate(self.layers):
+            # reuse the field computed by the sampler if it is still valid
+            field = None
+            if layer.uses_connected_field:
+                field = state.get_field(
+                    i, self.parameter_version,
+                    [state.units[conn.layer] for conn in self.graph.layer_connections[i]])
+            if field is not None:
+                derivs.append(layer.derivatives(state_dropout.units[i], [], [],
+                                                penalize=penalize, field=field))
+            else:
+                derivs.append(layer.derivatives(state_dropout.units[i],
+                                                self._connected_rescaled_units(i, state),
+                                                self._connected_weights(i),
+                                                penalize=penalize))
+        return derivs
+
+    def _weight_gradient_buffer(self, i):
+        """
+        Get the preallocated tensor for the gradient of weights i.
+
+        Notes:
+            The gradient of the weights returned by Model.gradient is
+            this tensor, so it is overwritten by the next call.
+            With an arena, it is a view into the arena gradient.
+
+        Args:
+            i (int): the index of the weights
+
+        Returns:
+            tensor: with the shape of the weights
+
+        """
+        if self.arena is not None:
+            return self._arena_gradient.weights[i][0].matrix
+        shape = be.shape(self.weights[i].W())
+        if self._weight_gradients[i] is None or \
+            be.shape(self._weight_gradients[i]) != shape:
+            self._weight_gradients[i] = be.zeros(shape)
+        return self._weight_gradients[i]
+
     def gradient(self, data_state, model_state, positive_dropout=None, negative_dropout=None):
         """
         Compute the gradient of the model parameters.
         Scales the units in the state and computes the gradient.
 
+        Notes:
+            The gradient of each weights layer is a single matrix product
+            written into a preallocated tensor, which the next call
+            to gradient overwrites.
+            After Model.use_arena, the whole gradient is a FlatGradient
+            that the next call to gradient overwrites.
+
         Args:
             data_state (State object): The observed visible units and sampled hidden units.
-            model_state (State object): The visible and hidden units sampled from the model.
+            model_state (State object or Gradient): The visible and hidden units
+                sampled from the model, or the derivatives of the negative phase
+                if a sampler has already computed them.
             positive_dropout (State object): mask on model units
                 for positive phase dropout, 1: on 0: dropped-out
             negative_dropout (State object): mask on model units
@@ -400,56 +954,37 @@ class Model(object):
             dict: Gradients of the model parameters.
 
         """
-        grad = gu.null_grad(self)
-
-        # POSITIVE PHASE (using observed)
-        data_state_dropout = mu.dropout_state(data_state, positive_dropout)
-
-        # compute the postive phase of the gradients of the layer parameters
-        for i in range(self.num_layers):
-            grad.layers[i] = self.layers[i].derivatives(
-                data_state_dropout.units[i],
-                self._connected_rescaled_units(i, data_state),
-                self._connected_weights(i),
-                penalize=True
-                )
+        if isinstance(model_state, gu.Gradient):
+            grad = self.phase_derivatives(data_state, positive_dropout, penalize=True)
+            return gu.grad_mapzip(be.subtract, model_state, grad)
+
+        # the layer derivatives are small, so take the difference of the phases
+        positive = self._layer_derivatives(data_state, positive_dropout, penalize=True)
+        negative = self._layer_derivatives(model_state, negative_dropout, penalize=False)
+        if self.arena is not None:
+            grad = self._arena_gradient
+            for i in range(self.num_layers):
+                be.mapzip_(be.copy_tensor, positive[i][0], grad.layers[i][0])
+                be.mapzip_(be.subtract_, negative[i][0], grad.layers[i][0])
+        else:
+            grad = gu.null_grad(self)
+            for i in range(self.num_layers):
+                grad.layers[i] = [be.mapzip(be.subtract, z[0], z[1])
+                                  for z in zip(negative[i], positive[i])]
 
-        # compute the positive phase of the gradients of the weights
+        # fuse the phases of the weight derivatives
         for i in range(self.num_weights):
             iL = self.graph.weight_connections[i][0]
             iR = self.graph.weight_connections[i][1]
-            grad.weights[i] = self.weights[i].derivatives(
+            grad.weights[i] = self.weights[i].contrastive_derivatives(
                 self.layers[iL].rescale(data_state.units[iL]),
                 self.layers[iR].rescale(data_state.units[iR]),
-                penalize=True
+                self.layers[iL].rescale(model_state.units[iL]),
+                self.layers[iR].rescale(model_state.units[iR]),
+                penalize=True,
+                out=self._weight_gradient_buffer(i)
                 )
 
-        # NEGATIVE PHASE (using sampled)
-        model_state_dropout = mu.dropout_state(model_state, negative_dropout)
-
-        # update the gradients of the layer parameters with the negative phase
-        for i in range(self.num_layers):
-            deriv = self.layers[i].derivatives(
-                    model_state_dropout.units[i],
-                    self._connected_rescaled_units(i, model_state),
-                    self._connected_weights(i),
-                    penalize=False
-                    )
-            grad.layers[i] = [be.mapzip(be.subtract, z[0], z[1])
-            for z in zip(deriv, grad.layers[i])]
-
-        # update the gradients of the weight parameters with the negative phase
-        for i in range(self.num_weights):
-            iL = self.graph.weight_connections[i][0]
-            iR = self.graph.weight_connections[i][1]
-            deriv = self.weights[i].derivatives(
-                    self.layers[iL].rescale(model_state.units[iL]),
-                    self.layers[iR].rescale(model_state.units[iR]),
-                    penalize=False
-                    )
-            grad.weights[i] = [be.mapzip(be.subtract, z[0], z[1])
-            for z in zip(deriv, grad.weights[i])]
-
         return grad
 
     def parameter_update(self, deltas):
@@ -466,6 +1001,21 @@ class Model(object):
             None
 
         """
+        self.invalidate_caches()
+        if self.arena is not None and isinstance(deltas, gu.FlatGradient) \
+            and deltas.layout == self.arena_layout:
+            segments = self._arena_trainable_segments()
+            if segments is None:
+                be.subtract_(deltas.flat, self.arena)
+            else:
+                for start, stop in segments:
+                    be.subtract_(deltas.flat[start:stop], self.arena[start:stop])
+            for layer_index in self.graph.trainable_layers:
+                self.layers[layer_index].enforce_constraints()
+            for weight_index in self.graph.trainable_weights:
+                self.weights[weight_index].enforce_constraints()
+            return
+
         for layer_index in range(self.num_layers):
             if layer_index in self.graph.trainable_layers:
                 self.layers[layer_index].parameter_step(deltas.layers[layer_index])
@@ -473,6 +1023,55 @@ class Model(object):
             if weight_index in self.graph.trainable_weights:
                 self.weights[weight_index].parameter_step(deltas.weights[weight_index])
 
+    def fused_parameter_update(self, step_, grad, *memories):
+        """
+        Update the model parameters with a fused kernel that steps each
+        parameter tensor and the optimizer memory of it in one pass.
+
+        Notes:
+            Modifies the model parameters and the memories in place.
+            Only the trainable parameters, and their memories, are updated.
+            With an arena and FlatGradients, the kernel is called once on the
+            whole arena if all of the parameters are trainable, and once on
+            each contiguous range of trainable parameters otherwise.
+
+        Args:
+            step_ (callable): step_(param, grad, *memory), e.g. be.adam_step_
+                with the scalar arguments bound
+            grad (Gradient)
+            memories (Gradient): running averages of the gradient
+
+        Returns:
+            None
+
+        """
+        self.invalidate_caches()
+        if self.arena is not None and isinstance(grad, gu.FlatGradient) \
+            and grad.layout == self.arena_layout \
+            and all(gu._flat(grad, m) for m in memories):
+            segments = self._arena_trainable_segments()
+            if segments is None:
+                step_(self.arena, grad.flat, *[m.flat for m in memories])
+            else:
+                for start, stop in segments:
+                    step_(self.arena[start:stop], grad.flat[start:stop],
+                          *[m.flat[start:stop] for m in memories])
+        else:
+            for i in self.graph.trainable_layers:
+                layer = self.layers[i]
+                for j in layer._get_trainable_indices():
+                    step_(layer.params[j], grad.layers[i][0][j],
+                          *[m.layers[i][0][j] for m in memories])
+            for i in self.graph.trainable_weights:
+                for j in range(len(self.weights[i].params)):
+                    step_(self.weights[i].params[j], grad.weights[i][0][j],
+                          *[m.weights[i][0][j] for m in memories])
+
+        for layer_index in self.graph.trainable_layers:
+            self.layers[layer_index].enforce_constraints()
+        for weight_index in self.graph.trainable_weights:
+            self.weights[weight_index].enforce_constraints()
+
     def joint_energy(self, data):
         """
         Compute the joint energy of the model based on a state.
@@ -495,6 +1094,242 @@ class Model(object):
                                   rescaled_units.units[iR])
         return energy
 
+    def marginal_free_energy(self, vis, chunk_size=None):
+        """
+        Compute the free energy of the visible units of a model
+        with one hidden layer, summing over the hidden units:
+        F(v) = E_0(v) - \sum_j log Z_j(phi_j(v)),
+        where phi(v) is the external field on the hidden units.
+        Then, p(v) = exp(-F(v)) / Z.
+
+        Notes:
+            Works for any hidden layer with a log_partition_function
+            (e.g., Bernoulli, Gaussian, or 1-hot units).
+            Ignores dropout and the multipliers.
+
+        Args:
+            vis (tensor (num_samples, num_visible)): the visible units,
+                which may be sparse
+            chunk_size (int; optional): the number of samples processed at once,
+                which bounds the memory used for large inputs.
+                Defaults to all of the samples.
+
+        Returns:
+            tensor (num_samples,): the free energy of each sample
+
+        """
+        if self.num_layers != 2:
+            raise ValueError("the marginal free energy requires exactly one hidden layer")
+        num_samples = be.shape(vis)[0]
+        if chunk_size is None or num_samples <= chunk_size:
+            return self._marginal_free_energy(be.dense(vis))
+        free_energy = be.zeros((num_samples,))
+        for start in range(0, num_samples, chunk_size):
+            stop = min(start + chunk_size, num_samples)
+            free_energy[start:stop] = self._marginal_free_energy(be.dense(vis[start:stop]))
+        return free_energy
+
+    def _marginal_free_energy(self, vis):
+        """
+        Compute the free energy of a chunk of dense visible units.
+
+        Args:
+            vis (tensor (num_samples, num_visible)): the visible units
+
+        Returns:
+            tensor (num_samples,): the free energy of each sample
+
+        """
+        # the interaction is -rescale(v) W rescale(h), so the field on h is rescaled
+        field = self.layers[1].rescale(be.dot(self.layers[0].rescale(vis), self.weights[0].W()))
+        log_Z_hidden = be.tsum(self.layers[1].log_partition_function(field), axis=1)
+        return be.subtract(log_Z_hidden, self.layers[0].energy(vis))
+
+    def _hidden_configurations(self, start, stop):
+        """
+        Get a block of the configurations of the hidden layer,
+        in a fixed order.
+
+        Args:
+            start (int): the index of the first configuration
+            stop (int): the index after the last configuration
+
+        Returns:
+            tensor (stop - start, num_hidden): hidden configurations
+
+        """
+        hidden = self.layers[1]
+        if isinstance(hidden, layers.OneHotLayer):
+            return be.float_tensor(numpy.eye(hidden.len)[start:stop])
+        # the binary digits of the indices
+        codes = numpy.arange(start, stop, dtype=numpy.int64)
+        return be.float_tensor((codes[:, None] >> numpy.arange(hidden.len)) & 1)
+
+    def _num_hidden_configurations(self):
+        """
+        Get the number of configurations of the hidden layer.
+
+        Args:
+            None
+
+        Returns:
+            int
+
+        """
+        hidden = self.layers[1]
+        if isinstance(hidden, layers.OneHotLayer):
+            return hidden.len
+        if isinstance(hidden, layers.BernoulliLayer):
+            return 2 ** hidden.len
+        raise ValueError("can only enumerate Bernoulli or 1-hot hidden layers")
+
+    def _block_log_partition_function(self, start, stop):
+        """
+        Compute the logarithm of the sum of exp(-E(v, h)) over the visible
+        units and a block of the configurations of the hidden units.
+
+        Args:
+            start (int): the index of the first hidden configuration
+            stop (int): the index after the last hidden configuration
+
+        Returns:
+            float
+
+        """
+        hid = self._hidden_configurations(start, stop)
+        field = self.layers[0].rescale(be.dot(self.layers[1].rescale(hid),
+                                              self.weights[0].W_T()))
+        log_Z_visible = be.tsum(self.layers[0].log_partition_function(field), axis=1)
+        return float(be.logsumexp(be.subtract(self.layers[1].energy(hid), log_Z_visible)))
+
+    def exact_log_partition_function(self, block_size=4096, num_workers=None):
+        """
+        Compute the logarithm of the partition function of a model with one
+        hidden layer, by enumerating the configurations of the hidden units
+        and summing over the visible units analytically.
+
+        Notes:
+            Enumerates 2^num_hidden configurations of a Bernoulli hidden layer,
+            so it is practical for up to about 25 hidden units.
+            The blocks of configurations are computed by a pool of threads
+            and combined with a running log-sum-exp.
+            Ignores dropout and the multipliers.
+
+        Args:
+            block_size (int): the number of hidden configurations per block
+            num_workers (int; optional): the number of threads
+
+        Returns:
+            float: log Z
+
+        """
+        if self.num_layers != 2:
+            raise ValueError("exact enumeration requires exactly one hidden layer")
+        num_configurations = self._num_hidden_configurations()
+        starts = range(0, num_configurations, block_size)
+        stops = [min(start + block_size, num_configurations) for start in starts]
+        log_Z = -numpy.inf
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            for block_log_Z in pool.map(self._block_log_partition_function, starts, stops):
+                log_Z = numpy.logaddexp(log_Z, block_log_Z)
+        return float(log_Z)
+
+    def exact_log_likelihood(self, vis, block_size=4096, num_workers=None):
+        """
+        Compute the exact log-likelihood of visible units for a model with
+        one hidden layer, log p(v) = -F(v) - log Z.
+
+        Notes:
+            See exact_log_partition_function.
+
+        Args:
+            vis (tensor (num_samples, num_visible)): the visible units
+            block_size (int): the number of hidden configurations per block
+            num_workers (int; optional): the number of threads
+
+        Returns:
+            tuple (float, tensor (num_samples,)): log Z and the log-likelihoods
+
+        """
+        log_Z = self.exact_log_partition_function(block_size, num_workers)
+        return log_Z, be.tmul(-1, self.marginal_free_energy(vis)) - log_Z
+
+    def _interaction_energy(self, state):
+        """
+        Compute the energy of the weights, i.e., the joint energy
+        without the energies of the layers.
+
+        Args:
+            state (State object): the current state of each layer
+
+        Returns:
+            tensor (num_samples,): interaction energies
+
+        """
+        energy = 0
+        for i in range(self.num_weights):
+            iL = self.graph.weight_connections[i][0]
+            iR = self.graph.weight_connections[i][1]
+            energy += self.weights[i].energy(self.layers[iL].rescale(state.units[iL]),
+                                             self.layers[iR].rescale(state.units[iR]))
+        return energy
+
+    def annealed_importance_sampling(self, num_particles=100, num_betas=1000):
+        """
+        Estimate the logarithm of the partition function with
+        annealed importance sampling (AIS).
+
+        The intermediate distributions scale the weights by beta in [0, 1],
+        p_beta(x) ~ exp(-\sum_l E_l(x_l) - beta E_W(x)),
+        going from independent layers, whose partition function is the
+        product of the partition functions of the layers, to the model.
+        All of the annealing chains are updated as one batch, with one
+        Gibbs sampling sweep per intermediate distribution.
+
+        Salakhutdinov, Ruslan, and Iain Murray.
+        "On the quantitative analysis of deep belief networks."
+        Proceedings of the 25th international conference on Machine learning.
+        ACM, 2008.
+
+        Notes:
+            Ignores dropout and the multipliers.
+            More particles reduce the variance of the estimate, and more
+            intermediate distributions reduce its (downward) bias.
+
+        Args:
+            num_particles (int): the number of annealing chains
+            num_betas (int): the number of intermediate distributions,
+                including the endpoints
+
+        Returns:
+            tuple (float, tensor (num_particles,)): the estimate of log Z
+                and the log importance weights of the chains
+
+        """
+        # sample the independent layers exactly
+        state = mu.State.from_model(num_particles, self)
+        log_Z_base = 0
+        for layer in self.layers:
+            log_Z_base += be.tsum(layer.log_partition_function(be.zeros((1, layer.len))))
+
+        clamping = self.graph.clamped_sampling
+        self.graph.set_clamped_sampling([])
+        plan = self._sampling_plan('conditional_sample')
+        log_weights = be.zeros((num_particles,))
+        betas = numpy.linspace(0, 1, num_betas)
+        for previous_beta, beta in zip(betas[:-1], betas[1:]):
+            log_weights -= (beta - previous_beta) * self._interaction_energy(state)
+            # a Gibbs sweep of the intermediate distribution with this beta
+            for step in plan:
+                state.units[step.layer] = step.update(
+                    [be.tmul(beta, self.layers[l].rescale(state.units[l]))
+                     for l in step.connected_layers],
+                    [W() for W in step.connected_weights])
+        self.graph.set_clamped_sampling(clamping)
+
+        log_Z = log_Z_base + be.logsumexp(log_weights) - numpy.log(num_particles)
+        return float(log_Z), log_weights
+
     #
     # Methods for training with the TAP approximation
     #
@@ -1,4 +1,5 @@
 import copy
+import threading
 import numpy as np
 from collections import namedtuple
 from copy import deepcopy
@@ -22,6 +23,9 @@ class State(object):
     (num_samples, num_hidden_L)
     ]
 
+    A State can also hold the field from the connected layers of each layer,
+    as computed by the sampling sweep that produced the units of the layer.
+
     """
     def __init__(self, tensors):
         """
@@ -35,6 +39,88 @@ class State(object):
 
         """
         self.units = tensors
+        self.fields = [None] * len(tensors)
+
+    def set_field(self, i, field, version, connected_units):
+        """
+        Store the field from the connected layers of layer i.
+
+        Notes:
+            Modifies the fields attribute in place.
+
+        Args:
+            i (int): the index of the layer
+            field (tensor (num_samples, num_units)): the field
+            version (int): the version of the model parameters used
+            connected_units (List[tensor]): the units of the connected layers
+                used, which must not be modified in place afterwards
+
+        Returns:
+            None
+
+        """
+        self.fields[i] = (version, tuple(connected_units), field)
+
+    def get_field(self, i, version, connected_units):
+        """
+        Get the stored field from the connected layers of layer i,
+        if it was computed from the same parameters and connected units.
+
+        Args:
+            i (int): the index of the layer
+            version (int): the current version of the model parameters
+            connected_units (List[tensor]): the current units of the connected layers
+
+        Returns:
+            tensor (num_samples, num_units) or None
+
+        """
+        if self.fields[i] is None:
+            return None
+        field_version, field_units, field = self.fields[i]
+        if field_version != version or len(field_units) != len(connected_units) \
+            or any(a is not b for a, b in zip(field_units, connected_units)):
+            return None
+        return field
+
+    def clear_fields(self, layers=None):
+        """
+        Discard the stored fields, e.g., after modifying the units in place.
+
+        Notes:
+            Modifies the fields attribute in place.
+
+        Args:
+            layers (optional; List[int]): the indices of the layers,
+                all of the layers if None
+
+        Returns:
+            None
+
+        """
+        if layers is None:
+            self.fields = [None] * len(self.units)
+        else:
+            for i in layers:
+                self.fields[i] = None
+
+    def field_buffer(self, i):
+        """
+        Get a tensor to compute the field from the connected layers
+        of layer i in, reusing the tensor of the stored field if possible.
+
+        Args:
+            i (int): the index of the layer
+
+        Returns:
+            tensor (num_samples, num_units)
+
+        """
+        if self.fields[i] is not None:
+            field = self.fields[i][2]
+            if be.shape(field) == be.shape(self.units[i]):
+                return field
+        return be.zeros(be.shape(self.units[i]))
 
     @classmethod
     def from_model(cls, batch_size, model):
@@ -124,6 +210,150 @@ class State(object):
         return cls([be.copy_tensor(t) for t in state.units])
 
 
+class SamplingBuffers(object):
+    """
+    Preallocated tensors used by the in-place sampling methods of a model.
+
+    rescaled: the rescaled units of each layer, which are the inputs
+        to the conditional distributions of the connected layers.
+    scratch: the random numbers drawn for each layer.
+    fields: the fields from the connected layers of each layer, which
+        are stored in the sampled state for the derivatives.
+
+    All have the shapes of a State with batch_size samples.
+    The stored fields are only valid until the buffers are used
+    to update another state.
+
+    """
+    def __init__(self, rescaled, scratch, fields):
+        """
+        Create a SamplingBuffers object.
+
+        Args:
+            rescaled (State): buffers for the rescaled units
+            scratch (State): buffers for the random numbers
+            fields (State): buffers for the fields
+
+        Returns:
+            SamplingBuffers
+
+        """
+        self.rescaled = rescaled
+        self.scratch = scratch
+        self.fields = fields
+        self.batch_size = be.shape(rescaled.units[0])[0]
+
+    @classmethod
+    def from_model(cls, batch_size, model):
+        """
+        Create a SamplingBuffers object.
+
+        Args:
+            batch_size (int): the number of samples per layer
+            model (Model): a model object
+
+        Returns:
+            SamplingBuffers
+
+        """
+        shapes = [(batch_size, l.len) for l in model.layers]
+        return cls(State([be.zeros(shape) for shape in shapes]),
+                   State([be.zeros(shape) for shape in shapes]),
+                   State([be.zeros(shape) for shape in shapes]))
+
+
+class ArenaLayout(object):
+    """
+    The layout of a list of namedtuples of tensors (e.g., the parameters of
+    each layer and weights of a model) in one contiguous 1-dimensional tensor.
+    The tensors are stored one after the other, in order.
+
+    """
+    def __init__(self, templates):
+        """
+        Create an ArenaLayout object.
+
+        Args:
+            templates (List[namedtuple]): namedtuples of tensors with
+                the types and shapes to lay out
+
+        Returns:
+            ArenaLayout
+
+        """
+        self.classes = [t.__class__ for t in templates]
+        self.shapes = [[tuple(be.shape(tensor)) for tensor in t] for t in templates]
+        self.offsets = []
+        size = 0
+        for shapes in self.shapes:
+            self.offsets.append([])
+            for shape in shapes:
+                self.offsets[-1].append(size)
+                size += int(np.prod(shape))
+        self.size = size
+
+    def __eq__(self, other):
+        return isinstance(other, ArenaLayout) and \
+            self.classes == other.classes and self.shapes == other.shapes
+
+    def __ne__(self, other):
+        return not self == other
+
+    def segment(self, i, j):
+        """
+        Get the range of tensor j of namedtuple i in the arena.
+
+        Args:
+            i (int): the index of the namedtuple
+            j (int): the index of the tensor in the namedtuple
+
+        Returns:
+            tuple (int, int): the start and stop indices
+
+        """
+        start = self.offsets[i][j]
+        return start, start + int(np.prod(self.shapes[i][j]))
+
+    def views(self, arena):
+        """
+        Get namedtuples of views into an arena.
+
+        Args:
+            arena (tensor (size,)): a contiguous tensor with this layout
+
+        Returns:
+            List[namedtuple]
+
+        """
+        result = []
+        for i, cls in enumerate(self.classes):
+            tensors = []
+            for j, shape in enumerate(self.shapes[i]):
+                start, stop = self.segment(i, j)
+                tensors.append(be.reshape(arena[start:stop], shape))
+            result.append(cls(*tensors))
+        return result
+
+    def pack(self, tuples, arena=None):
+        """
+        Copy namedtuples of tensors into an arena.
+
+        Args:
+            tuples (List[namedtuple]): namedtuples with this layout
+            arena (tensor (size,); optional): the arena to copy into
+
+        Returns:
+            tensor (size,): the arena
+
+        """
+        if arena is None:
+            arena = be.zeros((self.size,))
+        for view, values in zip(self.views(arena), tuples):
+            for v, x in zip(view, values):
+                v[:] = x
+        return arena
+
+
 class StateTAP(object):
     """
     A StateTAP is a list of CumulantsTAP objects for each layer in the model.
@@ -291,6 +521,15 @@ The `is_forward` attribute is True if the `layer` attribute (the connected layer
 """
 LayerConnection = namedtuple("LayerConnection", ["layer", "weight", "is_forward"])
 
+"""
+A tuple describing the update of one layer in an alternating update.
+`update` is the bound layer method (e.g., conditional_sample),
+`connected_layers` are the indices of the connected layers, and
+`connected_weights` are the bound W or W_T methods of the connecting weights.
+"""
+LayerUpdate = namedtuple("LayerUpdate",
+                         ["layer", "update", "connected_layers", "connected_weights"])
+
 
 class ComputationGraph(object):
     """
@@ -306,6 +545,10 @@ class ComputationGraph(object):
     The incidence matrix defines the connections between layers
     and the corresponding edges.
 
+    The clamped sampling property is stored per thread,
+    so that samplers in different threads can clamp different layers.
+    New threads start with no clamped layers.
+
     """
     def __init__(self, num_layers):
         """
@@ -330,10 +573,14 @@ class ComputationGraph(object):
 
         # the default properties
         # all layers can be sampled, trained, all weights can be trained
+        self._clamping = threading.local()
         self.clamped_sampling = []
         self.trainable_layers = range(self.num_layers)
         self.trainable_weights = range(self.num_weights)
 
+        # sampling orders, keyed by the tuple of clamped layers
+        self._sampling_orders = {}
+
     def default_incidence_matrix(self, num_layers):
         """
         Builds the default incidence matrix.
@@ -381,6 +628,27 @@ class ComputationGraph(object):
             layer_connections.append(layer_conn)
         return layer_connections
 
+    @property
+    def clamped_sampling(self):
+        """The layers with clamped sampling in the current thread."""
+        return getattr(self._clamping, 'layers', [])
+
+    @clamped_sampling.setter
+    def clamped_sampling(self, clamped_sampling):
+        self._clamping.layers = list(clamped_sampling)
+
+    def __getstate__(self):
+        """Replace the thread local clamping by that of the current thread."""
+        state = self.__dict__.copy()
+        state['_clamping'] = self.clamped_sampling
+        return state
+
+    def __setstate__(self, state):
+        clamped_sampling = state.pop('_clamping')
+        self.__dict__.update(state)
+        self._clamping = threading.local()
+        self.clamped_sampling = clamped_sampling
+
     def set_clamped_sampling(self, clamped_sampling):
         """
         Convenience function to set the layers for which sampling is clamped.
@@ -410,6 +678,31 @@ class ComputationGraph(object):
         """
         return [i for i in range(self.num_layers) if i not in self.clamped_sampling]
 
+    def get_sampling_order(self):
+        """
+        The order in which alternating updates visit the layers:
+        the odd then the even layers, excluding layers with clamped sampling.
+
+        Notes:
+            The order is computed once per clamping configuration.
+
+        Args:
+            None
+
+        Returns:
+            sampling_order (tuple): the layer indices.
+
+        """
+        key = tuple(self.clamped_sampling)
+        try:
+            return self._sampling_orders[key]
+        except KeyError:
+            sampled = self.get_sampled()
+            order = tuple(i for i in list(range(1, self.num_layers, 2))
+                          + list(range(0, self.num_layers, 2)) if i in sampled)
+            self._sampling_orders[key] = order
+            return order
+
     def set_trainable_layers(self, trainable_layers):
         """
         Convenience function to set the layers which are trainable
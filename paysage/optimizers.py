@@ -1,8 +1,7 @@
 from . import backends as be
-from cytoolz import identity, partial
+from cytoolz import partial
 from .models import gradient_util as gu
 from . import schedules
-from copy import deepcopy
 
 # ----- CLASSES ----- #
 
@@ -68,7 +67,8 @@ class GradientMemory(object):
 
         """
         if self.mean_gradient is None:
-            self.mean_gradient = gu.grad_apply(identity, grad)
+            # copy, because the model may reuse the tensors of the gradient
+            self.mean_gradient = gu.grad_apply(be.copy_tensor, grad)
         else:
             gu.grad_mapzip_(self.mixer_, self.mean_gradient, grad)
 
@@ -144,6 +144,11 @@ class GradientMemory(object):
         return gu.grad_mapzip(normalizer, grad, self.mean_square_gradient)
 
 
+def _copy_into(target, tensor):
+    """Copy a tensor into the target tensor."""
+    be.copy_tensor(tensor, out=target)
+
+
 class Optimizer(object):
     """Base class for the optimizer methods."""
     def __init__(self,
@@ -195,8 +200,8 @@ class Optimizer(object):
             None
 
         """
-        lr = be.float_scalar(next(self.stepsize) * self.grad_sign)
-        self.lr_ = partial(be.tmul_, lr)
+        self.lr = be.float_scalar(next(self.stepsize) * self.grad_sign)
+        self.lr_ = partial(be.tmul_, self.lr)
 
 
 class Gradient(Optimizer):
@@ -325,10 +330,27 @@ class Momentum(Optimizer):
             None
 
         """
-        self.memory.update(grad)
-        self.delta = deepcopy(self.memory.mean_gradient)
-        gu.grad_apply_(self.lr_, self.delta)
-        model.parameter_update(self.delta)
+        if self.memory.mean_gradient is None:
+            self.memory.update(grad)
+        model.fused_parameter_update(
+            partial(be.momentum_step_, self.lr, self.memory.mean_weight),
+            grad, self.memory.mean_gradient)
+
+    def check_convergence(self):
+        """
+        Check the convergence criterion.
+
+        Args:
+            None
+
+        Returns:
+            bool: True if converged, False if not
+
+        """
+        if self.memory.mean_gradient is None:
+            return False
+        mag = abs(self.lr) * gu.grad_magnitude(self.memory.mean_gradient)
+        return mag <= self.tolerance
 
 
 class RMSProp(Optimizer):
@@ -363,6 +385,8 @@ class RMSProp(Optimizer):
         super().__init__(stepsize, tolerance, ascent)
         self.memory = GradientMemory(mean_weight=0,
                                      mean_square_weight=mean_square_weight)
+        # a copy of the last gradient, for the convergence criterion
+        self.grad = None
 
     def reset(self):
         """
@@ -379,6 +403,7 @@ class RMSProp(Optimizer):
 
         """
         self.memory.reset()
+        self.grad = None
 
     def update(self, model, grad):
         """
@@ -396,10 +421,33 @@ class RMSProp(Optimizer):
             None
 
         """
-        self.memory.update(grad)
-        self.delta = self.memory.normalize(grad, True)
-        gu.grad_apply_(self.lr_, self.delta)
-        model.parameter_update(self.delta)
+        if self.memory.mean_square_gradient is None:
+            self.memory.update(grad)
+        model.fused_parameter_update(
+            partial(be.rmsprop_step_, self.lr, self.memory.mean_square_weight),
+            grad, self.memory.mean_square_gradient)
+        # copy, because the model may reuse the tensors of the gradient
+        if self.grad is None:
+            self.grad = gu.grad_apply(be.copy_tensor, grad)
+        else:
+            gu.grad_mapzip_(_copy_into, self.grad, grad)
+
+    def check_convergence(self):
+        """
+        Check the convergence criterion.
+
+        Args:
+            None
+
+        Returns:
+            bool: True if converged, False if not
+
+        """
+        if self.grad is None:
+            return False
+        delta = self.memory.normalize(self.grad, True)
+        mag = abs(self.lr) * gu.grad_magnitude(delta)
+        return mag <= self.tolerance
 
 
 class ADAM(Optimizer):
@@ -473,10 +521,29 @@ class ADAM(Optimizer):
             None
 
         """
-        self.memory.update(grad)
-        self.delta = self.memory.normalize(self.memory.mean_gradient, True)
-        gu.grad_apply_(self.lr_, self.delta)
-        model.parameter_update(self.delta)
+        if self.memory.mean_gradient is None:
+            self.memory.update(grad)
+        model.fused_parameter_update(
+            partial(be.adam_step_, self.lr, self.memory.mean_weight,
+                    self.memory.mean_square_weight),
+            grad, self.memory.mean_gradient, self.memory.mean_square_gradient)
+
+    def check_convergence(self):
+        """
+        Check the convergence criterion.
+
+        Args:
+            None
+
+        Returns:
+            bool: True if converged, False if not
+
+        """
+        if self.memory.mean_gradient is None:
+            return False
+        delta = self.memory.normalize(self.memory.mean_gradient, True)
+        mag = abs(self.lr) * gu.grad_magnitude(delta)
+        return mag <= self.tolerance
 
 
 # ----- ALIASES ----- #
@@ -111,3 +111,18 @@ def one_hot(data, category_list):
     on_units = be.int_tensor(list(map(category_list.index, be.flatten(data))))
     be.scatter_(units, on_units, 1.)
     return units
+
+def sparsify(tensor):
+    """
+    Convert a tensor to a sparse (CSR) tensor.
+    Useful as the transform of a batch object for high-dimensional,
+    mostly zero, data (e.g., counts or one-hot codes).
+
+    Args:
+        tensor
+
+    Returns:
+        sparse float tensor
+
+    """
+    return be.sparse_tensor(tensor)
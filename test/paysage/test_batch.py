@@ -0,0 +1,602 @@
+import os
+import tempfile
+import numpy
+import pandas
+
+from paysage import batch
+from paysage import backends as be
+from paysage import layers
+from paysage import preprocess as pre
+from paysage.models import model
+
+import pytest
+
+num_rows = 100
+num_cols = 8
+batch_size = 10
+
+def make_data():
+    return numpy.random.randint(0, 255, size=(num_rows, num_cols)).astype(numpy.uint8)
+
+def make_binary_data():
+    return numpy.random.randint(0, 2, size=(num_rows, num_cols)).astype(numpy.float32)
+
+def read_epoch(data, mode='train'):
+    batches = []
+    while True:
+        try:
+            # copy, because some batch objects reuse their output buffers
+            batches.append(be.copy_tensor(data.get(mode)))
+        except StopIteration:
+            break
+    return batches
+
+# ----- COMPACT STORAGE ----- #
+
+def test_compact_rows():
+    x = make_data()
+    assert batch.compact_rows(x) is x
+    compact = batch.compact_rows(be.float_tensor(x), 'uint8')
+    assert compact.dtype == numpy.uint8
+    assert be.allclose(batch.expand_rows(compact, 'uint8', num_cols),
+                       be.float_tensor(x))
+
+    b = make_binary_data()
+    packed = batch.compact_rows(b, 'bits')
+    assert packed.shape == (num_rows, 1)
+    assert be.allclose(batch.expand_rows(packed, 'bits', num_cols),
+                       be.float_tensor(b))
+
+# ----- HDF BATCH ----- #
+
+def test_block_shuffled_slice():
+    be.set_seed()
+    x = numpy.arange(95).reshape(95, 1)
+    read = lambda start, stop: x[start:stop]
+    batches = list(batch.block_shuffled_slice(read, 0, 90, 7, 3, 10))
+    assert [len(b) for b in batches] == 9 * [10]
+    rows = numpy.concatenate(batches).ravel()
+    assert (numpy.sort(rows) == numpy.arange(90)).all()
+    assert not (rows == numpy.arange(90)).all()
+
+def write_hdf(filename, x, layout):
+    if layout == 'array':
+        batch.write_hdf_array(filename, 'data', x, mode='w')
+    else:
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('data', pandas.DataFrame(x), format=layout)
+
+@pytest.mark.parametrize("layout", ['table', 'fixed', 'array'])
+def test_hdf_batch_direct(layout):
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        write_hdf(filename, x, layout)
+        data = batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9)
+        assert data.reader is not None
+        assert data.ncols == num_cols
+        assert data.num_training_batches() == 9
+        assert data.num_validation_samples() == 10
+
+        train = read_epoch(data, 'train')
+        assert len(train) == 9
+        assert be.allclose(be.vstack(train), be.float_tensor(x[:90]))
+        valid = read_epoch(data, 'validate')
+        assert be.allclose(be.vstack(valid), be.float_tensor(x[90:]))
+
+        # rows are selected by position, in any order
+        index = [77, 5, 2, 5]
+        assert be.allclose(data.get_by_index(index), be.float_tensor(x[index]))
+        data.close()
+
+@pytest.mark.parametrize("layout", ['table', 'fixed'])
+def test_hdf_batch_direct_labels(layout):
+    x = make_data()
+    labels = 1000 + 3 * numpy.arange(num_rows)[::-1]
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('data', pandas.DataFrame(x, index=labels), format=layout)
+        data = batch.HDFBatch(filename, 'data', batch_size)
+        assert data.reader is not None
+
+        # rows are selected by their index labels, as with pandas
+        index = [labels[77], labels[5], labels[2]]
+        assert be.allclose(data.get_by_index(index),
+                           be.float_tensor(x[[77, 5, 2]]))
+        with pytest.raises(KeyError):
+            data.get_by_index([7])
+
+        # each minibatch is a new tensor by default
+        assert not data.reuses_buffers
+        first = data.get('train')
+        second = data.get('train')
+        assert be.allclose(first, be.float_tensor(x[:batch_size]))
+        assert be.allclose(second, be.float_tensor(x[batch_size:2*batch_size]))
+        data.close()
+
+        # or it is served from a reused buffer
+        data = batch.HDFBatch(filename, 'data', batch_size, reuse_buffers=True)
+        assert data.reuses_buffers
+        first = data.get('train')
+        second = data.get('train')
+        assert numpy.shares_memory(be.to_numpy_array(first),
+                                   be.to_numpy_array(second))
+        assert be.allclose(second, be.float_tensor(x[batch_size:2*batch_size]))
+        data.close()
+
+def test_hdf_batch_bits():
+    x = make_binary_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        batch.write_hdf_array(filename, 'data', x, mode='w', storage='bits')
+        data = batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9)
+        assert data.ncols == num_cols
+        assert data.reader.dtype == numpy.uint8
+        train = read_epoch(data, 'train')
+        assert be.allclose(be.vstack(train), be.float_tensor(x[:90]))
+        index = [77, 5, 2]
+        assert be.allclose(data.get_by_index(index), be.float_tensor(x[index]))
+        data.close()
+
+def test_hdf_array_reader_mixed_dtypes():
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        df = pandas.DataFrame(x)
+        df[0] = df[0].astype(numpy.float64)
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('data', df, format='table')
+        with pytest.raises(ValueError):
+            batch.HDFArrayReader(filename, 'data')
+
+def test_hdf_batch_shuffle():
+    be.set_seed()
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('data', pandas.DataFrame(x), format='table')
+
+        # 60 rows fit in memory, so the buffer holds two 30 row blocks
+        allowed_mem = num_cols * x.itemsize * 60 / 1024**3
+        data = batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9,
+                              shuffle=True, allowed_mem=allowed_mem,
+                              blocks_per_buffer=2)
+        assert data.block_size == 30
+
+        epochs = []
+        for _ in range(2):
+            train = read_epoch(data, 'train')
+            assert len(train) == 9
+            epochs.append(be.vstack(train))
+
+        for epoch in epochs:
+            assert be.allclose(be.sort(be.tsum(epoch, axis=1)),
+                               be.sort(be.tsum(be.float_tensor(x[:90]), axis=1)))
+        assert not be.allclose(epochs[0], epochs[1])
+        data.close()
+
+@pytest.mark.parametrize("layout", ['table', 'array'])
+def test_hdf_batch_statistics(layout):
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        write_hdf(filename, x, layout)
+        data = batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9,
+                              transform=pre.binarize_color)
+        assert data.statistics() is None
+
+        # 20 rows per chunk, so there are several chunks
+        allowed_mem = num_cols * x.itemsize * 40 / 1024**3
+        stats = data.compute_statistics(allowed_mem=allowed_mem, num_workers=2)
+        binary = numpy.round(x[:90] / 255)
+        assert stats.num == 90
+        assert be.allclose(stats.mean, be.float_tensor(binary.mean(axis=0)))
+        assert be.allclose(stats.var, be.float_tensor(binary.var(axis=0, ddof=1)))
+        assert be.allclose(stats.min, be.float_tensor(binary.min(axis=0)))
+        assert be.allclose(stats.max, be.float_tensor(binary.max(axis=0)))
+        assert be.allclose(stats.nonzero, be.float_tensor((binary != 0).mean(axis=0)))
+
+        # the statistics are cached next to the data
+        assert os.path.exists(os.path.join(dirname, 'data_stats.json'))
+        assert be.allclose(data.statistics().mean, stats.mean)
+        data.close()
+
+        # the cache depends on the transform
+        raw = batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9)
+        assert raw.statistics() is None
+        raw.close()
+
+@pytest.mark.parametrize("layer", [layers.BernoulliLayer, layers.GaussianLayer])
+def test_initialize_from_statistics(layer):
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        write_hdf(filename, x, 'table')
+        data = batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9,
+                              transform=pre.binarize_color)
+
+        models = []
+        for _ in range(2):
+            be.set_seed()
+            models.append(model.Model([layer(num_cols), layers.BernoulliLayer(4)]))
+        models[0].initialize(data, method='hinton')
+        data.compute_statistics(num_workers=1)
+        # the cached statistics are used instead of a pass through the data
+        data.get = None
+        models[1].initialize(data, method='hinton')
+        data.close()
+
+        for p0, p1 in zip(models[0].layers[0].params, models[1].layers[0].params):
+            assert be.allclose(p0, p1)
+
+# ----- MEMMAP BATCH ----- #
+
+def test_memmap_batch_npy():
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.npy')
+        numpy.save(filename, x)
+        data = batch.MemmapBatch(filename, batch_size, train_fraction=0.9)
+        assert data.ncols == num_cols
+        assert data.num_training_batches() == 9
+        assert data.num_validation_samples() == 10
+
+        train = read_epoch(data, 'train')
+        assert len(train) == 9
+        assert be.allclose(be.vstack(train), be.float_tensor(x[:90]))
+
+        # the generator restarts after StopIteration
+        assert be.allclose(data.get('train'), be.float_tensor(x[:batch_size]))
+
+        valid = read_epoch(data, 'validate')
+        assert be.allclose(be.vstack(valid), be.float_tensor(x[90:]))
+
+        index = [5, 2, 77]
+        assert be.allclose(data.get_by_index(index), be.float_tensor(x[index]))
+        data.close()
+
+def test_memmap_batch_raw():
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.bin')
+        x.tofile(filename)
+        batch.write_memmap_header(filename, x.dtype, x.shape)
+        data = batch.MemmapBatch(filename, batch_size, train_fraction=0.9)
+        train = read_epoch(data, 'train')
+        assert be.allclose(be.vstack(train), be.float_tensor(x[:90]))
+        data.close()
+
+def test_memmap_batch_bits():
+    x = make_binary_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.bin')
+        batch.write_memmap(filename, x, storage='bits')
+        assert os.path.getsize(filename) == num_rows
+        data = batch.MemmapBatch(filename, batch_size, train_fraction=0.9)
+        assert data.ncols == num_cols
+        train = read_epoch(data, 'train')
+        assert be.allclose(be.vstack(train), be.float_tensor(x[:90]))
+        index = [5, 2, 77]
+        assert be.allclose(data.get_by_index(index), be.float_tensor(x[index]))
+        data.close()
+
+# ----- IN MEMORY BATCH ----- #
+
+def test_in_memory_batch_shuffle():
+    be.set_seed()
+    x = be.float_tensor(make_data())
+    data = batch.InMemoryBatch(x, batch_size, train_fraction=0.9, shuffle=True)
+
+    epochs = []
+    for _ in range(2):
+        train = read_epoch(data, 'train')
+        assert len(train) == 9
+        epochs.append(be.vstack(train))
+
+    # each epoch is a permutation of the training rows
+    for epoch in epochs:
+        assert be.allclose(be.sort(be.tsum(epoch, axis=1)),
+                           be.sort(be.tsum(x[:90], axis=1)))
+        assert not be.allclose(epoch, x[:90])
+    # and the epochs are shuffled differently
+    assert not be.allclose(epochs[0], epochs[1])
+
+    # the training minibatches are written to the same buffer
+    assert numpy.shares_memory(data.get('train'), data.buffer)
+
+    # the validation set is not shuffled
+    valid = read_epoch(data, 'validate')
+    assert be.allclose(be.vstack(valid), x[90:])
+
+@pytest.mark.parametrize("storage", ['uint8', 'bits'])
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_in_memory_batch_storage(storage, shuffle):
+    be.set_seed()
+    x = be.float_tensor(make_binary_data())
+    data = batch.InMemoryBatch(x, batch_size, train_fraction=0.9,
+                               shuffle=shuffle, storage=storage)
+    assert data.ncols == num_cols
+    assert data.tensor.dtype == numpy.uint8
+
+    train = be.vstack(read_epoch(data, 'train'))
+    assert be.shape(train) == (90, num_cols)
+    if shuffle:
+        assert be.allclose(be.sort(be.tsum(train, axis=1)),
+                           be.sort(be.tsum(x[:90], axis=1)))
+    else:
+        assert be.allclose(train, x[:90])
+
+    valid = read_epoch(data, 'validate')
+    assert be.allclose(be.vstack(valid), x[90:])
+    index = [5, 2, 77]
+    assert be.allclose(data.get_by_index(index), x[index])
+
+# ----- SHARDED BATCH ----- #
+
+def write_shards(dirname, x, shard_size, storage=None):
+    writer = batch.ShardWriter(dirname, shard_size, storage=storage)
+    # append in pieces that do not line up with the shards
+    for start in range(0, len(x), 7):
+        writer.append(x[start:start + 7])
+    writer.close()
+
+def test_shard_writer():
+    x = make_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        write_shards(dirname, x[:60], 25)
+        manifest = batch.read_manifest(dirname)
+        assert manifest["ncols"] == num_cols
+        assert [s["nrows"] for s in manifest["shards"]] == [25, 25, 10]
+
+        # appending adds shards without rewriting the old ones
+        write_shards(dirname, x[60:], 25)
+        manifest = batch.read_manifest(dirname)
+        assert [s["nrows"] for s in manifest["shards"]] == [25, 25, 10, 25, 15]
+        assert manifest["shards"][0]["dtype"] == x.dtype.str
+
+        stats = manifest["stats"]
+        assert numpy.allclose(stats["mean"], x.mean(axis=0))
+        assert numpy.allclose(stats["var"], x.astype(float).var(axis=0))
+        assert numpy.allclose(stats["min"], x.min(axis=0))
+        assert numpy.allclose(stats["max"], x.max(axis=0))
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_sharded_batch(shuffle):
+    be.set_seed()
+    x = make_binary_data()
+    with tempfile.TemporaryDirectory() as dirname:
+        write_shards(dirname, x, 20, storage='bits')
+        data = batch.ShardedBatch(dirname, batch_size, train_fraction=0.75,
+                                  shuffle=shuffle, num_threads=2)
+        assert data.ncols == num_cols
+        assert data.num_training_batches() == 7
+        assert data.num_validation_samples() == 25
+
+        train_rows = numpy.concatenate([x[i:i + 15] for i in range(0, 100, 20)])
+        train = be.vstack(read_epoch(data, 'train'))
+        assert be.shape(train) == (70, num_cols)
+        if not shuffle:
+            # the shards are interleaved
+            assert not be.allclose(train, be.float_tensor(train_rows[:70]))
+        valid = be.vstack(read_epoch(data, 'validate'))
+        assert be.shape(valid) == (25, num_cols)
+
+        # validation holds the ends of the shards
+        valid_rows = numpy.concatenate([x[i + 15:i + 20] for i in range(0, 100, 20)])
+        assert be.allclose(be.sort(be.tsum(valid, axis=1)),
+                           be.sort(be.tsum(be.float_tensor(valid_rows), axis=1)))
+
+        index = [5, 2, 77]
+        assert be.allclose(data.get_by_index(index), be.float_tensor(x[index]))
+        data.close()
+
+def test_sharded_batch_workers():
+    x = make_data()
+    x[:, 0] = numpy.arange(num_rows)
+    with tempfile.TemporaryDirectory() as dirname:
+        write_shards(dirname, x, 10)
+        seen = []
+        for worker_index in range(3):
+            data = batch.ShardedBatch(dirname, batch_size, train_fraction=1.0,
+                                      worker_index=worker_index, num_workers=3)
+            rows = be.vstack(read_epoch(data, 'train'))
+            seen.append(set(be.to_numpy_array(rows[:, 0]).astype(int)))
+            data.close()
+        # the workers read disjoint subsets of the shards, covering the data
+        assert [len(s) for s in seen] == [40, 30, 30]
+        assert set.union(*seen) == set(range(num_rows))
+
+@pytest.mark.parametrize("shuffle", [False, True])
+def test_in_memory_batch_sparse(shuffle):
+    be.set_seed()
+    x = make_binary_data()
+    data = batch.InMemoryBatch(be.sparse_tensor(x), batch_size,
+                               train_fraction=0.9, shuffle=shuffle)
+    train = read_epoch(data, 'train')
+    assert len(train) == 9
+    assert all(be.is_sparse(b) for b in train)
+    train = be.float_tensor(numpy.concatenate([be.dense(b) for b in train]))
+    assert be.allclose(be.sort(be.tsum(train, axis=1)),
+                       be.sort(be.tsum(be.float_tensor(x[:90]), axis=1)))
+    index = [5, 2, 77]
+    assert be.allclose(be.dense(data.get_by_index(index)), be.float_tensor(x[index]))
+
+# ----- PREFETCH BATCH ----- #
+
+def test_prefetch_batch():
+    x = be.float_tensor(make_data())
+    data = batch.PrefetchBatch(batch.InMemoryBatch(x, batch_size, train_fraction=0.9),
+                               num_prefetch=3)
+    assert data.num_training_batches() == 9
+
+    # two full epochs should see the data in order
+    for _ in range(2):
+        train = read_epoch(data, 'train')
+        assert len(train) == 9
+        assert be.allclose(be.vstack(train), x[:90])
+        assert data.starvation_time('train') >= 0
+
+    valid = read_epoch(data, 'validate')
+    assert be.allclose(be.vstack(valid), x[90:])
+
+    # resetting the generator in the middle of an epoch starts over
+    data.get('train')
+    data.get('train')
+    data.reset_generator('all')
+    assert be.allclose(data.get('train'), x[:batch_size])
+
+    # changing the transform drops the prefetched minibatches
+    data.transform = lambda t: 2 * t
+    assert be.allclose(data.get('train'), 2 * x[:batch_size])
+    data.close()
+
+def test_prefetch_batch_reused_buffers():
+    # distinct rows, to check that no minibatch is served twice
+    x = numpy.arange(num_rows * num_cols, dtype=numpy.float32).reshape(num_rows, num_cols)
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        write_hdf(filename, x, 'table')
+        sources = [batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9),
+                   batch.HDFBatch(filename, 'data', batch_size, train_fraction=0.9,
+                                  reuse_buffers=True),
+                   batch.InMemoryBatch(be.float_tensor(x), batch_size,
+                                       train_fraction=0.9, shuffle=True)]
+        for source in sources:
+            data = batch.PrefetchBatch(source, num_prefetch=4)
+            # keep the minibatches without copying them
+            train = []
+            while True:
+                try:
+                    train.append(data.get('train'))
+                except StopIteration:
+                    break
+            assert len(train) == 9
+            rows = be.to_numpy_array(be.vstack(train))
+            assert len(set(rows[:, 0])) == 90
+            assert (numpy.sort(rows[:, 0]) == x[:90, 0]).all()
+            assert not data.reuses_buffers
+            data.close()
+
+        # the minibatches are only copied if the source reuses its buffers
+        assert batch.InMemoryBatch(be.float_tensor(x), batch_size,
+                                   shuffle=True).reuses_buffers
+        data = batch.PrefetchBatch(batch.InMemoryBatch(be.float_tensor(x), batch_size))
+        assert not data.copy
+        data.close()
+
+# ----- DATA SHUFFLER ----- #
+
+def shuffle_file(filename, shuffled_filename, allowed_mem, num_workers):
+    shuffler = batch.DataShuffler(filename, shuffled_filename,
+                                  allowed_mem=allowed_mem, complevel=0,
+                                  num_workers=num_workers)
+    shuffler.shuffle()
+    with pandas.HDFStore(shuffled_filename, mode='r') as store:
+        return {k: store.select(k) for k in store.keys()}
+
+def test_data_shuffler():
+    x = numpy.arange(num_rows * num_cols).reshape(num_rows, num_cols)
+    y = x[:, :2]
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('x', pandas.DataFrame(x), format='table')
+            store.put('y', pandas.DataFrame(y), format='table')
+
+        # 40 rows of x fit in memory, so there are several buckets
+        allowed_mem = num_cols * x.itemsize * 40 / 1024**3
+        serial = shuffle_file(filename, os.path.join(dirname, 'serial.h5'),
+                              allowed_mem, 1)
+        parallel = shuffle_file(filename, os.path.join(dirname, 'parallel.h5'),
+                                allowed_mem, 2)
+        assert not os.path.exists(os.path.join(dirname, 'data_chunks'))
+
+        shuffled_x = serial['/x'].values
+        shuffled_y = serial['/y'].values
+        # the rows are permuted, and the tables are shuffled in sync
+        assert (numpy.sort(shuffled_x[:, 0]) == x[:, 0]).all()
+        assert not (shuffled_x == x).all()
+        assert (shuffled_x[:, :2] == shuffled_y).all()
+        assert (serial['/x'].index == numpy.arange(num_rows)).all()
+        # the shuffle only depends on the seed, not on the number of workers
+        assert (parallel['/x'].values == shuffled_x).all()
+
+        # the plain array layout holds the same rows
+        array_filename = os.path.join(dirname, 'array.h5')
+        batch.DataShuffler(filename, array_filename, allowed_mem=allowed_mem,
+                           num_workers=1, layout='array').shuffle()
+        reader = batch.HDFArrayReader(array_filename, 'x')
+        assert (reader.read(0, num_rows) == shuffled_x).all()
+        reader.close()
+
+
+def test_data_shuffler_stale_chunks():
+    x = numpy.arange(num_rows * num_cols).reshape(num_rows, num_cols)
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('x', pandas.DataFrame(x), format='table')
+        allowed_mem = num_cols * x.itemsize * 40 / 1024**3
+        clean = shuffle_file(filename, os.path.join(dirname, 'clean.h5'),
+                             allowed_mem, 1)
+
+        # buckets left over by an interrupted run do not leak into the output
+        chunk_dirname = os.path.join(dirname, 'data_chunks')
+        os.makedirs(chunk_dirname)
+        for j in range(4):
+            x[:3].tofile(os.path.join(chunk_dirname, 'bucket_{}.bin'.format(j)))
+        stale = shuffle_file(filename, os.path.join(dirname, 'stale.h5'),
+                             allowed_mem, 1)
+        assert (stale['/x'].values == clean['/x'].values).all()
+        assert not os.path.exists(chunk_dirname)
+
+
+def test_data_shuffler_mixed_dtypes():
+    df = pandas.DataFrame({'a': numpy.arange(num_rows, dtype=numpy.int64),
+                           'b': numpy.arange(num_rows, dtype=numpy.float32) / 2,
+                           'c': numpy.arange(num_rows, dtype=numpy.uint8)})
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('x', df, format='table')
+        allowed_mem = 16 * 40 / 1024**3
+        shuffled = shuffle_file(filename, os.path.join(dirname, 'shuffled.h5'),
+                                allowed_mem, 2)['/x']
+
+        # each column keeps its dtype, and the rows stay intact
+        assert list(shuffled.columns) == ['a', 'b', 'c']
+        assert list(shuffled.dtypes) == list(df.dtypes)
+        assert not (shuffled['a'].values == df['a'].values).all()
+        assert (numpy.sort(shuffled['a'].values) == df['a'].values).all()
+        assert (shuffled['b'].values == shuffled['a'].values / 2).all()
+        assert (shuffled['c'].values == shuffled['a'].values).all()
+
+        # the array layout needs a single dtype
+        with pytest.raises(ValueError):
+            batch.DataShuffler(filename, os.path.join(dirname, 'array.h5'),
+                               allowed_mem=allowed_mem, num_workers=1,
+                               layout='array').shuffle()
+
+
+def test_data_shuffler_num_workers():
+    x = numpy.arange(num_rows * num_cols).reshape(num_rows, num_cols)
+    with tempfile.TemporaryDirectory() as dirname:
+        filename = os.path.join(dirname, 'data.h5')
+        with pandas.HDFStore(filename, mode='w') as store:
+            store.put('x', pandas.DataFrame(x), format='table')
+        allowed_mem = num_cols * x.itemsize * 40 / 1024**3
+        # the number of workers is clipped to fit in allowed_mem
+        with pytest.warns(UserWarning):
+            shuffler = batch.DataShuffler(filename,
+                                          os.path.join(dirname, 'shuffled.h5'),
+                                          allowed_mem=allowed_mem,
+                                          num_workers=100)
+        assert 1 <= shuffler.num_workers < 100
+        shuffler.store.close()
+        shuffler.shuffled_store.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
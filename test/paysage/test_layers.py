@@ -62,6 +62,22 @@ def test_parameter_step():
     deltas = [layers.ParamsWeights(be.randn(ly.shape))]
     ly.parameter_step(deltas)
 
+def test_cache():
+    # the transpose follows in-place writes to the weights
+    ly = layers.Weights((num_vis, num_hid))
+    W_T = ly.W_T()
+    ly.params.matrix[:] = be.randn(ly.shape)
+    assert be.allclose(W_T, be.transpose(ly.W()))
+
+    ly = layers.GaussianLayer(num_vis)
+    vis = ly.random((num_samples, num_vis))
+    ly.rescale(vis)
+    ly.params.log_var[:] = be.randn((num_vis,))
+    ly.clear_cache()
+    assert be.allclose(ly.rescale(vis), vis / be.exp(ly.params.log_var))
+    ly.parameter_step([layers.ParamsGaussian(be.randn((num_vis,)), be.randn((num_vis,)))])
+    assert be.allclose(ly.rescale(vis), vis / be.exp(ly.params.log_var))
+
 def test_get_base_config():
     ly = layers.BernoulliLayer(num_vis)
     ly.add_constraint({'loc': constraints.non_negative})
@@ -198,12 +214,11 @@ def test_onehot_energy():
     vis = ly.random((num_samples, num_vis))
     ly.energy(vis)
 
-# TODO: implement log_partition_function for OneHot layer
-# def test_onehot_log_partition_function():
-#     ly = layers.OneHotLayer(num_vis)
-#     B = ly.random((num_samples, num_vis))
-#     A = ly.random((num_samples, num_vis))
-#     ly.log_partition_function(B, A)
+def test_onehot_log_partition_function():
+    ly = layers.OneHotLayer(num_vis)
+    B = ly.random((num_samples, num_vis))
+    A = ly.random((num_samples, num_vis))
+    ly.log_partition_function(B, A)
 
 def test_onehot_online_param_update():
     ly = layers.OneHotLayer(num_vis)
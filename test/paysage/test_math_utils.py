@@ -94,6 +94,28 @@ def test_mean_variance_2d():
     assert be.allclose(ref_mean, mv.mean)
     assert be.allclose(ref_var, mv.var, rtol=1e-3, atol=1e-5)
 
+def test_mean_variance_2d_combine():
+    # create some random data
+    num = 10000
+    dim2 = 10
+    num_steps = 10
+    stepsize = num // num_steps
+    s = be.rand((num,dim2))
+
+    # reference result
+    ref_mean = be.mean(s, axis=0)
+    ref_var = be.var(s, axis=0)
+
+    # do the calculation on separate chunks, then combine them
+    mv = math_utils.MeanVarianceArrayCalculator()
+    for i in range(num_steps):
+        chunk = math_utils.MeanVarianceArrayCalculator()
+        chunk.update(s[i*stepsize:(i+1)*stepsize])
+        mv.combine(chunk)
+
+    assert mv.num == num
+    assert be.allclose(ref_mean, mv.mean)
+    assert be.allclose(ref_var, mv.var, rtol=1e-3, atol=1e-5)
 
 
 if __name__ == "__main__":
@@ -211,6 +211,13 @@ def test_index_select():
     torch_select = torch_matrix.index_select(torch_mat, torch_inds, 1)
     assert_close(py_select, torch_select, "index_select: dim = 1")
 
+    # output buffer
+    py_out = py_matrix.zeros((len(py_inds), shape[1]))
+    torch_out = torch_matrix.zeros((len(py_inds), shape[1]))
+    py_matrix.index_select(py_mat, py_inds, 0, out=py_out)
+    torch_matrix.index_select(torch_mat, torch_inds, 0, out=torch_out)
+    assert_close(py_out, torch_out, "index_select: out")
+
 def test_sign():
 
     shape = (100,100)
@@ -514,6 +521,34 @@ def test_sqrt_div():
 
     assert_close(py_sqrt_div, torch_sqrt_div, "sqrt_div")
 
+def test_fused_steps():
+    shape = (300, 100)
+    lr = 0.01
+    mean_weight = 0.9
+    mean_square_weight = 0.99
+
+    py_rand.set_seed()
+    py_param = py_rand.randn(shape)
+    py_grad = py_rand.randn(shape)
+    py_mean = py_rand.randn(shape)
+    py_mean_square = py_rand.randn(shape) ** 2
+
+    steps = [
+        (py_matrix.momentum_step_, torch_matrix.momentum_step_,
+         (lr, mean_weight), [py_mean]),
+        (py_matrix.rmsprop_step_, torch_matrix.rmsprop_step_,
+         (lr, mean_square_weight), [py_mean_square]),
+        (py_matrix.adam_step_, torch_matrix.adam_step_,
+         (lr, mean_weight, mean_square_weight), [py_mean, py_mean_square])
+        ]
+    for py_step, torch_step, scalars, py_memory in steps:
+        py_tensors = [py_param.copy(), py_grad] + [m.copy() for m in py_memory]
+        torch_tensors = [torch_matrix.float_tensor(t) for t in py_tensors]
+        py_step(*scalars, *py_tensors)
+        torch_step(*scalars, *torch_tensors)
+        for py_t, torch_t in zip(py_tensors, torch_tensors):
+            assert_close(py_t, torch_t, py_step.__name__)
+
 def test_normalize():
     shape = (100,)
 
@@ -2239,6 +2274,21 @@ def test_softmax():
     torch_y = torch_func.softmax(torch_x)
     assert_close(py_y, torch_y, "softmax")
 
+def test_logsumexp():
+    shape = (100, 100)
+
+    py_rand.set_seed()
+    py_x = py_rand.randn(shape)
+    torch_x = torch_matrix.float_tensor(py_x)
+
+    for axis in [0, 1]:
+        py_y = py_func.logsumexp(py_x, axis=axis)
+        torch_y = torch_func.logsumexp(torch_x, axis=axis)
+        assert_close(py_y, torch_y, "logsumexp")
+
+    assert allclose(py_func.logsumexp(py_x), torch_func.logsumexp(torch_x)), \
+    "python != torch, logsumexp"
+
 def test_reciprocal():
     shape = (100, 100)
 
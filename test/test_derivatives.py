@@ -1,5 +1,8 @@
 from paysage import backends as be
 from paysage import layers
+from paysage import penalties
+from paysage import optimizers
+from paysage import constraints
 from paysage.models import model
 from paysage.models import model_utils as mu
 from paysage.models import gradient_util as gu
@@ -494,5 +497,287 @@ def test_gaussian_derivatives():
     assert be.allclose(d_W, weight_derivs[0].matrix), \
     "derivative of weights wrong in gaussian-gaussian rbm"
 
+@pytest.mark.parametrize("visible", [layers.BernoulliLayer, layers.GaussianLayer])
+@pytest.mark.parametrize("hidden", [layers.BernoulliLayer, layers.GaussianLayer])
+def test_sparse_visible_gradient(visible, hidden):
+    num_visible_units = 100
+    num_hidden_units = 50
+    batch_size = 25
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # set up some layer and model objects
+    vis_layer = visible(num_visible_units)
+    hid_layer = hidden(num_hidden_units)
+    rbm = model.Model([vis_layer, hid_layer])
+    rbm.weights[0].params.matrix[:] = \
+        0.1 * be.randn(rbm.weights[0].shape)
+
+    # mostly zero visible units
+    vdata = be.float_tensor(be.rand((batch_size, num_visible_units)) < 0.05)
+    model_state = mu.State.from_model(batch_size, rbm)
+
+    grads = []
+    for vis in [vdata, be.sparse_tensor(vdata)]:
+        data_state = mu.State.from_visible(vis, rbm)
+        rbm.graph.set_clamped_sampling([0])
+        data_state = rbm.mean_field_iteration(1, data_state)
+        rbm.graph.set_clamped_sampling([])
+        # copy, because the model reuses the tensors of the weight gradients
+        grads.append(gu.grad_apply(be.copy_tensor, rbm.gradient(data_state, model_state)))
+
+    # the sparse visible units give the same gradient as the dense ones
+    for dense_params, sparse_params in zip(grads[0].layers + grads[0].weights,
+                                           grads[1].layers + grads[1].weights):
+        for d, s in zip(dense_params[0], sparse_params[0]):
+            assert be.allclose(d, s, rtol=1e-4, atol=1e-5)
+
+def test_fused_weight_gradient():
+    num_visible_units = 100
+    num_hidden_units = 50
+    batch_size = 25
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    for layer_type in [layers.BernoulliLayer, layers.GaussianLayer]:
+        # set up some layer and model objects
+        rbm = model.Model([layer_type(num_visible_units),
+                           layers.BernoulliLayer(num_hidden_units)])
+        rbm.weights[0].params.matrix[:] = \
+            0.1 * be.randn(rbm.weights[0].shape)
+        rbm.weights[0].add_penalty({'matrix': penalties.l2_penalty(0.1)})
+
+        # the phases have different batch sizes
+        data_state = mu.State.from_model(batch_size, rbm)
+        model_state = mu.State.from_model(2 * batch_size, rbm)
+
+        grad = rbm.gradient(data_state, model_state)
+        expected = gu.grad_mapzip(be.subtract,
+                                  rbm.phase_derivatives(model_state, penalize=False),
+                                  rbm.phase_derivatives(data_state, penalize=True))
+        for params, expected_params in zip(grad.layers + grad.weights,
+                                           expected.layers + expected.weights):
+            for g, e in zip(params[0], expected_params[0]):
+                assert be.allclose(g, e, rtol=1e-4, atol=1e-6)
+
+        # the weight gradient is written into the same tensor at every call
+        buffer = grad.weights[0][0].matrix
+        grad = rbm.gradient(model_state, data_state)
+        assert grad.weights[0][0].matrix is buffer
+
+def test_arena():
+    num_visible_units = 20
+    num_hidden_units = 10
+    batch_size = 25
+    num_steps = 5
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    for layer_type in [layers.BernoulliLayer, layers.GaussianLayer]:
+        rbm = model.Model([layer_type(num_visible_units),
+                           layers.BernoulliLayer(num_hidden_units)])
+        rbm.weights[0].params.matrix[:] = \
+            0.1 * be.randn(rbm.weights[0].shape)
+        rbm.layers[1].set_fixed_params(['loc'])
+        flat_rbm = deepcopy(rbm)
+        flat_rbm.use_arena()
+
+        # the params are views into the arena
+        assert be.shape(flat_rbm.arena) == (flat_rbm.arena_layout.size,)
+        flat_rbm.arena[:] = 0
+        assert be.tsum(be.tabs(flat_rbm.weights[0].params.matrix)) == 0
+        flat_rbm.arena_layout.pack([obj.params for obj in rbm.layers + rbm.weights],
+                                   flat_rbm.arena)
+
+        # the fixed loc of the hidden layer splits the trainable parameters
+        segments = flat_rbm._arena_trainable_segments()
+        assert segments == [(0, flat_rbm.arena_layout.segment(1, 0)[0]),
+                            flat_rbm.arena_layout.segment(2, 0)]
+
+        for opt_type in [optimizers.Gradient, optimizers.ADAM, optimizers.Momentum]:
+            opt = opt_type()
+            flat_opt = opt_type()
+            for _ in range(num_steps):
+                opt.update_lr()
+                flat_opt.update_lr()
+                data_state = mu.State.from_model(batch_size, rbm)
+                model_state = mu.State.from_model(batch_size, rbm)
+                opt.update(rbm, rbm.gradient(data_state, model_state))
+                grad = flat_rbm.gradient(data_state, model_state)
+                assert isinstance(grad, gu.FlatGradient)
+                flat_opt.update(flat_rbm, grad)
+
+            for obj, flat_obj in zip(rbm.layers + rbm.weights,
+                                     flat_rbm.layers + flat_rbm.weights):
+                for p, flat_p in zip(obj.params, flat_obj.params):
+                    assert be.allclose(p, flat_p, rtol=1e-4, atol=1e-6)
+
+        # copies of the model have their own arena
+        copy_rbm = deepcopy(flat_rbm)
+        copy_rbm.arena[:] = 0
+        assert be.tsum(be.tabs(copy_rbm.weights[0].params.matrix)) == 0
+        assert be.tsum(be.tabs(flat_rbm.weights[0].params.matrix)) > 0
+
+
+def test_fused_optimizers():
+    num_visible_units = 20
+    num_hidden_units = 10
+    batch_size = 25
+    num_steps = 5
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    def reference_delta(opt, grad):
+        # the update of the optimizers computed with the gradient memory
+        opt.memory.update(grad)
+        if isinstance(opt, optimizers.Momentum):
+            delta = deepcopy(opt.memory.mean_gradient)
+        elif isinstance(opt, optimizers.RMSProp):
+            delta = opt.memory.normalize(grad, True)
+        else:
+            delta = opt.memory.normalize(opt.memory.mean_gradient, True)
+        gu.grad_apply_(opt.lr_, delta)
+        return delta
+
+    for opt_type in [optimizers.ADAM, optimizers.RMSProp, optimizers.Momentum]:
+        for arena in [False, True]:
+            rbm = model.Model([layers.GaussianLayer(num_visible_units),
+                               layers.BernoulliLayer(num_hidden_units)])
+            rbm.weights[0].params.matrix[:] = \
+                0.1 * be.randn(rbm.weights[0].shape)
+            rbm.weights[0].add_constraint({'matrix': constraints.non_negative})
+            reference_rbm = deepcopy(rbm)
+            if arena:
+                rbm.use_arena()
+
+            opt = opt_type()
+            reference_opt = opt_type()
+            for _ in range(num_steps):
+                opt.update_lr()
+                reference_opt.update_lr()
+                data_state = mu.State.from_model(batch_size, rbm)
+                model_state = mu.State.from_model(batch_size, rbm)
+                grad = reference_rbm.gradient(data_state, model_state)
+                delta = reference_delta(reference_opt, grad)
+                reference_rbm.parameter_update(delta)
+                opt.update(rbm, rbm.gradient(data_state, model_state))
+
+            assert be.tmin(rbm.weights[0].params.matrix) >= 0
+            # the cached quantities follow the updates
+            assert be.allclose(rbm.weights[0].W_T(), be.transpose(rbm.weights[0].W()))
+            assert be.allclose(rbm.layers[0].rescale(data_state.units[0]),
+                               reference_rbm.layers[0].rescale(data_state.units[0]),
+                               rtol=1e-4, atol=1e-6)
+            for obj, reference_obj in zip(rbm.layers + rbm.weights,
+                                          reference_rbm.layers + reference_rbm.weights):
+                for p, reference_p in zip(obj.params, reference_obj.params):
+                    assert be.allclose(p, reference_p, rtol=1e-4, atol=1e-6)
+            assert opt.check_convergence() == \
+                (gu.grad_magnitude(delta) <= reference_opt.tolerance)
+
+
+def test_convergence_before_update():
+    rbm = model.Model([layers.GaussianLayer(20), layers.BernoulliLayer(10)])
+    for opt_type in [optimizers.ADAM, optimizers.RMSProp, optimizers.Momentum]:
+        opt = opt_type()
+        # not converged before the first update, or after a reset
+        assert not opt.check_convergence()
+        opt.update_lr()
+        opt.update(rbm, rbm.gradient(mu.State.from_model(5, rbm),
+                                     mu.State.from_model(5, rbm)))
+        opt.reset()
+        assert not opt.check_convergence()
+
+
+def test_rmsprop_convergence():
+    num_visible_units = 20
+    num_hidden_units = 10
+    batch_size = 25
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    for arena in [False, True]:
+        rbm = model.Model([layers.GaussianLayer(num_visible_units),
+                           layers.BernoulliLayer(num_hidden_units)])
+        if arena:
+            rbm.use_arena()
+        opt = optimizers.RMSProp()
+        # not converged before the first update
+        assert not opt.check_convergence()
+
+        opt.update_lr()
+        grad = rbm.gradient(mu.State.from_model(batch_size, rbm),
+                            mu.State.from_model(batch_size, rbm))
+        expected = gu.grad_apply(be.copy_tensor, grad)
+        opt.update(rbm, grad)
+        mag = abs(opt.lr) * gu.grad_magnitude(opt.memory.normalize(expected, True))
+
+        # the optimizer keeps its own copy of the gradient
+        rbm.gradient(mu.State.from_model(batch_size, rbm),
+                     mu.State.from_model(batch_size, rbm))
+        opt.tolerance = 1.01 * mag
+        assert opt.check_convergence()
+        opt.tolerance = 0.99 * mag
+        assert not opt.check_convergence()
+
+
+def test_sampler_fields():
+    num_visible_units = 30
+    num_hidden_units = 20
+    batch_size = 25
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # only layers that accept the field argument record the field
+    assert not layers.Layer.uses_connected_field
+    assert layers.GaussianLayer.uses_connected_field
+    assert not layers.BernoulliLayer.uses_connected_field
+    assert not layers.OneHotLayer.uses_connected_field
+
+    for hidden_type in [layers.GaussianLayer, layers.BernoulliLayer]:
+        rbm = model.Model([layers.GaussianLayer(num_visible_units),
+                           hidden_type(num_hidden_units)])
+        rbm.weights[0].params.matrix[:] = \
+            0.1 * be.randn(rbm.weights[0].shape)
+        for layer in rbm.layers:
+            if isinstance(layer, layers.GaussianLayer):
+                layer.params.log_var[:] = 0.1 * be.randn((layer.len,))
+
+        # update the hidden units, like the samplers do for the gradient
+        rbm.graph.set_clamped_sampling([0])
+        data_state = rbm.mean_field_iteration(1, mu.State.from_model(batch_size, rbm))
+        model_state = rbm.markov_chain(1, mu.State.from_model(batch_size, rbm))
+        rbm.graph.set_clamped_sampling([])
+        assert data_state.fields[0] is None
+        assert (data_state.fields[1] is not None) == (hidden_type == layers.GaussianLayer)
+
+        # the stored fields give the same derivatives
+        for state in [data_state, model_state]:
+            fields = rbm.phase_derivatives(state)
+            copy = mu.State([u for u in state.units])
+            no_fields = rbm.phase_derivatives(copy)
+            for params, expected_params in zip(fields.layers, no_fields.layers):
+                for g, e in zip(params[0], expected_params[0]):
+                    assert be.allclose(g, e, rtol=1e-4, atol=1e-6)
+
+        # the fields are invalid after the parameters or the units change
+        if hidden_type == layers.GaussianLayer:
+            assert data_state.get_field(1, rbm.parameter_version,
+                                        [data_state.units[0]]) is not None
+            rbm.parameter_update(rbm.gradient(data_state, model_state))
+            assert data_state.get_field(1, rbm.parameter_version,
+                                        [data_state.units[0]]) is None
+            rbm.markov_chain_(1, model_state)
+            assert model_state.get_field(1, rbm.parameter_version,
+                                         [model_state.units[0]]) is None
+
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
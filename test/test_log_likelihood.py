@@ -0,0 +1,205 @@
+from paysage import backends as be
+from paysage import layers
+from paysage.models import model
+from paysage import batch
+from paysage import metrics
+from paysage import fit
+
+import itertools
+import numpy as np
+import pytest
+
+# ----- Helpers ----- #
+
+def random_rbm(vis_layer, hid_layer, scale=0.5):
+    rbm = model.Model([vis_layer, hid_layer])
+    shape = (vis_layer.len, hid_layer.len)
+    rbm.weights[0].params.matrix[:] = scale * be.randn(shape)
+    rbm.layers[0].params.loc[:] = 0.5 * be.randn((vis_layer.len,))
+    rbm.layers[1].params.loc[:] = 0.5 * be.randn((hid_layer.len,))
+    return rbm
+
+def binary_states(num_units):
+    return np.array(list(itertools.product([0, 1], repeat=num_units)), dtype=np.float64)
+
+def onehot_states(num_units):
+    return np.eye(num_units, dtype=np.float64)
+
+def logsumexp(x):
+    xmax = np.max(x)
+    return xmax + np.log(np.sum(np.exp(x - xmax)))
+
+def brute_force_log_Z(rbm, hidden_states):
+    """
+    Sum over the visible units analytically and enumerate the hidden units.
+
+    """
+    W = be.to_numpy_array(rbm.weights[0].W()).astype(np.float64)
+    a = be.to_numpy_array(rbm.layers[0].params.loc).astype(np.float64)
+    b = be.to_numpy_array(rbm.layers[1].params.loc).astype(np.float64)
+    field = hidden_states.dot(W.T)
+    if isinstance(rbm.layers[0], layers.GaussianLayer):
+        var = np.exp(be.to_numpy_array(rbm.layers[0].params.log_var).astype(np.float64))
+        phi = field / var
+        log_Z_vis = np.sum(0.5 * np.log(2 * np.pi * var) + a * phi + var * phi**2 / 2, axis=1)
+    else:
+        log_Z_vis = np.sum(np.logaddexp(0, a + field), axis=1)
+    return logsumexp(hidden_states.dot(b) + log_Z_vis)
+
+# ----- Tests ----- #
+
+def test_marginal_free_energy():
+    num_visible_units = 8
+    num_hidden_units = 5
+    num_samples = 20
+
+    be.set_seed()
+
+    rbm = random_rbm(layers.BernoulliLayer(num_visible_units),
+                     layers.BernoulliLayer(num_hidden_units))
+    vis = rbm.layers[0].random((num_samples, num_visible_units))
+
+    # brute force sum over the hidden units
+    W = be.to_numpy_array(rbm.weights[0].W()).astype(np.float64)
+    a = be.to_numpy_array(rbm.layers[0].params.loc).astype(np.float64)
+    b = be.to_numpy_array(rbm.layers[1].params.loc).astype(np.float64)
+    v = be.to_numpy_array(vis).astype(np.float64)
+    hid = binary_states(num_hidden_units)
+    energies = -v.dot(a)[:, None] - hid.dot(b)[None, :] - v.dot(W).dot(hid.T)
+    expected = np.array([-logsumexp(-e) for e in energies])
+
+    free_energy = be.to_numpy_array(rbm.marginal_free_energy(vis))
+    assert np.allclose(free_energy, expected, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        model.Model([layers.BernoulliLayer(3) for _ in range(3)]).marginal_free_energy(vis)
+
+def test_marginal_free_energy_hidden_types():
+    num_visible_units = 8
+    num_hidden_units = 5
+    num_samples = 30
+
+    be.set_seed()
+
+    for vis_type in [layers.BernoulliLayer, layers.GaussianLayer]:
+        for hid_type in [layers.BernoulliLayer, layers.GaussianLayer, layers.OneHotLayer]:
+            rbm = random_rbm(vis_type(num_visible_units), hid_type(num_hidden_units))
+            if vis_type == layers.GaussianLayer:
+                rbm.layers[0].params.log_var[:] = 0.2 * be.randn((num_visible_units,))
+            if hid_type == layers.GaussianLayer:
+                rbm.layers[1].params.log_var[:] = 0.2 * be.randn((num_hidden_units,))
+            vis = rbm.layers[0].random((num_samples, num_visible_units))
+
+            # closed forms computed with numpy
+            W = be.to_numpy_array(rbm.weights[0].W()).astype(np.float64)
+            a = be.to_numpy_array(rbm.layers[0].params.loc).astype(np.float64)
+            b = be.to_numpy_array(rbm.layers[1].params.loc).astype(np.float64)
+            v = be.to_numpy_array(vis).astype(np.float64)
+            if vis_type == layers.GaussianLayer:
+                var_v = np.exp(be.to_numpy_array(rbm.layers[0].params.log_var).astype(np.float64))
+                energy = np.sum((v - a)**2 / (2 * var_v), axis=1)
+                field = (v / var_v).dot(W)
+            else:
+                energy = -v.dot(a)
+                field = v.dot(W)
+            if hid_type == layers.BernoulliLayer:
+                log_Z = np.sum(np.logaddexp(0, b + field), axis=1)
+            elif hid_type == layers.OneHotLayer:
+                log_Z = np.array([logsumexp(row) for row in b + field])
+            else:
+                var_h = np.exp(be.to_numpy_array(rbm.layers[1].params.log_var).astype(np.float64))
+                phi = field / var_h
+                log_Z = np.sum(0.5 * np.log(2 * np.pi * var_h) + b * phi + var_h * phi**2 / 2,
+                               axis=1)
+            expected = energy - log_Z
+
+            free_energy = be.to_numpy_array(rbm.marginal_free_energy(vis))
+            assert np.allclose(free_energy, expected, rtol=1e-4, atol=1e-3), \
+            "wrong free energy for {} and {}".format(vis_type, hid_type)
+
+            # streaming over chunks gives the same result
+            chunked = be.to_numpy_array(rbm.marginal_free_energy(vis, chunk_size=7))
+            assert np.allclose(chunked, free_energy)
+
+
+def test_annealed_importance_sampling():
+    num_visible_units = 10
+    num_hidden_units = 6
+    num_particles = 200
+    num_betas = 500
+    tolerance = 0.1
+
+    be.set_seed()
+
+    hidden_types = [(layers.BernoulliLayer, binary_states),
+                    (layers.OneHotLayer, onehot_states)]
+    for vis_type in [layers.BernoulliLayer, layers.GaussianLayer]:
+        for hid_type, hidden_states in hidden_types:
+            rbm = random_rbm(vis_type(num_visible_units), hid_type(num_hidden_units))
+            log_Z, log_weights = rbm.annealed_importance_sampling(num_particles, num_betas)
+            assert be.shape(log_weights) == (num_particles,)
+            exact = brute_force_log_Z(rbm, hidden_states(num_hidden_units))
+            assert abs(log_Z - exact) < tolerance, \
+            "AIS estimate of log Z is inaccurate for {} and {}".format(vis_type, hid_type)
+
+def test_LogLikelihood():
+    num_visible_units = 10
+    num_hidden_units = 6
+    num_samples = 100
+
+    be.set_seed()
+
+    rbm = random_rbm(layers.BernoulliLayer(num_visible_units),
+                     layers.BernoulliLayer(num_hidden_units))
+    data = batch.InMemoryBatch(rbm.layers[0].random((num_samples, num_visible_units)),
+                               10, train_fraction=0.5, shuffle=False)
+
+    metric = metrics.LogLikelihood(num_particles=100, num_betas=200)
+    monitor = fit.ProgressMonitor(data, metrics=[metric, 'ReconstructionError'])
+    metdict = monitor.check_progress(rbm)
+
+    # compare to the exact log-likelihood of the validation set
+    log_Z = brute_force_log_Z(rbm, binary_states(num_hidden_units))
+    vdata = be.to_numpy_array(data.get_by_index(range(50, 100)))
+    exact = -np.mean(be.to_numpy_array(rbm.marginal_free_energy(vdata))) - log_Z
+    assert abs(metdict['LogLikelihood'] - exact) < 0.1
+    assert metdict['LogLikelihood'] < 0
+
+
+def test_exact_log_partition_function():
+    num_visible_units = 10
+    num_hidden_units = 7
+    num_samples = 20
+
+    be.set_seed()
+
+    hidden_types = [(layers.BernoulliLayer, binary_states),
+                    (layers.OneHotLayer, onehot_states)]
+    for vis_type in [layers.BernoulliLayer, layers.GaussianLayer]:
+        for hid_type, hidden_states in hidden_types:
+            rbm = random_rbm(vis_type(num_visible_units), hid_type(num_hidden_units))
+            expected = brute_force_log_Z(rbm, hidden_states(num_hidden_units))
+            # one block, and several blocks computed by a pool of threads
+            for block_size, num_workers in [(4096, 1), (5, 3)]:
+                log_Z = rbm.exact_log_partition_function(block_size, num_workers)
+                assert abs(log_Z - expected) < 1e-4
+
+            vis = rbm.layers[0].random((num_samples, num_visible_units))
+            log_Z, log_likelihood = rbm.exact_log_likelihood(vis)
+            assert be.allclose(log_likelihood,
+                               -rbm.marginal_free_energy(vis) - expected, atol=1e-4)
+
+    with pytest.raises(ValueError):
+        rbm = random_rbm(layers.BernoulliLayer(num_visible_units),
+                         layers.GaussianLayer(num_hidden_units))
+        rbm.exact_log_partition_function()
+
+    # the probabilities of all of the visible configurations sum to one
+    rbm = random_rbm(layers.BernoulliLayer(num_visible_units),
+                     layers.BernoulliLayer(num_hidden_units))
+    _, log_likelihood = rbm.exact_log_likelihood(be.float_tensor(binary_states(num_visible_units)))
+    assert abs(logsumexp(be.to_numpy_array(log_likelihood))) < 1e-4
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
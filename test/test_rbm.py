@@ -10,6 +10,7 @@ from paysage import optimizers
 from paysage import schedules
 
 import pytest
+import threading
 
 def test_rbm(paysage_path=None):
 
@@ -79,5 +80,58 @@ def test_rbm(paysage_path=None):
     # close the HDF5 store
     data.close()
 
+def test_concurrent_pcd():
+    num_visible_units = 30
+    num_hidden_units = 10
+    batch_size = 20
+    num_epochs = 2
+
+    def train(concurrent):
+        # set a seed for the random number generator
+        be.set_seed()
+        data = batch.InMemoryBatch(
+            be.float_tensor(be.rand((200, num_visible_units)) > 0.5),
+            batch_size, train_fraction=0.9)
+        rbm = model.Model([layers.BernoulliLayer(num_visible_units),
+                           layers.BernoulliLayer(num_hidden_units)])
+        rbm.initialize(data)
+        # mean field updates make both phases deterministic,
+        # so the two execution modes must agree exactly
+        sampler = fit.SequentialMC.from_batch(rbm, data,
+                                              updater='mean_field_iteration')
+        opt = optimizers.ADAM()
+        trainer = fit.SGD(rbm, data, opt, num_epochs, sampler, method=fit.pcd,
+                          mcsteps=2, concurrent=concurrent)
+        trainer.train()
+        return rbm
+
+    sequential = train(False)
+    concurrent = train(True)
+    assert be.allclose(sequential.weights[0].params.matrix,
+                       concurrent.weights[0].params.matrix)
+    for i in range(2):
+        assert be.allclose(sequential.layers[i].params.loc,
+                           concurrent.layers[i].params.loc)
+
+    with pytest.raises(ValueError):
+        fit.SGD(sequential, None, None, 1, None, method=fit.cd, concurrent=True)
+
+def test_clamping_per_thread():
+    rbm = model.Model([layers.BernoulliLayer(5), layers.BernoulliLayer(3)])
+    rbm.graph.set_clamped_sampling([0])
+
+    seen = []
+    def worker():
+        seen.append(rbm.graph.clamped_sampling)
+        rbm.graph.set_clamped_sampling([1])
+        seen.append(rbm.graph.clamped_sampling)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+
+    assert seen == [[], [1]]
+    assert rbm.graph.clamped_sampling == [0]
+
 if __name__ == "__main__":
     pytest.main([__file__])
@@ -1,11 +1,16 @@
+import numpy
+
 from paysage import backends as be
 from paysage import layers
 from paysage.models import model
 from paysage import math_utils as mu
-from paysage.models.model_utils import State
+from paysage.models.model_utils import State, SamplingBuffers
 from paysage import fit
+from paysage import batch
+from paysage import optimizers
 
 import pytest
+import tracemalloc
 
 def test_independent():
     """
@@ -443,5 +448,441 @@ def test_state_for_grad_DrivenSequentialMC():
         "hidden layer of grad_state should be conditional mean: {}".format(u)
 
 
+def test_independent_ParallelTempering():
+    """
+    Test that the chains at beta = 1 of a parallel tempering sampler
+    sample from an rbm with independent layers.
+
+    Note:
+        This test compares values estimated by *sampling* to values computed
+        analytically. It can fail for small batch_size, or strict tolerances,
+        even if everything is working propery.
+
+    """
+    num_visible_units = 20
+    num_hidden_units = 10
+    batch_size = 1000
+    steps = 50
+    mean_tol = 0.1
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # set up some layer and model objects
+    vis_layer = layers.BernoulliLayer(num_visible_units)
+    hid_layer = layers.BernoulliLayer(num_hidden_units)
+    rbm = model.Model([vis_layer, hid_layer])
+
+    # randomly set the intrinsic model parameters
+    a = be.randn((num_visible_units,))
+    b = be.randn((num_hidden_units,))
+    W = be.zeros((num_visible_units, num_hidden_units))
+
+    rbm.layers[0].params.loc[:] = a
+    rbm.layers[1].params.loc[:] = b
+    rbm.weights[0].params.matrix[:] = W
+
+    # run the sampler
+    sampler = fit.ParallelTempering(rbm, num_temperatures=4, min_beta=0.1)
+    sampler.set_state(State.from_model(batch_size, rbm))
+    sampler.update_state(steps)
+
+    assert be.shape(sampler.state.units[0]) == (batch_size, num_visible_units)
+    assert be.shape(sampler.stacked_state.units[0]) == \
+        (4 * batch_size, num_visible_units)
+
+    # the ends of the ladder are fixed and the ladder stays ordered
+    assert be.allclose(be.float_tensor(sampler.betas[[0, -1]]),
+                       be.float_tensor([1.0, 0.1]))
+    assert all(sampler.betas[:-1] > sampler.betas[1:])
+    assert all((sampler.acceptance >= 0) & (sampler.acceptance <= 1))
+
+    # compare the sample mean of the cold chains with the model mean
+    dropout = State.dropout_rescale(rbm)
+    state_for_moments = State.from_model(1, rbm)
+    for i in range(rbm.num_layers):
+        sample_mean = be.mean(sampler.state.units[i], axis=0)
+        model_mean = rbm.layers[i].conditional_mean(
+                rbm._connected_rescaled_units(i, state_for_moments, dropout),
+                rbm._connected_weights(i))
+        assert be.allclose(sample_mean, be.flatten(model_mean),
+                           rtol=mean_tol, atol=mean_tol), \
+        "sample mean of layer {} does not match the model mean".format(i)
+
+def test_swap_ParallelTempering():
+    num_visible_units = 50
+    num_hidden_units = 20
+    batch_size = 30
+    num_temperatures = 5
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # set up some layer and model objects
+    vis_layer = layers.BernoulliLayer(num_visible_units)
+    hid_layer = layers.BernoulliLayer(num_hidden_units)
+    rbm = model.Model([vis_layer, hid_layer])
+    rbm.weights[0].params.matrix[:] = \
+        be.randn((num_visible_units, num_hidden_units))
+
+    sampler = fit.ParallelTempering(rbm, num_temperatures=num_temperatures)
+    sampler.set_state(State.from_model(batch_size, rbm))
+    sampler.update_state(1)
+
+    # a swap only exchanges particles between temperatures
+    before = [be.to_numpy_array(u) for u in sampler.stacked_state.units]
+    for _ in range(2):
+        sampler._swap()
+    after = [be.to_numpy_array(u) for u in sampler.stacked_state.units]
+    for b, a in zip(before, after):
+        b = b.reshape(num_temperatures, batch_size, -1)
+        a = a.reshape(num_temperatures, batch_size, -1)
+        for n in range(batch_size):
+            assert sorted(map(tuple, b[:, n])) == sorted(map(tuple, a[:, n])), \
+            "swaps should only permute the particles of chain {}".format(n)
+
+    # the adaptation of the ladder decays
+    sampler.acceptance = numpy.linspace(0.1, 0.9, num_temperatures - 1)
+    changes = []
+    for _ in range(2):
+        log_betas = numpy.log(sampler.betas)
+        sampler._adapt_ladder()
+        changes.append(numpy.abs(numpy.log(sampler.betas) - log_betas).max())
+    assert 0 < changes[1] < changes[0]
+
+    # the cold chains are the first block of the stacked chains
+    sampler._set_cold_state()
+    assert be.allclose(sampler.state.units[0],
+                       sampler.stacked_state.units[0][:batch_size])
+
+    # reset and reinitialize the sampler
+    data = rbm.layers[0].random((100, num_visible_units))
+    sampler.reset()
+    assert sampler.state is None and sampler.stacked_state is None
+    batch_state = State.from_visible(data[:batch_size], rbm)
+    sampler.set_state(batch_state)
+    grad_state = sampler.state_for_grad(1, None)
+    assert be.shape(grad_state.units[1]) == (batch_size, num_hidden_units)
+
+
+def test_inplace_deterministic_updates():
+    num_visible_units = 30
+    num_hidden_units = 10
+    batch_size = 25
+    steps = 3
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    for layer_type in [layers.BernoulliLayer, layers.GaussianLayer,
+                       layers.OneHotLayer]:
+        # set up some layer and model objects
+        vis_layer = layers.BernoulliLayer(num_visible_units)
+        hid_layer = layer_type(num_hidden_units)
+        rbm = model.Model([vis_layer, hid_layer])
+        rbm.weights[0].params.matrix[:] = \
+            be.randn((num_visible_units, num_hidden_units))
+
+        state = State.from_model(batch_size, rbm)
+        beta = be.rand((batch_size, 1))
+
+        for u in ['mean_field_iteration', 'deterministic_iteration']:
+            expected = getattr(rbm, u)(steps, state, beta=beta)
+
+            inplace_state = State.from_state(state)
+            units = list(inplace_state.units)
+            getattr(rbm, u + '_')(steps, inplace_state, beta=beta)
+
+            for i in range(rbm.num_layers):
+                assert inplace_state.units[i] is units[i], \
+                "{}_ should write into the state tensors".format(u)
+                assert be.allclose(expected.units[i], inplace_state.units[i]), \
+                "{}_ does not match {}: {}".format(u, u, layer_type)
+
+def test_inplace_markov_chain():
+    """
+    Test in-place sampling from an rbm with two layers connected by a weight
+    matrix that contains all zeros, so that the layers are independent.
+    Once the buffers exist, sampling should not allocate any state-sized
+    tensors.
+
+    Note:
+        This test compares values estimated by *sampling* to values computed
+        analytically. It can fail for small batch_size, or strict tolerances,
+        even if everything is working propery.
+
+    """
+    num_visible_units = 20
+    num_hidden_units = 10
+    batch_size = 1000
+    steps = 10
+    mean_tol = 0.1
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    for layer_type in [layers.BernoulliLayer, layers.GaussianLayer]:
+        # set up some layer and model objects
+        vis_layer = layer_type(num_visible_units)
+        hid_layer = layer_type(num_hidden_units)
+        rbm = model.Model([vis_layer, hid_layer])
+
+        rbm.layers[0].params.loc[:] = be.rand((num_visible_units,))
+        rbm.layers[1].params.loc[:] = be.rand((num_hidden_units,))
+
+        state = State.from_model(batch_size, rbm)
+        buffers = SamplingBuffers.from_model(batch_size, rbm)
+        units = list(state.units)
+
+        rbm.markov_chain_(1, state, buffers=buffers)
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        rbm.markov_chain_(steps, state, buffers=buffers)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        smallest = 4 * batch_size * num_hidden_units
+        assert peak - start < smallest, \
+        "in-place sampling allocated {} bytes".format(peak - start)
+        assert all(state.units[i] is units[i] for i in range(rbm.num_layers))
+
+        # compare the sample mean with the model mean
+        state_for_moments = State.from_model(1, rbm)
+        for i in range(rbm.num_layers):
+            sample_mean = be.mean(state.units[i], axis=0)
+            model_mean = rbm.layers[i].conditional_mean(
+                    rbm._connected_rescaled_units(i, state_for_moments),
+                    rbm._connected_weights(i))
+            assert be.allclose(sample_mean, be.flatten(model_mean),
+                               rtol=mean_tol, atol=mean_tol), \
+            "sample mean of layer {} does not match the model mean".format(i)
+
+
+def test_fields_SequentialMC():
+    """
+    Test that the derivatives reuse the fields computed by the sampler
+    for Gaussian layers, with the default (in-place) updater.
+
+    """
+    num_visible_units = 30
+    num_hidden_units = 20
+    batch_size = 25
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    rbm = model.Model([layers.GaussianLayer(num_visible_units),
+                       layers.GaussianLayer(num_hidden_units)])
+    rbm.weights[0].params.matrix[:] = \
+        0.1 * be.randn((num_visible_units, num_hidden_units))
+
+    sampler = fit.SequentialMC(rbm)
+    sampler.set_state(State.from_model(batch_size, rbm))
+    sampler.update_state(2)
+
+    # the visible layer is sampled last, so its field is valid
+    state = sampler.state
+    connected = [[state.units[c.layer] for c in rbm.graph.layer_connections[i]]
+                 for i in range(rbm.num_layers)]
+    field = state.get_field(0, rbm.parameter_version, connected[0])
+    assert field is not None
+    assert field is sampler.buffers.fields.units[0]
+    assert state.get_field(1, rbm.parameter_version, connected[1]) is None
+    assert be.allclose(field, be.dot(rbm.layers[1].rescale(state.units[1]),
+                                     rbm.weights[0].W_T()), rtol=1e-4, atol=1e-5)
+
+    # the hidden layer is updated for the gradient, so its field is valid
+    grad_state = sampler.state_for_grad(1)
+    assert grad_state.get_field(
+        1, rbm.parameter_version, [grad_state.units[0]]) is not None
+
+    # the stored fields give the same derivatives
+    copy = State([u for u in state.units])
+    for params, expected_params in zip(rbm.phase_derivatives(state).layers,
+                                       rbm.phase_derivatives(copy).layers):
+        for g, e in zip(params[0], expected_params[0]):
+            assert be.allclose(g, e, rtol=1e-4, atol=1e-6)
+
+    # the fields are reused in the next updates
+    sampler.update_state(1)
+    assert sampler.state.get_field(0, rbm.parameter_version, connected[0]) is field
+
+
+def test_sampling_plan():
+    # set up a deep boltzmann machine with three layers
+    vis_layer = layers.BernoulliLayer(10)
+    hid_1 = layers.BernoulliLayer(6)
+    hid_2 = layers.BernoulliLayer(4)
+    dbm = model.Model([vis_layer, hid_1, hid_2])
+
+    assert dbm.graph.get_sampling_order() == (1, 0, 2)
+    plan = dbm._sampling_plan('conditional_mean')
+    assert [step.layer for step in plan] == [1, 0, 2]
+    assert dbm._sampling_plan('conditional_mean') is plan, \
+    "plans should be reused for the same clamping"
+
+    # the middle layer sees both neighbors through W and W_T
+    middle = plan[0]
+    assert middle.update == dbm.layers[1].conditional_mean
+    assert middle.connected_layers == (0, 2)
+    assert be.shape(middle.connected_weights[0]()) == (10, 6)
+    assert be.shape(middle.connected_weights[1]()) == (4, 6)
+
+    # clamping changes the plan
+    dbm.graph.set_clamped_sampling([0])
+    assert dbm.graph.get_sampling_order() == (1, 2)
+    assert [step.layer for step in dbm._sampling_plan('conditional_mean')] == [1, 2]
+    dbm.graph.set_clamped_sampling([])
+    assert dbm._sampling_plan('conditional_mean') is plan
+
+
+def test_particle_pool():
+    num_visible_units = 20
+    num_hidden_units = 10
+    num_samples = 100
+    batch_size = 10
+    num_particles = 250
+    num_updated = 40
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # set up some layer and model objects
+    vis_layer = layers.BernoulliLayer(num_visible_units)
+    hid_layer = layers.BernoulliLayer(num_hidden_units)
+    rbm = model.Model([vis_layer, hid_layer])
+    rbm.weights[0].params.matrix[:] = \
+        be.randn((num_visible_units, num_hidden_units))
+
+    data = batch.InMemoryBatch(vis_layer.random((num_samples, num_visible_units)),
+                               batch_size, train_fraction=0.8, shuffle=False)
+
+    for sampler_type in [fit.SequentialMC, fit.DrivenSequentialMC]:
+        sampler = sampler_type.from_batch(rbm, data, updater='mean_field_iteration',
+                                          num_particles=num_particles,
+                                          num_updated=num_updated)
+
+        # the pool cycles through the training data
+        assert be.shape(sampler.state.units[0]) == (num_particles, num_visible_units)
+        assert be.allclose(sampler.state.units[0][:80], data.get_by_index(range(80)))
+        assert be.allclose(sampler.state.units[0][80:160], data.get_by_index(range(80)))
+
+        # only a subset of the particles is updated
+        before = [be.copy_tensor(u) for u in sampler.state.units]
+        sampler.update_state(1)
+        changed = be.to_numpy_array(be.tany(be.not_equal(before[1], sampler.state.units[1]), axis=1))
+        assert 0 < changed.sum() <= num_updated
+
+        # the gradient is averaged over the whole pool
+        grad_state = sampler.state_for_grad(1)
+        assert be.shape(grad_state.units[1]) == (num_particles, num_hidden_units)
+
+    # train with a pool that is larger than the minibatch
+    sampler = fit.DrivenSequentialMC.from_batch(rbm, data, num_particles=num_particles,
+                                                num_updated=num_updated)
+    trainer = fit.SGD(rbm, data, optimizers.ADAM(), 1, sampler, method=fit.pcd)
+    trainer.train()
+    assert be.shape(sampler.beta) == (num_particles, 1)
+
+
+def test_ShardedSampler():
+    num_visible_units = 20
+    num_hidden_units = 10
+    num_samples = 100
+    batch_size = 10
+    num_workers = 3
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # set up some layer and model objects
+    vis_layer = layers.BernoulliLayer(num_visible_units)
+    hid_layer = layers.GaussianLayer(num_hidden_units)
+    rbm = model.Model([vis_layer, hid_layer])
+    rbm.weights[0].params.matrix[:] = \
+        be.randn((num_visible_units, num_hidden_units))
+
+    data = batch.InMemoryBatch(vis_layer.random((num_samples, num_visible_units)),
+                               batch_size, train_fraction=0.8, shuffle=False)
+
+    sampler = fit.ShardedSampler.from_batch(rbm, data, num_workers=num_workers,
+                                            updater='mean_field_iteration',
+                                            num_particles=50)
+    try:
+        assert sampler.shard_sizes == [17, 17, 16]
+
+        # deterministic updates match the single process sampler
+        reference = fit.SequentialMC(rbm, updater='mean_field_iteration')
+        reference.set_state(sampler.gather_state())
+        assert be.allclose(reference.state.units[0], data.get_by_index(range(50)))
+        sampler.update_state(2)
+        reference.update_state(2)
+        assert be.allclose(sampler.gather_state().units[1], reference.state.units[1])
+
+        # the derivatives averaged over the shards are the derivatives of the pool
+        grad = sampler.state_for_grad(1)
+        expected = rbm.phase_derivatives(reference.state_for_grad(1), penalize=False)
+        for g, e in zip(grad.layers + grad.weights, expected.layers + expected.weights):
+            for g_params, e_params in zip(g, e):
+                for g_tensor, e_tensor in zip(g_params, e_params):
+                    assert be.allclose(g_tensor, e_tensor, rtol=1e-4, atol=1e-6)
+
+        # the workers see the parameter updates after each optimizer update
+        rbm.weights[0].params.matrix[:] = 0
+        sampler.update_state(1)
+        reference.update_state(1)
+        assert be.allclose(sampler.gather_state().units[1], reference.state.units[1])
+
+        # train with the shards as the negative phase
+        trainer = fit.SGD(rbm, data, optimizers.ADAM(), 1, sampler, method=fit.pcd)
+        trainer.train()
+    finally:
+        sampler.close()
+    assert sampler.workers == []
+
+
+def test_mean_field_solve():
+    num_units = [20, 10, 5]
+    batch_size = 50
+    tolerance = 1e-6
+
+    # set a seed for the random number generator
+    be.set_seed()
+
+    # set up a deep boltzmann machine
+    dbm = model.Model([layers.BernoulliLayer(n) for n in num_units])
+    for w in dbm.weights:
+        w.params.matrix[:] = 0.5 * be.randn(be.shape(w.params.matrix))
+    dbm.graph.set_clamped_sampling([0])
+    state = State.from_model(batch_size, dbm)
+
+    # the reference runs many more sweeps than needed
+    reference = dbm.mean_field_iteration(500, state)
+
+    for damping in [0, 0.5]:
+        solution, iterations = dbm.mean_field_solve(state, tolerance=tolerance,
+                                                    damping=damping, max_iters=500)
+        assert be.allclose(solution.units[0], state.units[0]), \
+        "clamped units should not change"
+        for i in [1, 2]:
+            assert be.allclose(solution.units[i], reference.units[i], atol=1e-4)
+        assert be.shape(iterations) == (batch_size,)
+        assert 1 <= iterations.min() and iterations.max() < 500
+        assert iterations.min() < iterations.max(), \
+        "the samples should converge after different numbers of sweeps"
+
+    # the sampler uses the solver when it has a tolerance
+    sampler = fit.SequentialMC(dbm, clamped=[0], updater='mean_field_iteration',
+                               tolerance=tolerance, max_iters=500)
+    sampler.set_state(state)
+    sampler.update_state(1)
+    assert be.allclose(sampler.state.units[2], reference.units[2], atol=1e-4)
+    assert be.shape(sampler.iterations) == (batch_size,)
+    dbm.graph.set_clamped_sampling([])
+
+    with pytest.raises(ValueError):
+        fit.SequentialMC(dbm, tolerance=tolerance)
+
+
 if __name__ == "__main__":
     pytest.main([__file__])